@@ -1,6 +1,7 @@
 import logging
 from langgraph.constants import END
 from utils.graph_utils import SimpleGraphBuilder
+from utils.deadline_utils import DeadlineExceeded
 from utils.llm_util import CustomLLM, generate_token, AIMessageParser
 from typing import TypedDict, List, Dict, Any
 
@@ -43,6 +44,8 @@ class ImageTableAgent:
 
             state["raw_output"] = content
             state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             state["json_output"] = {}
             # state["error"] = f"模型调用失败: {str(e)}"
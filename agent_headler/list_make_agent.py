@@ -1,7 +1,8 @@
 import logging
 from langgraph.constants import END
 from utils.graph_utils import SimpleGraphBuilder
-from utils.llm_util import CustomLLM, generate_token, AIMessageParser
+from utils.deadline_utils import DeadlineExceeded
+from utils.llm_util import CustomLLM, generate_token, AIMessageParser, StreamingJsonListParser
 from utils.knowledge import PARTIAL_DICT
 from typing import TypedDict, List, Dict, Any
 
@@ -29,17 +30,23 @@ class ListMakeAgent:
         super().__init__()
 
 
+    def build_prompt(self, state: ListMakeState):
+        """构建大模型输入, context不在清单项目中时返回None"""
+        context = state['context']
+        if context not in self.partial_dict:
+            print(f"context: {context} not in partial_dict, return\n")
+            return None
+
+        context_content = self.partial_dict[context]
+        return f"{self.prompt}\n项目信息要求: {context_content}\n清单格式: {{'项目名称': '', '项目特征': ''}}。\n输入: {state['text']}\n输出:\n"
+
     def call_llm_node(self, state: ListMakeState):
         """调用大模型并获取原始输出"""
         try:
-            context = state['context']
-            if context not in self.partial_dict:
-                print(f"context: {context} not in partial_dict, return\n")
+            prompt = self.build_prompt(state)
+            if prompt is None:
                 return
 
-            context_content = self.partial_dict[context]
-            prompt = f"{self.prompt}\n项目信息要求: {context_content}\n清单格式: {{'项目名称': '', '项目特征': ''}}。\n输入: {state['text']}\n输出:\n"
-
             print(f"prompt: {prompt}\n")
             raw_response = self.model.invoke(f"{prompt}")
             print(f"raw_response {raw_response}\n")
@@ -52,6 +59,34 @@ class ListMakeAgent:
 
             state["raw_output"] = content
             state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            state["json_output"] = {}
+            # state["error"] = f"模型调用失败: {str(e)}"
+        return state
+
+    async def acall_llm_node(self, state: ListMakeState):
+        """异步调用大模型并获取原始输出"""
+        try:
+            prompt = self.build_prompt(state)
+            if prompt is None:
+                return
+
+            print(f"prompt: {prompt}\n")
+            raw_response = await self.model.ainvoke(f"{prompt}")
+            print(f"raw_response {raw_response}\n")
+
+            content_key = "content"
+            if hasattr(raw_response, content_key):
+                content = getattr(raw_response, content_key)
+            else:
+                content = raw_response
+
+            state["raw_output"] = content
+            state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             state["json_output"] = {}
             # state["error"] = f"模型调用失败: {str(e)}"
@@ -62,6 +97,41 @@ class ListMakeAgent:
         print(f"llm_res {llm_res}\n")
         return llm_res
 
+    async def arun(self, request):
+        llm_res = await self.acall_llm_node(request)
+        print(f"llm_res {llm_res}\n")
+        return llm_res
+
+    def stream(self, request):
+        """流式调用大模型: 逐段产出token事件, 列表中每个对象完整时产出item事件, 最后产出result事件"""
+        state = request
+        prompt = self.build_prompt(state)
+        if prompt is None:
+            yield {"event": "result", "data": None}
+            return
+
+        parser = StreamingJsonListParser()
+        content = ""
+        try:
+            print(f"prompt: {prompt}\n")
+            for chunk in self.model.stream(f"{prompt}"):
+                delta = chunk.content if hasattr(chunk, "content") else chunk
+                if not delta:
+                    continue
+                content += delta
+                yield {"event": "token", "data": delta}
+                for item in parser.feed(delta):
+                    yield {"event": "item", "data": item}
+
+            state["raw_output"] = content
+            state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            state["json_output"] = {}
+            # state["error"] = f"模型调用失败: {str(e)}"
+        yield {"event": "result", "data": state}
+
 
 
 if __name__ == '__main__':
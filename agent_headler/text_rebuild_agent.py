@@ -1,7 +1,8 @@
 import logging
 from langgraph.constants import END
 from utils.graph_utils import SimpleGraphBuilder
-from utils.llm_util import CustomLLM, generate_token, AIMessageParser
+from utils.deadline_utils import DeadlineExceeded
+from utils.llm_util import CustomLLM, generate_token, AIMessageParser, StreamingJsonListParser
 from typing import TypedDict, List, Dict, Any
 
 logger = logging.getLogger()
@@ -29,10 +30,14 @@ class TextRebuildAgent:
 
         super().__init__()
 
+    def build_prompt(self, state: TextRebuildState):
+        """构建大模型输入"""
+        return f"{self.prompt}\n{state['input_text']}\n输出: "
+
     def call_llm_node(self, state: TextRebuildState):
         """调用大模型并获取原始输出"""
         try:
-            prompt = f"{self.prompt}\n{state['input_text']}\n输出: "
+            prompt = self.build_prompt(state)
             print(f"prompt: {prompt}\n")
             raw_response = self.model.invoke(f"{prompt}")
             print(f"raw_response {raw_response}\n")
@@ -45,6 +50,31 @@ class TextRebuildAgent:
 
             state["raw_output"] = content
             state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            state["json_output"] = {}
+            # state["error"] = f"模型调用失败: {str(e)}"
+        return state
+
+    async def acall_llm_node(self, state: TextRebuildState):
+        """异步调用大模型并获取原始输出"""
+        try:
+            prompt = self.build_prompt(state)
+            print(f"prompt: {prompt}\n")
+            raw_response = await self.model.ainvoke(f"{prompt}")
+            print(f"raw_response {raw_response}\n")
+
+            content_key = "content"
+            if hasattr(raw_response, content_key):
+                content = getattr(raw_response, content_key)
+            else:
+                content = raw_response
+
+            state["raw_output"] = content
+            state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             state["json_output"] = {}
             # state["error"] = f"模型调用失败: {str(e)}"
@@ -55,6 +85,37 @@ class TextRebuildAgent:
         print(f"llm_res {llm_res}\n")
         return llm_res
 
+    async def arun(self, request):
+        llm_res = await self.acall_llm_node(request)
+        print(f"llm_res {llm_res}\n")
+        return llm_res
+
+    def stream(self, request):
+        """流式调用大模型: 逐段产出token事件, 列表中每个对象完整时产出item事件, 最后产出result事件"""
+        state = request
+        prompt = self.build_prompt(state)
+        parser = StreamingJsonListParser()
+        content = ""
+        try:
+            print(f"prompt: {prompt}\n")
+            for chunk in self.model.stream(f"{prompt}"):
+                delta = chunk.content if hasattr(chunk, "content") else chunk
+                if not delta:
+                    continue
+                content += delta
+                yield {"event": "token", "data": delta}
+                for item in parser.feed(delta):
+                    yield {"event": "item", "data": item}
+
+            state["raw_output"] = content
+            state["json_output"] = {"ai_message": content}
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            state["json_output"] = {}
+            # state["error"] = f"模型调用失败: {str(e)}"
+        yield {"event": "result", "data": state}
+
 
 if __name__ == '__main__':
     llm = CustomLLM(
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+CheckCADTool.exe 的替身, 参数与真实工具一致:
+
+    fake_check_cad_tool.py -p <dwg_file_path> -o <svg_file_folder> -t <is_svg> -c <is_colorful>
+
+行为由环境变量控制:
+    FAKE_CAD_LATENCY_MS    平均耗时, 默认200
+    FAKE_CAD_JITTER_MS     耗时均匀抖动的半宽, 默认50
+    FAKE_CAD_FAILURE_RATE  以非0返回码退出的比例, 默认0
+    FAKE_CAD_SVG_COUNT     输出的svg文件数, 默认3
+    FAKE_CAD_SVG_BYTES     每个svg文件的大小, 默认20000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CheckCADTool替身")
+    parser.add_argument("-p", dest="dwg_file_path", required=True)
+    parser.add_argument("-o", dest="svg_file_folder", required=True)
+    parser.add_argument("-t", dest="is_svg", default="1")
+    parser.add_argument("-c", dest="is_colorful", default="1")
+    args = parser.parse_args(argv)
+
+    latency_ms = float(os.environ.get("FAKE_CAD_LATENCY_MS", 200))
+    jitter_ms = float(os.environ.get("FAKE_CAD_JITTER_MS", 50))
+    failure_rate = float(os.environ.get("FAKE_CAD_FAILURE_RATE", 0))
+    svg_count = int(os.environ.get("FAKE_CAD_SVG_COUNT", 3))
+    svg_bytes = int(os.environ.get("FAKE_CAD_SVG_BYTES", 20000))
+
+    time.sleep(max(0, random.uniform(latency_ms - jitter_ms, latency_ms + jitter_ms)) / 1000)
+
+    if not os.path.exists(args.dwg_file_path):
+        print(f"dwg file not found: {args.dwg_file_path}")
+        return 2
+    if random.random() < failure_rate:
+        print("fake decode failure")
+        return 1
+
+    os.makedirs(args.svg_file_folder, exist_ok=True)
+    body = "<path d='M0 0 L10 10'/>" * (svg_bytes // 24)
+    for i in range(svg_count):
+        with open(os.path.join(args.svg_file_folder, f"layout_{i}.svg"), "w", encoding="utf-8") as f:
+            f.write(f"<svg xmlns='http://www.w3.org/2000/svg'>{body}</svg>")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
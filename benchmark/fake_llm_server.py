@@ -0,0 +1,140 @@
+"""
+本地OpenAI兼容的chat completions替身服务, 用于压测时代替真实大模型
+
+    python benchmark/fake_llm_server.py --port 18000 --latency_ms 800 --latency_dist lognormal --failure_rate 0.01
+
+支持非流式和 stream=true 的SSE流式响应, 延迟和失败按给定分布随机产生
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from flask import Flask, request, Response
+from werkzeug.serving import make_server
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class LatencyModel(object):
+    """延迟分布: fixed / uniform / exponential / lognormal, 单位毫秒"""
+
+    def __init__(self, latency_ms=500, dist="fixed", jitter_ms=0, sigma=0.5):
+        self.latency_ms = latency_ms
+        self.dist = dist
+        self.jitter_ms = jitter_ms
+        self.sigma = sigma
+
+    def sample(self):
+        if self.dist == "uniform":
+            value = random.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)
+        elif self.dist == "exponential":
+            value = random.expovariate(1 / self.latency_ms) if self.latency_ms > 0 else 0
+        elif self.dist == "lognormal":
+            # 中位数为latency_ms, sigma控制长尾
+            value = random.lognormvariate(0, self.sigma) * self.latency_ms
+        else:
+            value = self.latency_ms
+        return max(value, 0) / 1000
+
+
+class FakeLLM(object):
+
+    def __init__(self, latency, failure_rate=0.0, failure_status=500, hang_rate=0.0, hang_s=600,
+                 output_items=20, stream_chunks=20):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.output_items = output_items
+        self.stream_chunks = stream_chunks
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0, "hangs": 0, "streams": 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def content(self):
+        items = [{"序号": i, "项目名称": "现浇混凝土梁", "项目特征": "混凝土强度等级C30", "单位": "m³"}
+                 for i in range(self.output_items)]
+        return json.dumps(items, ensure_ascii=False)
+
+    def chat(self):
+        self._count("requests")
+        payload = request.get_json(silent=True) or {}
+        roll = random.random()
+        if roll < self.hang_rate:
+            # 模拟上游无响应, 用于验证调用方的超时
+            self._count("hangs")
+            time.sleep(self.hang_s)
+        elif roll < self.hang_rate + self.failure_rate:
+            self._count("failures")
+            time.sleep(self.latency.sample())
+            return json.dumps({"error": {"message": "fake upstream failure"}}), self.failure_status
+
+        if payload.get("stream"):
+            self._count("streams")
+            return Response(self._stream(self.latency.sample()), mimetype="text/event-stream")
+
+        time.sleep(self.latency.sample())
+        return json.dumps({
+            "id": f"fake-{time.time()}",
+            "object": "chat.completion",
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.content()},
+                         "finish_reason": "stop"}],
+        }, ensure_ascii=False), 200, {"Content-Type": "application/json"}
+
+    def _stream(self, total_s):
+        content = self.content()
+        size = max(1, len(content) // self.stream_chunks)
+        for i in range(0, len(content), size):
+            time.sleep(total_s / self.stream_chunks)
+            chunk = {"choices": [{"index": 0, "delta": {"content": content[i:i + size]}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+def build_app(fake):
+    app = Flask(__name__)
+    app.add_url_rule("/v1/chat/completions", view_func=fake.chat, methods=["POST"])
+    # CustomLLM.warmup 会HEAD请求api_url
+    app.add_url_rule("/v1/chat/completions", endpoint="warmup", view_func=lambda: ("", 200), methods=["GET", "HEAD"])
+    app.add_url_rule("/stats", view_func=lambda: json.dumps(fake.stats), methods=["GET"])
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI兼容的大模型替身服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency_ms", type=float, default=500)
+    parser.add_argument("--latency_dist", type=str, default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--jitter_ms", type=float, default=100, help="uniform分布的半宽")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal分布的sigma")
+    parser.add_argument("--failure_rate", type=float, default=0.0)
+    parser.add_argument("--failure_status", type=int, default=500)
+    parser.add_argument("--hang_rate", type=float, default=0.0, help="不返回响应的请求比例")
+    parser.add_argument("--output_items", type=int, default=20, help="每次输出的JSON列表长度")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    latency = LatencyModel(args.latency_ms, args.latency_dist, args.jitter_ms, args.sigma)
+    fake = FakeLLM(latency, failure_rate=args.failure_rate, failure_status=args.failure_status,
+                   hang_rate=args.hang_rate, output_items=args.output_items)
+    server = make_server(args.host, args.port, build_app(fake), threaded=True)
+    logger.info(f"fake llm server listening on {args.host}:{args.port}")
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+并发压测服务接口, 按接口输出请求数、错误数、吞吐和p50/p95/p99延迟
+
+    python benchmark/load_test.py --url http://127.0.0.1:9001 --concurrency 32 --duration 60 \
+        --endpoints text_rebuild,partial_match,dwg_decode --svg_dir /tmp/svgData --output result.json
+
+指定 --baseline 时与之前保存的结果对比, p95变慢或吞吐下降超过 --max_regression 时以返回码1退出
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+AGENT_ENDPOINTS = ["text_rebuild", "partial_match", "list_make", "sequence_match"]
+ALL_ENDPOINTS = AGENT_ENDPOINTS + ["dwg_decode", "upload", "health"]
+
+SAMPLE_TEXT = "KL1(2) 300x600 C30 梁顶标高-0.050 ∅8@100/200(2) 4∅20;4∅22 "
+
+
+def percentile(values, p):
+    """最近秩百分位, values需已排序"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class LoadTest(object):
+
+    def __init__(self, url, endpoints, concurrency=16, duration=30, requests_per_endpoint=None,
+                 text_size=2000, svg_dir=None, timeout=120, response_mode=None):
+        self.url = url.rstrip("/")
+        self.endpoints = endpoints
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests_per_endpoint = requests_per_endpoint
+        self.text_size = text_size
+        self.svg_dir = svg_dir
+        self.timeout = timeout
+        self.response_mode = response_mode
+        self.records = {endpoint: [] for endpoint in endpoints}
+        self.errors = {endpoint: {} for endpoint in endpoints}
+        self.sent = {endpoint: 0 for endpoint in endpoints}
+        self.lock = threading.Lock()
+        self.dwg_file_path = None
+
+    def _text(self):
+        return (SAMPLE_TEXT * (self.text_size // len(SAMPLE_TEXT) + 1))[:self.text_size]
+
+    def setup(self):
+        """dwg_decode需要服务端已有的DWG文件, 先上传一个"""
+        if "dwg_decode" not in self.endpoints:
+            return
+        assert self.svg_dir, "dwg_decode needs --svg_dir (server side svg folder)"
+        result = self._upload(requests)
+        self.dwg_file_path = result["data"]["download_url"]
+        logger.info(f"uploaded dwg for decode benchmark: {self.dwg_file_path}")
+
+    def _upload(self, session):
+        rsp = session.post(f"{self.url}/upload", data=b"AC1027" + os.urandom(4096), timeout=self.timeout,
+                           headers={"X-File-Name": "bench.dwg"})
+        rsp.raise_for_status()
+        return rsp.json()
+
+    def _payload(self, endpoint):
+        if endpoint == "list_make":
+            payload = {"text": self._text(), "context": "单独土石方_挖单独土方"}
+        elif endpoint == "dwg_decode":
+            payload = {"dwg_params": {"dwg_file_path": self.dwg_file_path,
+                                      "svg_file_folder": os.path.join(self.svg_dir, uuid.uuid4().hex)}}
+        else:
+            # 加随机后缀避免被服务端合并(coalesce)成一次调用
+            payload = {"input_text": f"{self._text()} #{uuid.uuid4().hex}"}
+        if self.response_mode:
+            payload["response_mode"] = self.response_mode
+        return payload
+
+    def _call(self, session, endpoint):
+        if endpoint == "upload":
+            self._upload(session)
+            return
+        if endpoint == "health":
+            session.get(f"{self.url}/health", timeout=self.timeout).raise_for_status()
+            return
+        data = json.dumps(self._payload(endpoint), ensure_ascii=False).encode("utf-8")
+        rsp = session.get(f"{self.url}/{endpoint}", data=data, timeout=self.timeout,
+                          headers={"X-Request-Timeout": str(self.timeout)})
+        if rsp.status_code != 200:
+            raise RuntimeError(f"status {rsp.status_code}")
+        status = rsp.json().get("task_status")
+        if status != "finished":
+            raise RuntimeError(f"task {status}")
+
+    def _next_endpoint(self, deadline):
+        with self.lock:
+            candidates = [e for e in self.endpoints
+                          if self.requests_per_endpoint is None or self.sent[e] < self.requests_per_endpoint]
+            if not candidates or (self.requests_per_endpoint is None and time.time() >= deadline):
+                return None
+            endpoint = random.choice(candidates)
+            self.sent[endpoint] += 1
+            return endpoint
+
+    def _worker(self, deadline):
+        session = requests.Session()
+        while True:
+            endpoint = self._next_endpoint(deadline)
+            if endpoint is None:
+                return
+            time0 = time.perf_counter()
+            error = None
+            try:
+                self._call(session, endpoint)
+            except Exception as e:
+                error = str(e)[:80]
+            latency = time.perf_counter() - time0
+            with self.lock:
+                if error is None:
+                    self.records[endpoint].append(latency)
+                else:
+                    self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+    def run(self):
+        self.setup()
+        time0 = time.time()
+        deadline = time0 + self.duration
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for _ in range(self.concurrency):
+                executor.submit(self._worker, deadline)
+        return self.report(time.time() - time0)
+
+    def report(self, elapsed):
+        result = {}
+        for endpoint in self.endpoints:
+            latencies = sorted(self.records[endpoint])
+            errors = sum(self.errors[endpoint].values())
+            result[endpoint] = {
+                "requests": len(latencies) + errors,
+                "errors": errors,
+                "error_detail": self.errors[endpoint],
+                "rps": len(latencies) / elapsed if elapsed > 0 else 0,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "max_ms": (latencies[-1] if latencies else 0) * 1000,
+            }
+        return {"elapsed_s": elapsed, "concurrency": self.concurrency, "endpoints": result}
+
+
+def format_report(result):
+    lines = [f"elapsed {result['elapsed_s']:.1f}s, concurrency {result['concurrency']}",
+             f"{'endpoint':16s} {'requests':>9s} {'errors':>7s} {'rps':>8s} {'p50_ms':>9s} {'p95_ms':>9s} {'p99_ms':>9s} {'max_ms':>9s}"]
+    for endpoint, r in result["endpoints"].items():
+        lines.append(f"{endpoint:16s} {r['requests']:9d} {r['errors']:7d} {r['rps']:8.2f} "
+                     f"{r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} {r['max_ms']:9.1f}")
+        for error, count in r["error_detail"].items():
+            lines.append(f"    {count} x {error}")
+    return "\n".join(lines)
+
+
+def compare(result, baseline, max_regression=0.2):
+    """返回回归项列表, p95延迟上升或吞吐下降超过max_regression比例即为回归"""
+    regressions = []
+    for endpoint, r in result["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base is None:
+            continue
+        if base["p95_ms"] > 0 and r["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{endpoint} p95 {base['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        if base["rps"] > 0 and r["rps"] < base["rps"] * (1 - max_regression):
+            regressions.append(f"{endpoint} rps {base['rps']:.2f} -> {r['rps']:.2f}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="服务接口并发压测")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:9001")
+    parser.add_argument("--endpoints", type=str, default=",".join(AGENT_ENDPOINTS),
+                        help=f"逗号分隔, 可选: {','.join(ALL_ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="压测时长(秒), 指定--requests时忽略")
+    parser.add_argument("--requests", type=int, default=None, help="每个接口的请求数")
+    parser.add_argument("--text_size", type=int, default=2000, help="输入文本长度")
+    parser.add_argument("--svg_dir", type=str, default=None, help="dwg_decode输出目录(服务端路径)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--response_mode", type=str, default=None, help="如compact")
+    parser.add_argument("--output", type=str, default=None, help="结果保存为JSON")
+    parser.add_argument("--baseline", type=str, default=None, help="对比的基线结果JSON")
+    parser.add_argument("--max_regression", type=float, default=0.2)
+    return parser
+
+
+def run(args):
+    """按解析好的参数压测并输出报告, 返回进程返回码"""
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for endpoint in endpoints:
+        assert endpoint in ALL_ENDPOINTS, f"unknown endpoint {endpoint}, must in {ALL_ENDPOINTS}"
+
+    load_test = LoadTest(args.url, endpoints, concurrency=args.concurrency, duration=args.duration,
+                         requests_per_endpoint=args.requests, text_size=args.text_size, svg_dir=args.svg_dir,
+                         timeout=args.timeout, response_mode=args.response_mode)
+    result = load_test.run()
+    print(format_report(result))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+def main(argv=None):
+    return run(build_parser().parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
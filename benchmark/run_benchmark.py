@@ -0,0 +1,112 @@
+"""
+端到端压测: 启动大模型替身服务和使用CheckCADTool替身的 service_wrapper, 然后运行 load_test
+
+    python benchmark/run_benchmark.py --concurrency 32 --duration 60 --llm_latency_ms 800 \
+        --endpoints text_rebuild,partial_match,list_make,sequence_match,dwg_decode --output result.json
+
+    # 与基线对比, 出现回归时返回码为1
+    python benchmark/run_benchmark.py --baseline result.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+import requests
+
+file_path = os.path.abspath(os.path.dirname(__file__))
+root_path = os.path.abspath(os.path.join(file_path, '../'))
+sys.path.insert(0, file_path)
+
+import load_test
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def wait_ready(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def stop(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="端到端压测", parents=[load_test.build_parser()], conflict_handler="resolve")
+    parser.add_argument("--port", type=int, default=19001, help="service_wrapper端口")
+    parser.add_argument("--llm_port", type=int, default=18000)
+    parser.add_argument("--llm_latency_ms", type=float, default=500)
+    parser.add_argument("--llm_latency_dist", type=str, default="lognormal")
+    parser.add_argument("--llm_failure_rate", type=float, default=0.0)
+    parser.add_argument("--llm_hang_rate", type=float, default=0.0)
+    parser.add_argument("--cad_latency_ms", type=float, default=200)
+    parser.add_argument("--cad_failure_rate", type=float, default=0.0)
+    parser.add_argument("--work_dir", type=str, default=None, help="上传/输出目录, 默认临时目录, 结束后删除")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="remote_server_bench_")
+    upload_dir = os.path.join(work_dir, "dwgData")
+    download_dir = os.path.join(work_dir, "svgData")
+    os.makedirs(upload_dir, exist_ok=True)
+    os.makedirs(download_dir, exist_ok=True)
+
+    llm = subprocess.Popen([sys.executable, os.path.join(file_path, "fake_llm_server.py"),
+                            "--port", str(args.llm_port),
+                            "--latency_ms", str(args.llm_latency_ms),
+                            "--latency_dist", args.llm_latency_dist,
+                            "--failure_rate", str(args.llm_failure_rate),
+                            "--hang_rate", str(args.llm_hang_rate)])
+
+    env = dict(os.environ)
+    env.update({
+        "REMOTE_SERVER_LLM_URL": f"http://127.0.0.1:{args.llm_port}/v1/chat/completions",
+        "REMOTE_SERVER_LLM_TOKEN": "Bearer fake-token",
+        "REMOTE_SERVER_UPLOAD_DIR": upload_dir,
+        "REMOTE_SERVER_DOWNLOAD_DIR": download_dir,
+        "REMOTE_SERVER_DWG_CMD": json.dumps([sys.executable, os.path.join(file_path, "fake_check_cad_tool.py")]),
+        "FAKE_CAD_LATENCY_MS": str(args.cad_latency_ms),
+        "FAKE_CAD_FAILURE_RATE": str(args.cad_failure_rate),
+    })
+    service = subprocess.Popen([sys.executable, os.path.join(root_path, "server", "service_wrapper.py"),
+                                "--port", str(args.port)], cwd=os.path.join(root_path, "server"), env=env)
+
+    try:
+        url = f"http://127.0.0.1:{args.port}"
+        if not wait_ready(f"http://127.0.0.1:{args.llm_port}/stats") or not wait_ready(f"{url}/health"):
+            logger.info("fake llm server or service_wrapper not ready")
+            return 2
+
+        args.url = url
+        args.svg_dir = download_dir
+        code = load_test.run(args)
+
+        print(f"fake llm stats {requests.get(f'http://127.0.0.1:{args.llm_port}/stats', timeout=2).text}")
+        return code
+    finally:
+        stop(service)
+        stop(llm)
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
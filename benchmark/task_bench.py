@@ -0,0 +1,148 @@
+import sys
+import os
+import json
+import time
+import threading
+import tracemalloc
+import argparse
+
+file_path = os.path.abspath(os.path.dirname(__file__))
+root_path = os.path.abspath(os.path.join(file_path, '../'))
+sys.path.insert(0, root_path)
+sys.path.insert(0, os.path.join(root_path, "server"))
+
+from task import Task
+from utils.trace_utils import Trace
+
+
+class LegacyTask(object):
+    """改造前的Task: 复制请求字段, 每次to_dict都重建字典"""
+
+    def __init__(self, request_data):
+        self.task_id = Task.generate_task_id()
+        self.request_data = request_data
+        self.task_type = self.request_data.get("task_type", "")
+        self.model_name = self.request_data.get("model_name", "")
+        self.message = self.request_data.get("message", "")
+        self.text = self.request_data.get("text", "")
+        self.context = self.request_data.get("context", "")
+        self.keyword = self.request_data.get("keyword", "")
+        self.input_text = self.request_data.get("input_text", "")
+        self.cde_params = self.request_data.get("cde_params", {})
+        self.dwg_params = self.request_data.get("dwg_params", {})
+        self.priority = self.request_data.get("priority", "")
+        self.tenant = self.request_data.get("tenant", self.request_data.get("project_id", ""))
+        self.task_status = "waiting"
+        self.task_results = None
+        self.create_time = time.time()
+        self.trace = Trace(self.task_id)
+        self.stream_queue = None
+        self.finish_time = None
+        self._done_event = threading.Event()
+        self._done_callbacks = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.task_id}:{self.task_type}:{self.model_name}"
+
+    def set_result(self, res):
+        self.task_results = res
+
+    def set_finish(self):
+        self.task_status = "finished"
+        self.finish_time = time.time()
+        self._done_event.set()
+
+    def to_dict(self):
+        return {
+            "task_id": self.task_id,
+            "task_type": self.task_type,
+            "model_name": self.model_name,
+            "message": self.message,
+            "text": self.text,
+            "context": self.context,
+            "keyword": self.keyword,
+            "input_text": self.input_text,
+            "task_status": self.task_status,
+            "task_results": self.task_results,
+            "cde_params": self.cde_params,
+            "dwg_params": self.dwg_params,
+        }
+
+
+def make_request(text_size):
+    return json.dumps({
+        "task_type": "partial_match",
+        "model_name": "deepseek-v3",
+        "context": "钢筋混凝土",
+        "input_text": "混凝土强度等级C30" * (text_size // 20),
+        "priority": "normal",
+    }, ensure_ascii=False)
+
+
+def handler(payload, result_size):
+    payload["raw_output"] = "x" * result_size
+    payload["json_output"] = [{"index": i, "name": "现浇混凝土梁", "unit": "m3"} for i in range(result_size // 200)]
+    return payload
+
+
+def legacy_lifecycle(body, result_size):
+    task = LegacyTask(json.loads(body))
+    result = handler(task.to_dict(), result_size)
+    task.set_result(result)
+    task.set_finish()
+    log = f"task: {task.to_dict()}"
+    size = len(json.dumps(task.task_results, ensure_ascii=False, default=str))
+    response = json.dumps(task.to_dict(), ensure_ascii=False)
+    return task, len(log) + size + len(response)
+
+
+def compact_lifecycle(body, result_size):
+    task = Task(json.loads(body))
+    result = handler(task.payload(), result_size)
+    task.set_result(result)
+    task.set_finish()
+    log = f"task: {task} {task.task_status}"
+    size = len(task.results_json())
+    response = task.to_json()
+    return task, len(log) + size + len(response)
+
+
+def bench_memory(task_cls, body, count):
+    """每个任务对象本身(不含请求和结果)的内存"""
+    request_data = json.loads(body)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tasks = [task_cls(request_data) for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del tasks
+    return size / count
+
+
+def bench_cpu(lifecycle, body, result_size, count):
+    time0 = time.perf_counter()
+    for _ in range(count):
+        lifecycle(body, result_size)
+    return (time.perf_counter() - time0) / count * 1000 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task内存与CPU对比")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--text_size", type=int, default=2000)
+    parser.add_argument("--result_size", type=int, default=50 * 1024)
+    args = parser.parse_args()
+
+    body = make_request(args.text_size)
+    print(f"count={args.count} text_size={args.text_size} result_size={args.result_size}")
+    for name, task_cls, lifecycle in [("legacy", LegacyTask, legacy_lifecycle),
+                                      ("compact", Task, compact_lifecycle)]:
+        memory = bench_memory(task_cls, body, args.count)
+        cpu = bench_cpu(lifecycle, body, args.result_size, args.count)
+        print(f"{name:8s} memory/task {memory:8.0f} B   cpu/task {cpu:8.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -21,11 +21,15 @@ logger.setLevel(logging.INFO)
 
 UTC_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
+# 解码成功后写入输出目录, 记录源文件名; 上传按内容寻址, 文件名相同即内容相同, 可直接复用已有的svg
+DECODED_MARKER = ".decoded"
+
 
 class SimpleDwgClient(object):
 
-    def __init__(self, dwg_params_key="dwg_params"):
-        self.cmd = "E:\dwg\ReleaseDebug\CheckCADTool.exe"
+    def __init__(self, dwg_params_key="dwg_params", cmd=None):
+        # cmd可以是可执行文件路径或参数列表(如 ["python", "fake_check_cad_tool.py"])
+        self.cmd = cmd if cmd is not None else "E:\dwg\ReleaseDebug\CheckCADTool.exe"
         self.dwg_params_key = dwg_params_key
 
     def _prepare_data(self, instance):
@@ -41,19 +45,34 @@ class SimpleDwgClient(object):
 
         return dwg_request
 
+    def _decoded(self, dwg_request):
+        marker_path = os.path.join(dwg_request["svg_file_folder"], DECODED_MARKER)
+        if dwg_request.get("force") or not os.path.exists(marker_path):
+            return False
+        with open(marker_path, "r", encoding="utf-8") as f:
+            return f.read().strip() == os.path.basename(dwg_request["dwg_file_path"])
+
     def run(self, instance):
-        """使用 subprocess.run 执行 exe 文件"""
+        """使用 subprocess.run 执行 exe 文件, 同一文件已解码到同一目录时直接返回(dwg_params中force为真时强制重新解码)"""
 
         dwg_request = self._prepare_data(instance)
+        if self._decoded(dwg_request):
+            logger.info(f"{dwg_request['dwg_file_path']} already decoded to {dwg_request['svg_file_folder']}")
+            return {"returncode": 0, "cached": True}
         try:
             os.makedirs(dwg_request["svg_file_folder"], exist_ok=True)
 
-            result = subprocess.run([self.cmd, "-p", f"{dwg_request['dwg_file_path']}", "-o", f"{dwg_request['svg_file_folder']}", "-t", f"{dwg_request['is_svg']}", "-c", f"{dwg_request['is_colorful']}"])
+            cmd = self.cmd if isinstance(self.cmd, list) else [self.cmd]
+            result = subprocess.run([*cmd, "-p", f"{dwg_request['dwg_file_path']}", "-o", f"{dwg_request['svg_file_folder']}", "-t", f"{dwg_request['is_svg']}", "-c", f"{dwg_request['is_colorful']}"])
                                     # timeout=10, capture_output=True, text=True)
         except subprocess.TimeoutExpired:
             result = None
             print("命令执行超时")
 
+        if result is not None and result.returncode == 0:
+            with open(os.path.join(dwg_request["svg_file_folder"], DECODED_MARKER), "w", encoding="utf-8") as f:
+                f.write(os.path.basename(dwg_request["dwg_file_path"]))
+
         return {"returncode": result.returncode}
 
 
@@ -0,0 +1,139 @@
+import os
+import stat as stat_module
+import time
+import logging
+from threading import Lock
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SORT_FIELDS = ["filename", "size", "upload_time", "modified_time"]
+
+
+def _entry(filename, stat, is_dir):
+    return {
+        "filename": filename,
+        "is_dir": is_dir,
+        "size": 0 if is_dir else stat.st_size,
+        "upload_time": stat.st_ctime,
+        "modified_time": stat.st_mtime,
+        "access_time": stat.st_atime,
+    }
+
+
+def parse_time(value):
+    """时间过滤参数, 支持时间戳或ISO格式字符串"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(value).timestamp()
+
+
+class _FolderIndex(object):
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.entries = {}
+        self.mtime_ns = None
+        self.sorted = {}
+
+    def scan(self):
+        """用os.scandir重建索引, 每个条目只stat一次; 跳过以.开头的内部文件和目录"""
+        time0 = time.time()
+        mtime_ns = os.stat(self.folder).st_mtime_ns
+        entries = {}
+        with os.scandir(self.folder) as it:
+            for dir_entry in it:
+                if dir_entry.name.startswith("."):
+                    continue
+                try:
+                    # Windows上DirEntry.stat()直接使用目录遍历得到的信息, 不再单独访问文件
+                    entries[dir_entry.name] = _entry(dir_entry.name, dir_entry.stat(), dir_entry.is_dir())
+                except FileNotFoundError:
+                    continue
+        self.entries = entries
+        self.mtime_ns = mtime_ns
+        self.sorted = {}
+        logger.info(f"file index scan {self.folder}, {len(entries)} entries in {time.time() - time0:.3f}s")
+
+
+class FileIndex(object):
+    """
+    上传/输出目录的内存索引, 列表接口不再每次遍历目录并逐个stat
+    本进程的上传和删除通过add/remove即时更新; 目录的mtime变化(其他进程增删了文件)时重新扫描
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.folders = {}
+
+    def _folder(self, folder, refresh=True):
+        """
+        返回folder的索引, 调用方需持有self.lock
+        refresh为True时目录mtime变化则重新扫描; 本进程的增删自己更新条目, 传False, 只在从未扫描过时扫描
+        """
+        folder = os.path.abspath(folder)
+        index = self.folders.get(folder)
+        if index is None:
+            index = self.folders[folder] = _FolderIndex(folder)
+        if index.mtime_ns is None or (refresh and index.mtime_ns != os.stat(folder).st_mtime_ns):
+            index.scan()
+        return index
+
+    def add(self, folder, filename):
+        """本进程新增或修改了folder下的filename"""
+        with self.lock:
+            index = self._folder(folder, refresh=False)
+            try:
+                stat = os.stat(os.path.join(index.folder, filename))
+            except FileNotFoundError:
+                index.entries.pop(filename, None)
+            else:
+                index.entries[filename] = _entry(filename, stat, stat_module.S_ISDIR(stat.st_mode))
+            index.mtime_ns = os.stat(index.folder).st_mtime_ns
+            index.sorted = {}
+
+    def remove(self, folder, filename):
+        """本进程删除了folder下的filename"""
+        with self.lock:
+            index = self._folder(folder, refresh=False)
+            index.entries.pop(filename, None)
+            index.mtime_ns = os.stat(index.folder).st_mtime_ns
+            index.sorted = {}
+
+    def entries(self, folder):
+        """folder下所有条目(含目录)的快照"""
+        with self.lock:
+            return list(self._folder(folder).entries.values())
+
+    def list(self, folder, offset=0, limit=None, sort_by="filename", reverse=False, extensions=None,
+             start_time=None, end_time=None):
+        """
+        分页列出folder下的文件, 返回(符合条件的总数, 当前页)
+        extensions: 扩展名列表(不含.); start_time/end_time: 按上传时间过滤的时间戳
+        """
+        assert sort_by in SORT_FIELDS, f"sort_by must in {SORT_FIELDS}, but {sort_by} now"
+        with self.lock:
+            index = self._folder(folder)
+            files = index.sorted.get(sort_by)
+            if files is None:
+                files = sorted((e for e in index.entries.values() if not e["is_dir"]),
+                               key=lambda e: (e[sort_by], e["filename"]))
+                index.sorted[sort_by] = files
+
+        if extensions:
+            extensions = {ext.lower().lstrip(".") for ext in extensions}
+            files = [e for e in files if e["filename"].rsplit(".", 1)[-1].lower() in extensions and "." in e["filename"]]
+        if start_time is not None:
+            files = [e for e in files if e["upload_time"] >= start_time]
+        if end_time is not None:
+            files = [e for e in files if e["upload_time"] < end_time]
+        if reverse:
+            files = files[::-1]
+        end = None if limit is None else offset + limit
+        return len(files), files[offset:end]
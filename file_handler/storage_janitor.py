@@ -0,0 +1,232 @@
+import os
+import time
+import shutil
+import logging
+from threading import Thread, Event, Lock
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def dir_size(path):
+    """目录下所有文件的总字节数"""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+    return total
+
+
+class StorageJanitor(object):
+    """
+    后台清理上传/输出目录:
+        1. 各目录可设TTL, 超过TTL未使用的文件(或解码输出目录)删除
+        2. 所有目录总大小超过quota_bytes时按最近使用时间(LRU)删除, 直到低于quota_bytes * low_watermark
+    最近使用时间取修改时间和访问时间的较大者; touch(下载、重复上传命中)用os.utime更新条目的访问时间(不改修改时间,
+    不影响ETag和Last-Modified), 重启后仍有效; in_use返回排队和执行中任务引用的路径, 这些路径及其所在目录不会被删除
+    internal_dirs为zip缓存、分片上传会话、内容哈希索引等内部目录, 计入配额但不由本类删除, 大小由各自模块控制
+    条目和大小取自FileIndex, 不重复遍历目录; 目录条目的大小按其mtime缓存
+    """
+
+    def __init__(self, file_index, folders, quota_bytes=None, interval=300, low_watermark=0.9, in_use=None,
+                 internal_dirs=None):
+        self.file_index = file_index
+        # folder -> ttl秒数, None表示不按时间清理
+        self.folders = folders
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.low_watermark = low_watermark
+        self.in_use = in_use if in_use is not None else (lambda: [])
+        self.internal_dirs = internal_dirs or []
+        self.last_access = {}
+        self.dir_sizes = {}
+        self.lock = Lock()
+        self.run_lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+        self.last_run = None
+        self.deleted_count = 0
+        self.deleted_bytes = 0
+        self.skipped_in_use = 0
+
+    def start(self):
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.info(f"storage janitor failed, exception={e}")
+
+    def _entry_path(self, path):
+        """path所属的受管条目(受管目录下的第一级文件或目录), 不在受管目录下时返回None"""
+        path = normalize_path(path)
+        for folder in self.folders:
+            relative = os.path.relpath(path, normalize_path(folder))
+            if relative != "." and not relative.startswith(".."):
+                return os.path.join(normalize_path(folder), relative.split(os.sep)[0])
+        return None
+
+    def touch(self, path):
+        """记录一次使用, 用于LRU; 访问时间写回所属条目, 服务重启后仍然有效"""
+        path = self._entry_path(path)
+        if path is None:
+            return
+        now = time.time()
+        with self.lock:
+            self.last_access[path] = now
+        try:
+            os.utime(path, ns=(int(now * 1e9), os.stat(path).st_mtime_ns))
+        except OSError as e:
+            logger.info(f"storage janitor failed to touch {path}, exception={e}")
+
+    def _size(self, path, entry):
+        if not entry["is_dir"]:
+            return entry["size"]
+        cached = self.dir_sizes.get(path)
+        if cached is not None and cached[0] == entry["modified_time"]:
+            return cached[1]
+        # 遍历目录会按relatime规则刷新其访问时间, 统计后恢复, 避免清理本身延长目录的寿命
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return 0
+        size = dir_size(path)
+        try:
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        except OSError:
+            pass
+        self.dir_sizes[path] = (entry["modified_time"], size)
+        return size
+
+    def _items(self):
+        """所有受管目录下的条目: (folder, 条目, 路径, 大小, 最近使用时间)"""
+        items = []
+        with self.lock:
+            last_access = dict(self.last_access)
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                continue
+            for entry in self.file_index.entries(folder):
+                path = normalize_path(os.path.join(folder, entry["filename"]))
+                last_used = max(entry["modified_time"], entry["access_time"], last_access.get(path, 0))
+                items.append((folder, entry, path, self._size(path, entry), last_used))
+        return items
+
+    def _internal_sizes(self):
+        return {folder: dir_size(folder) for folder in self.internal_dirs}
+
+    def _protected(self):
+        """任务引用的路径及其所有上级目录"""
+        protected = set()
+        for path in self.in_use():
+            path = normalize_path(path)
+            while path not in protected:
+                protected.add(path)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+        return protected
+
+    def _delete(self, folder, entry, path, size):
+        try:
+            if entry["is_dir"]:
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.info(f"storage janitor failed to delete {path}, exception={e}")
+            return False
+        self.file_index.remove(folder, entry["filename"])
+        with self.lock:
+            self.last_access.pop(path, None)
+        self.dir_sizes.pop(path, None)
+        self.deleted_count += 1
+        self.deleted_bytes += size
+        return True
+
+    def run_once(self):
+        """执行一次清理, 返回删除的条目数和字节数"""
+        with self.run_lock:
+            now = time.time()
+            protected = self._protected()
+            items = self._items()
+            deleted_count, deleted_bytes = 0, 0
+            remaining = []
+            for folder, entry, path, size, last_used in items:
+                ttl = self.folders[folder]
+                if ttl is not None and now - last_used > ttl:
+                    if path in protected:
+                        self.skipped_in_use += 1
+                    elif self._delete(folder, entry, path, size):
+                        logger.info(f"storage janitor expired {path}, idle {now - last_used:.0f}s")
+                        deleted_count += 1
+                        deleted_bytes += size
+                        continue
+                remaining.append((folder, entry, path, size, last_used))
+
+            total = sum(item[3] for item in remaining) + sum(self._internal_sizes().values())
+            if self.quota_bytes is not None and total > self.quota_bytes:
+                target = self.quota_bytes * self.low_watermark
+                for folder, entry, path, size, last_used in sorted(remaining, key=lambda item: item[4]):
+                    if total <= target:
+                        break
+                    if path in protected:
+                        self.skipped_in_use += 1
+                        continue
+                    if self._delete(folder, entry, path, size):
+                        logger.info(f"storage janitor evicted {path} {size} bytes, over quota {self.quota_bytes}")
+                        total -= size
+                        deleted_count += 1
+                        deleted_bytes += size
+
+            self.last_run = now
+            return deleted_count, deleted_bytes
+
+    def stats(self):
+        """各目录的条目数、字节数和TTL, 以及配额和累计清理情况"""
+        folders = {}
+        for folder, entry, path, size, last_used in self._items():
+            usage = folders.setdefault(folder, {"count": 0, "bytes": 0, "oldest_use": None})
+            usage["count"] += 1
+            usage["bytes"] += size
+            if usage["oldest_use"] is None or last_used < usage["oldest_use"]:
+                usage["oldest_use"] = last_used
+        for folder, ttl in self.folders.items():
+            folders.setdefault(folder, {"count": 0, "bytes": 0, "oldest_use": None})["ttl"] = ttl
+        internal = self._internal_sizes()
+        total_bytes = sum(usage["bytes"] for usage in folders.values()) + sum(internal.values())
+        return {
+            "folders": folders,
+            "internal": internal,
+            "total_bytes": total_bytes,
+            "quota_bytes": self.quota_bytes,
+            "quota_used": total_bytes / self.quota_bytes if self.quota_bytes else None,
+            "interval": self.interval,
+            "last_run": self.last_run,
+            "deleted_count": self.deleted_count,
+            "deleted_bytes": self.deleted_bytes,
+            "skipped_in_use": self.skipped_in_use,
+        }
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from threading import Lock
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# 流式写盘时每次读取的大小, 上传占用的内存与文件大小无关
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """上传失败, 带错误码和HTTP状态码, 由接口层转成JSON响应"""
+
+    def __init__(self, message, error_code, status=400, **data):
+        super().__init__(message)
+        self.message = message
+        self.error_code = error_code
+        self.status = status
+        self.data = data
+
+
+def copy_stream(stream, dst, max_size=None, chunk_size=CHUNK_SIZE, hasher=None):
+    """把stream分块写入已打开的文件dst, 返回写入的字节数; 超过max_size时抛出UploadError"""
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise UploadError(f"文件超过大小限制 {max_size} 字节", "FILE_TOO_LARGE", 413)
+        if hasher is not None:
+            hasher.update(chunk)
+        dst.write(chunk)
+    return size
+
+
+def content_file_id(sha256):
+    """内容寻址的文件ID: sha256的前32位, 与原uuid4().hex的长度和字符集一致"""
+    return sha256[:32]
+
+
+def file_sha256(file_path, chunk_size=CHUNK_SIZE):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ContentStore(object):
+    """
+    内容寻址的上传存储: 边写盘边计算sha256, 文件保存为 <sha256前32位>.<扩展名>,
+    相同内容且相同扩展名再次上传时直接返回已有文件; <upload_dir>/.hashes/<sha256>.<扩展名> 记录对应的文件名
+    (处理程序按扩展名识别格式, 同样的字节以不同扩展名上传时分别保存)
+    """
+
+    def __init__(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.hash_dir = os.path.join(upload_dir, ".hashes")
+        os.makedirs(self.hash_dir, exist_ok=True)
+
+    def _hash_path(self, sha256, file_extension):
+        if len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256):
+            raise UploadError("sha256格式错误", "INVALID_HASH", 400)
+        if file_extension and not file_extension.isalnum():
+            raise UploadError(f"扩展名格式错误: {file_extension}", "INVALID_FILE_TYPE", 400)
+        return os.path.join(self.hash_dir, f"{sha256}.{file_extension}" if file_extension else sha256)
+
+    def lookup(self, sha256, file_extension=""):
+        """已有相同内容且相同扩展名的文件时返回其文件名, 否则返回None(文件已被删除时清掉过期记录)"""
+        hash_path = self._hash_path(sha256.lower(), file_extension)
+        try:
+            with open(hash_path, "r", encoding="utf-8") as f:
+                save_filename = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if os.path.exists(os.path.join(self.upload_dir, save_filename)):
+            return save_filename
+        os.remove(hash_path)
+        return None
+
+    def _add(self, sha256, file_extension, save_filename):
+        hash_path = self._hash_path(sha256, file_extension)
+        tmp_path = f"{hash_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(save_filename)
+        os.replace(tmp_path, hash_path)
+
+    def adopt(self, src_path, file_extension, sha256=None):
+        """把已写好的临时文件纳入存储, 返回(文件名, sha256, 是否重复); 重复时删除src_path"""
+        sha256 = sha256 or file_sha256(src_path)
+        existing = self.lookup(sha256, file_extension)
+        if existing is not None:
+            os.remove(src_path)
+            logger.info(f"upload deduplicated, sha256 {sha256} -> {existing}")
+            return existing, sha256, True
+
+        file_id = content_file_id(sha256)
+        save_filename = f"{file_id}.{file_extension}" if file_extension else file_id
+        os.replace(src_path, os.path.join(self.upload_dir, save_filename))
+        self._add(sha256, file_extension, save_filename)
+        return save_filename, sha256, False
+
+    def save(self, stream, file_extension, max_size=None, chunk_size=CHUNK_SIZE):
+        """流式保存并计算sha256, 先写临时文件再改名, 中途失败不会留下不完整的文件; 返回(文件名, sha256, 是否重复)"""
+        tmp_path = os.path.join(self.upload_dir, f".{uuid.uuid4().hex}.tmp")
+        hasher = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                copy_stream(stream, f, max_size=max_size, chunk_size=chunk_size, hasher=hasher)
+            return self.adopt(tmp_path, file_extension, hasher.hexdigest())
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class ChunkedUploadManager(object):
+    """
+    可续传的分片上传:
+        init      创建上传会话, 返回upload_id
+        append    在offset处追加一个分片, offset必须等于已接收的字节数, 否则返回当前offset供客户端续传
+        complete  校验整个文件的sha256后存入ContentStore, 已有相同内容时复用
+    会话和已接收的数据保存在 <upload_dir>/.uploads 下, 服务重启或热重载后仍可续传
+    """
+
+    def __init__(self, upload_dir, content_store=None, max_size=2 * 1024 * 1024 * 1024, session_ttl=24 * 3600):
+        self.upload_dir = upload_dir
+        self.content_store = content_store if content_store is not None else ContentStore(upload_dir)
+        self.session_dir = os.path.join(upload_dir, ".uploads")
+        self.max_size = max_size
+        self.session_ttl = session_ttl
+        self.lock = Lock()
+        self.upload_locks = {}
+        os.makedirs(self.session_dir, exist_ok=True)
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.session_dir, f"{upload_id}.json")
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.session_dir, f"{upload_id}.part")
+
+    def _upload_lock(self, upload_id):
+        with self.lock:
+            if upload_id not in self.upload_locks:
+                self.upload_locks[upload_id] = Lock()
+            return self.upload_locks[upload_id]
+
+    def _load(self, upload_id):
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("上传会话不存在", "UPLOAD_NOT_FOUND", 404)
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("上传会话不存在或已过期", "UPLOAD_NOT_FOUND", 404)
+
+    def init(self, filename, total_size=None):
+        if total_size is not None and (isinstance(total_size, bool) or not isinstance(total_size, int) or total_size < 0):
+            raise UploadError(f"total_size必须是非负整数, 当前为 {total_size!r}", "INVALID_TOTAL_SIZE", 400)
+        if total_size is not None and total_size > self.max_size:
+            raise UploadError(f"文件超过大小限制 {self.max_size} 字节", "FILE_TOO_LARGE", 413)
+        self.cleanup()
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "total_size": total_size,
+            "create_time": time.time(),
+        }
+        open(self._part_path(upload_id), "wb").close()
+        with open(self._meta_path(upload_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        logger.info(f"chunked upload init {upload_id} {filename} total_size {total_size}")
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        meta = self._load(upload_id)
+        meta["offset"] = os.path.getsize(self._part_path(upload_id))
+        return meta
+
+    def append(self, upload_id, offset, stream):
+        """在offset处写入一个分片, 返回新的状态; offset与已接收字节数不一致时抛出409"""
+        with self._upload_lock(upload_id):
+            meta = self.status(upload_id)
+            if offset != meta["offset"]:
+                raise UploadError(f"offset {offset} 与已接收的 {meta['offset']} 字节不一致", "OFFSET_MISMATCH", 409,
+                                  offset=meta["offset"])
+            limit = meta["total_size"] if meta["total_size"] is not None else self.max_size
+            try:
+                with open(self._part_path(upload_id), "ab") as f:
+                    copy_stream(stream, f, max_size=limit - offset)
+            except Exception:
+                # 分片中途断开时截回分片开始处, 客户端从offset重发即可
+                os.truncate(self._part_path(upload_id), offset)
+                raise
+            meta["offset"] = os.path.getsize(self._part_path(upload_id))
+            return meta
+
+    def complete(self, upload_id, checksum=None):
+        """校验sha256并存入ContentStore, 返回(保存的文件名, 状态), 状态中deduplicated表示复用了已有文件"""
+        with self._upload_lock(upload_id):
+            meta = self.status(upload_id)
+            part_path = self._part_path(upload_id)
+            if meta["total_size"] is not None and meta["offset"] != meta["total_size"]:
+                raise UploadError(f"已接收 {meta['offset']} 字节, 文件大小为 {meta['total_size']}", "UPLOAD_INCOMPLETE",
+                                  409, offset=meta["offset"])
+            sha256 = file_sha256(part_path)
+            if checksum and checksum.lower().replace("sha256:", "") != sha256:
+                raise UploadError("文件校验失败", "CHECKSUM_MISMATCH", 422, sha256=sha256)
+
+            filename = meta["filename"]
+            file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            save_filename, sha256, deduplicated = self.content_store.adopt(part_path, file_extension, sha256)
+            os.remove(self._meta_path(upload_id))
+            meta["sha256"] = sha256
+            meta["deduplicated"] = deduplicated
+        with self.lock:
+            self.upload_locks.pop(upload_id, None)
+        logger.info(f"chunked upload complete {upload_id} -> {save_filename}")
+        return save_filename, meta
+
+    def abort(self, upload_id):
+        self._load(upload_id)
+        with self._upload_lock(upload_id):
+            self._remove(upload_id)
+
+    def _remove(self, upload_id):
+        for path in [self._part_path(upload_id), self._meta_path(upload_id)]:
+            if os.path.exists(path):
+                os.remove(path)
+        with self.lock:
+            self.upload_locks.pop(upload_id, None)
+
+    def cleanup(self):
+        """删除超过session_ttl未完成的上传会话"""
+        now = time.time()
+        for name in os.listdir(self.session_dir):
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-len(".json")]
+            part_path = self._part_path(upload_id)
+            if not os.path.exists(part_path) or now - os.path.getmtime(part_path) > self.session_ttl:
+                logger.info(f"chunked upload {upload_id} expired, removed")
+                self._remove(upload_id)
@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+import zlib
+import hashlib
+import logging
+import zipfile
+from threading import Lock
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# 默认的zip压缩级别(0为不压缩, 1-9为deflate级别)
+ZIP_LEVEL = 6
+
+
+def iter_files(folder):
+    """用os.scandir递归列出folder下的文件, 返回(相对路径, 绝对路径, stat), 跳过以.开头的隐藏文件和目录"""
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(folder, relative)) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            arcname = f"{relative}/{entry.name}" if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(arcname)
+            elif entry.is_file():
+                yield arcname, entry.path, entry.stat()
+
+
+def dir_signature(folder):
+    """目录内容签名: 每个文件的相对路径、大小和修改时间, 任一文件增删改后签名都会变化"""
+    hasher = hashlib.sha1()
+    for arcname, _, stat in iter_files(folder):
+        hasher.update(f"{arcname}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _zip_args(level):
+    if level == 0:
+        return {"compression": zipfile.ZIP_STORED}
+    return {"compression": zipfile.ZIP_DEFLATED, "compresslevel": level}
+
+
+def write_zip(folder, dst, level=ZIP_LEVEL):
+    """把folder打包写入dst(路径或已打开的文件)"""
+    with zipfile.ZipFile(dst, "w", **_zip_args(level)) as zipf:
+        for arcname, file_path, _ in iter_files(folder):
+            zipf.write(file_path, arcname)
+
+
+class _StreamBuffer(object):
+    """只能追加写的缓冲区, 不支持tell/seek, zipfile会改用数据描述符写出流式zip"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(folder, level=ZIP_LEVEL):
+    """边打包边输出zip数据, 不落盘, 每写完一个文件输出一次"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", **_zip_args(level)) as zipf:
+        for arcname, file_path, _ in iter_files(folder):
+            zipf.write(file_path, arcname)
+            data = buffer.pop()
+            if data:
+                yield data
+    data = buffer.pop()
+    if data:
+        yield data
+
+
+def iter_gzip(chunks, level=ZIP_LEVEL):
+    """把字节流压缩成gzip格式的字节流"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ZipCache(object):
+    """
+    目录打包结果的缓存, 以目录内容签名和压缩方式为键, 目录未变化时重复下载直接返回已有的zip
+    缓存放在 cache_dir 下, 总大小超过max_bytes时按最近使用时间(atime)淘汰; 命中时不改mtime, 保持ETag和Last-Modified不变
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.build_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _build_lock(self, key):
+        with self.lock:
+            if key not in self.build_locks:
+                self.build_locks[key] = Lock()
+            return self.build_locks[key]
+
+    def get(self, folder, level=ZIP_LEVEL, gzip_level=None):
+        """
+        返回folder打包后的缓存文件路径; gzip_level不为None时zip内文件不压缩,
+        整个zip再用gzip压缩, 适合以Content-Encoding: gzip发送给接受gzip的客户端
+        """
+        variant = f"gz{gzip_level}" if gzip_level is not None else f"z{level}"
+        key = f"{dir_signature(folder)}-{variant}"
+        cache_path = os.path.join(self.cache_dir, f"{key}.zip")
+        with self._build_lock(key):
+            built = self._build(folder, cache_path, level, gzip_level)
+        with self.lock:
+            self.build_locks.pop(key, None)
+        if built:
+            self.evict(keep=cache_path)
+        return cache_path
+
+    def _build(self, folder, cache_path, level, gzip_level):
+        if os.path.exists(cache_path):
+            # 只更新访问时间作为最近使用时间, 供淘汰时排序
+            stat = os.stat(cache_path)
+            os.utime(cache_path, ns=(time.time_ns(), stat.st_mtime_ns))
+            return False
+
+        time0 = time.time()
+        tmp_path = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                if gzip_level is None:
+                    write_zip(folder, f, level)
+                else:
+                    for data in iter_gzip(iter_zip(folder, 0), gzip_level):
+                        f.write(data)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f"zip {folder} -> {cache_path} {os.path.getsize(cache_path)} bytes in {time.time() - time0:.2f}s")
+        return True
+
+    def evict(self, keep=None):
+        """缓存总大小超过max_bytes时删除最久未使用的zip"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".zip") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            logger.info(f"zip cache evict {path}")
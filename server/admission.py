@@ -0,0 +1,82 @@
+import math
+import time
+import logging
+from collections import deque
+from threading import Lock
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class AdmissionController(object):
+    """
+    准入控制: 队列深度或预估排队时间超过阈值时拒绝新任务(HTTP 429), 并记录被拒绝的请求
+    预估排队时间 = 队列深度 * 单任务处理耗时EWMA / 消费线程数
+    """
+
+    def __init__(self, max_queue_depth=None, max_queue_wait_ms=None, alpha=0.2, max_records=100):
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait_ms = max_queue_wait_ms
+        self.alpha = alpha
+        self.latency_ewma = None
+        self.shed_count = 0
+        self.shed_reasons = {}
+        self.shed_records = deque(maxlen=max_records)
+        self.lock = Lock()
+
+    def record_latency(self, latency_ms):
+        with self.lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency_ms
+            else:
+                self.latency_ewma = self.alpha * latency_ms + (1 - self.alpha) * self.latency_ewma
+
+    def estimate_wait_ms(self, queue_depth, workers):
+        if self.latency_ewma is None:
+            return 0
+        return queue_depth * self.latency_ewma / max(1, workers)
+
+    def admit(self, queue_depth, workers, remaining_ms=None):
+        """返回 (是否准入, 拒绝原因, 建议重试秒数), remaining_ms为请求剩余的时间预算"""
+        estimated_wait_ms = self.estimate_wait_ms(queue_depth, workers)
+        if self.max_queue_depth is not None and queue_depth >= self.max_queue_depth:
+            return False, "queue_depth", self.retry_after(estimated_wait_ms)
+        if self.max_queue_wait_ms is not None and estimated_wait_ms >= self.max_queue_wait_ms:
+            return False, "queue_wait", self.retry_after(estimated_wait_ms)
+        if remaining_ms is not None and estimated_wait_ms >= remaining_ms:
+            return False, "deadline", self.retry_after(estimated_wait_ms)
+        return True, None, 0
+
+    @staticmethod
+    def retry_after(estimated_wait_ms):
+        return max(1, int(math.ceil(estimated_wait_ms / 1000)))
+
+    def record_shed(self, task, reason, queue_depth, workers):
+        estimated_wait_ms = self.estimate_wait_ms(queue_depth, workers)
+        record = {
+            "time": time.time(),
+            "task_id": task.task_id,
+            "task_type": task.task_type,
+            "reason": reason,
+            "queue_depth": queue_depth,
+            "estimated_wait_ms": estimated_wait_ms,
+        }
+        with self.lock:
+            self.shed_count += 1
+            self.shed_reasons[reason] = self.shed_reasons.get(reason, 0) + 1
+            self.shed_records.append(record)
+        logger.info(f"shed task {task}, reason {reason}, queue_depth {queue_depth}, "
+                    f"estimated_wait {estimated_wait_ms:.1f} ms")
+        return record
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "max_queue_depth": self.max_queue_depth,
+                "max_queue_wait_ms": self.max_queue_wait_ms,
+                "latency_ewma": self.latency_ewma,
+                "shed_count": self.shed_count,
+                "shed_reasons": dict(self.shed_reasons),
+                "shed_records": list(self.shed_records),
+            }
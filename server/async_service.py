@@ -0,0 +1,244 @@
+import json
+import time
+import asyncio
+import contextvars
+import logging
+from task import Task
+from task_registry import notify_webhook
+from admission import AdmissionController
+from utils.trace_utils import use_trace
+from utils.json_utils import encode_body
+from utils.deadline_utils import use_deadline
+from service_metrics import QUEUE_WAIT, HANDLER_LATENCY, REQUEST_LATENCY, TASKS_TOTAL, SHED_TOTAL, INFLIGHT
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class AsyncService(object):
+    """
+    asyncio模式的服务: 所有请求在同一个事件循环上调度, 不占用线程
+    handler为协程函数时直接await, 普通函数放到默认线程池执行
+    max_concurrency限制同时执行的handler数, 超出的请求在信号量上等待, 等待数超过max_pending时拒绝(429)
+    """
+
+    def __init__(self, name, interface, handler, max_concurrency=1024, max_pending=None, max_queue_wait_ms=None,
+                 task_timeout=600, registry=None, trace_exporter=None):
+        self.name = name
+        self.interface = interface
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.task_timeout = task_timeout
+        self.registry = registry
+        self.trace_exporter = trace_exporter
+        self.admission = AdmissionController(max_queue_depth=max_pending, max_queue_wait_ms=max_queue_wait_ms)
+        self.semaphore = None
+        self.inflight = 0
+        self.pending = 0
+        # 异步提交的任务, 事件循环只持有弱引用, 不保存引用的话执行中途可能被垃圾回收
+        self.background_tasks = set()
+        self.labels = {"service": self.name, "mode": "async"}
+
+    async def _call_handler(self, instance):
+        if asyncio.iscoroutinefunction(self.handler):
+            return await self.handler(instance)
+        loop = asyncio.get_running_loop()
+        # 复制当前上下文, 让线程池中的handler也能看到trace和deadline
+        return await loop.run_in_executor(None, contextvars.copy_context().run, self.handler, instance)
+
+    async def _run(self, task):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.pending += 1
+        acquired = False
+        try:
+            async with self.semaphore:
+                self.pending -= 1
+                acquired = True
+                if task.is_expired():
+                    logger.info(f"{self.name} task: {task} expired before run, dropped")
+                    self.admission.record_shed(task, "deadline", self.pending, self.max_concurrency)
+                    SHED_TOTAL.inc(dict(self.labels, reason="deadline"))
+                    task.set_failed()
+                    return
+                self.inflight += 1
+                INFLIGHT.inc(self.labels)
+                time0 = time.time() * 1000
+                task.trace.add_span("queue_wait", task.create_time, time0 / 1000)
+                QUEUE_WAIT.observe(time0 / 1000 - task.create_time, self.labels)
+                try:
+                    task.set_running()
+                    with use_trace(task.trace), use_deadline(task.deadline), task.trace.span("handler"):
+                        result = await self._call_handler(task.payload())
+                    task.set_result(result)
+                    task.set_finish()
+                    self.admission.record_latency(time.time() * 1000 - time0)
+                finally:
+                    self.inflight -= 1
+                    INFLIGHT.dec(self.labels)
+                    HANDLER_LATENCY.observe((time.time() * 1000 - time0) / 1000, self.labels)
+        except asyncio.CancelledError:
+            # wait_for超时会取消_run, 先置为失败再计数, 否则按running计入
+            task.set_failed()
+            raise
+        except Exception as e:
+            print(f"async consume failed, task={task}, exception={e}")
+            task.set_failed()
+        finally:
+            if not acquired:
+                self.pending -= 1
+            TASKS_TOTAL.inc(dict(self.labels, status=task.task_status))
+
+    async def handle(self, req_data, timeout=None):
+        """处理一次请求, 返回 (status, headers, body), timeout为客户端愿意等待的秒数"""
+        time0 = time.time() * 1000
+        task = Task(request_data=req_data)
+        if timeout is not None:
+            try:
+                task.set_timeout(timeout)
+            except ValueError:
+                logger.info(f"{self.name}: invalid x-request-timeout {timeout!r}")
+
+        remaining_ms = None if task.deadline is None else task.remaining() * 1000
+        admitted, reason, retry_after = self.admission.admit(self.pending, self.max_concurrency, remaining_ms)
+        if not admitted:
+            self.admission.record_shed(task, reason, self.pending, self.max_concurrency)
+            SHED_TOTAL.inc(dict(self.labels, reason=reason))
+            TASKS_TOTAL.inc(dict(self.labels, status="rejected"))
+            task.set_failed()
+            body = json.dumps({
+                "task_id": task.task_id,
+                "task_status": "rejected",
+                "message": f"{self.name} overloaded, reason {reason}, retry after {retry_after} s",
+            }, ensure_ascii=False)
+            return 429, {"Retry-After": str(retry_after)}, body
+
+        if req_data.get("submit_mode") == "async" and self.registry is not None:
+            body = json.dumps({"task_id": task.task_id, "task_status": task.task_status}, ensure_ascii=False)
+            self.registry.register(task)
+            callback_url = req_data.get("callback_url")
+            if callback_url:
+                task.add_done_callback(lambda t: notify_webhook(callback_url, t))
+            if self.trace_exporter is not None:
+                task.add_done_callback(lambda t: self.trace_exporter.export(t.trace, service=self.name))
+            future = asyncio.ensure_future(self._run(task))
+            self.background_tasks.add(future)
+            future.add_done_callback(self.background_tasks.discard)
+            return 202, {}, body
+
+        wait_timeout = self.task_timeout
+        if task.deadline is not None:
+            wait_timeout = max(min(wait_timeout, task.remaining()), 0)
+        try:
+            await asyncio.wait_for(self._run(task), timeout=wait_timeout)
+        except asyncio.TimeoutError:
+            logger.info(f"{self.name} task: {task} timeout after {wait_timeout} s.")
+            task.set_failed()
+
+        time1 = time.time() * 1000
+        REQUEST_LATENCY.observe((time1 - time0) / 1000, self.labels)
+        logger.info(f"{self.name} task: time diff {time1 - time0} ms.")
+        return 200, {}, self._serialize(task)
+
+    def _serialize(self, task):
+        with task.trace.span("serialize"):
+            body = task.to_json()
+        if task.request_data.get("trace"):
+            body = body[:-1] + ', "trace": ' + json.dumps(task.trace.to_list(), ensure_ascii=False) + "}"
+        if self.trace_exporter is not None:
+            self.trace_exporter.export(task.trace, service=self.name)
+        return body
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "interface": self.interface,
+            "handler": f"{self.handler.__class__.__name__}",
+            "max_concurrency": self.max_concurrency,
+            "inflight": self.inflight,
+            "pending": self.pending,
+            "admission": self.admission.to_dict(),
+        }
+
+
+class AsgiApp(object):
+    """最小ASGI应用, 把请求路由到AsyncService, 可由uvicorn/hypercorn等ASGI服务器运行"""
+
+    def __init__(self, registry=None):
+        self.services = {}
+        self.registry = registry
+
+    def add_service(self, service):
+        self.services[service.interface] = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        request_headers = dict(scope.get("headers", []))
+        try:
+            timeout = request_headers.get(b"x-request-timeout")
+            status, headers, content = await self._dispatch(scope["path"], body,
+                                                            timeout.decode("latin-1") if timeout else None)
+        except Exception as e:
+            status, headers, content = 500, {}, json.dumps({
+                "success": False,
+                "message": f"请求处理失败: {str(e)}",
+                "error_code": "ASYNC_SERVICE_ERROR",
+            }, ensure_ascii=False)
+
+        accept_encoding = request_headers.get(b"accept-encoding", b"").decode("latin-1")
+        content, encoding = encode_body(content, accept_encoding)
+        raw_headers = [(b"content-type", b"application/json; charset=utf-8"),
+                       (b"content-length", str(len(content)).encode("latin-1"))]
+        if encoding is not None:
+            raw_headers += [(b"content-encoding", encoding.encode("latin-1")), (b"vary", b"Accept-Encoding")]
+        raw_headers += [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def _dispatch(self, path, body, timeout=None):
+        if path == "/health":
+            return 200, {}, json.dumps({
+                "status": "healthy",
+                "service": "Async Agent Service",
+                "services": {s.name: s.to_dict() for s in self.services.values()},
+            }, ensure_ascii=False)
+
+        if path.startswith("/tasks/") and self.registry is not None:
+            task = self.registry.get(path[len("/tasks/"):])
+            if task is None:
+                return 404, {}, json.dumps({
+                    "success": False,
+                    "message": "任务不存在或已过期",
+                    "error_code": "TASK_NOT_FOUND",
+                }, ensure_ascii=False)
+            return 200, {}, task.to_json()
+
+        service = self.services.get(path)
+        if service is None:
+            return 404, {}, json.dumps({
+                "success": False,
+                "message": f"接口不存在: {path}",
+                "error_code": "NOT_FOUND",
+            }, ensure_ascii=False)
+
+        req_data = json.loads(body.decode("utf-8")) if body else {}
+        return await service.handle(req_data, timeout)
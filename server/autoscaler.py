@@ -0,0 +1,86 @@
+import math
+import time
+import logging
+from threading import Thread, Event
+from utils.metrics_utils import mcli
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CONSUMER_WORKERS = mcli.gauge("service_consumer_workers", "Consumer threads per service", ("service",))
+AUTOSCALE_TOTAL = mcli.counter("service_autoscale_total", "Autoscaler scaling decisions", ("service", "direction"))
+
+
+class ConsumerAutoscaler(object):
+    """
+    按队列深度和处理耗时在[min_worker, max_worker]之间伸缩各Service的消费线程
+    期望线程数 = ceil((排队数 + 执行中任务数) * 单任务耗时EWMA / target_wait_ms), 保证积压能在target_wait_ms内消化
+    扩容一次到位, 缩容每个周期最多减一个, 且需连续scale_down_delay个周期都偏多才缩, 避免抖动
+    """
+
+    def __init__(self, services, interval=2, target_wait_ms=5000, scale_down_delay=3):
+        self.services = services
+        self.interval = interval
+        self.target_wait_ms = target_wait_ms
+        self.scale_down_delay = scale_down_delay
+        self.surplus_rounds = {}
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        for service in self.services:
+            CONSUMER_WORKERS.set(service.consume_worker, {"service": service.name})
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            for service in self.services:
+                if service.max_worker <= service.min_worker:
+                    continue
+                try:
+                    self.scale(service)
+                except Exception as e:
+                    logger.info(f"autoscale {service.name} failed, exception={e}")
+
+    def desired_workers(self, service):
+        queue_depth = service.queue.qsize()
+        latency_ms = service.admission.latency_ewma
+        workers = service.consume_worker
+        if latency_ms is None:
+            # 还没有耗时数据, 有积压时逐个增加
+            desired = workers + 1 if queue_depth > 0 else workers
+        else:
+            desired = math.ceil((queue_depth + service.inflight) * latency_ms / self.target_wait_ms)
+        return max(service.min_worker, min(service.max_worker, desired))
+
+    def scale(self, service):
+        workers = service.consume_worker
+        desired = self.desired_workers(service)
+        labels = {"service": service.name}
+
+        if desired > workers:
+            self.surplus_rounds[service.name] = 0
+            while service.consume_worker < desired:
+                if service.add_worker() == workers:
+                    break
+                workers = service.consume_worker
+            AUTOSCALE_TOTAL.inc({"service": service.name, "direction": "up"})
+            logger.info(f"autoscale {service.name} up to {service.consume_worker}, desired {desired}, "
+                        f"queue_depth {service.queue.qsize()}, latency_ewma {service.admission.latency_ewma}")
+        elif desired < workers:
+            rounds = self.surplus_rounds.get(service.name, 0) + 1
+            self.surplus_rounds[service.name] = rounds
+            if rounds >= self.scale_down_delay:
+                self.surplus_rounds[service.name] = 0
+                service.remove_worker()
+                AUTOSCALE_TOTAL.inc({"service": service.name, "direction": "down"})
+                logger.info(f"autoscale {service.name} down to {service.consume_worker}, desired {desired}, "
+                            f"queue_depth {service.queue.qsize()}, latency_ewma {service.admission.latency_ewma}")
+        else:
+            self.surplus_rounds[service.name] = 0
+        CONSUMER_WORKERS.set(service.consume_worker, labels)
@@ -0,0 +1,78 @@
+import time
+import logging
+from queue import Empty
+from threading import Lock
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class AdaptiveBatcher(object):
+    """
+    微批调度器: 攒够batch_size条或等待超过max_wait_ms即刷新, 先到先刷新
+    根据批处理耗时和队列深度在[min_batch_size, max_batch_size]之间调整batch_size:
+    耗时超过target_latency_ms时乘性缩小, 耗时达标且队列积压时加性增大
+    多个消费线程共用同一个实例, 状态在lock内更新
+    """
+
+    def __init__(self, max_batch_size=128, max_wait_ms=10, min_batch_size=1, target_latency_ms=1000, alpha=0.2):
+        assert 1 <= min_batch_size <= max_batch_size, f"min_batch_size {min_batch_size} max_batch_size {max_batch_size}"
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = min_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.target_latency_ms = target_latency_ms
+        self.alpha = alpha
+        self.batch_size = max_batch_size
+        self.latency_ewma = None
+        self.lock = Lock()
+
+    def collect(self, queue, timeout):
+        """阻塞timeout秒等待第一条, 然后在max_wait_ms内继续攒批"""
+        try:
+            batch = [queue.get(block=True, timeout=timeout)]
+        except Empty:
+            return []
+
+        deadline = time.time() + self.max_wait_ms / 1000
+        with self.lock:
+            batch_size = self.batch_size
+        while len(batch) < batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(queue.get(block=True, timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def record(self, batch_size, latency_ms, queue_depth):
+        """记录一次批处理的大小、耗时和处理后的队列深度, 调整下一批的batch_size"""
+        with self.lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency_ms
+            else:
+                self.latency_ewma = self.alpha * latency_ms + (1 - self.alpha) * self.latency_ewma
+
+            old_batch_size = self.batch_size
+            if self.latency_ewma > self.target_latency_ms and batch_size > self.min_batch_size:
+                self.batch_size = max(self.min_batch_size, min(self.batch_size, batch_size) * 3 // 4)
+            elif self.latency_ewma <= self.target_latency_ms and queue_depth >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+            new_batch_size, latency_ewma = self.batch_size, self.latency_ewma
+
+        if new_batch_size != old_batch_size:
+            logger.info(f"batcher resize {old_batch_size} -> {new_batch_size}, "
+                        f"latency_ewma {latency_ewma:.1f} ms, queue_depth {queue_depth}")
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "batch_size": self.batch_size,
+                "min_batch_size": self.min_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "target_latency_ms": self.target_latency_ms,
+                "latency_ewma": self.latency_ewma,
+            }
@@ -1,7 +1,16 @@
 import logging
 import json
+import os
+import re
+import bisect
+import gzip
+import shutil
+import hashlib
 import requests
 import time
+from datetime import datetime, timedelta
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
@@ -10,32 +19,238 @@ logger.setLevel(logging.INFO)
 
 UTC_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
+# 大于该大小的文件使用可续传的分片上传
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# 告知服务端本次调用最多等待的秒数, 超时后服务端不再执行该任务
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+
+def file_id_of(path):
+    """从服务端文件路径(如 E:\\dwgData\\<file_id>.dwg)或文件名中取出文件ID"""
+    return re.split(r"[\\/]", path)[-1].split(".")[0]
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """本地文件的sha256, 服务端按内容寻址, 文件ID为其前32位"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class HashRing(object):
+    """一致性哈希环, 同一文件ID总是落到同一节点, 节点增减时只迁移少量文件"""
+
+    def __init__(self, nodes, replicas=64):
+        self.nodes = list(nodes)
+        self.ring = sorted((self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self.keys = [k for k, _ in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def get_nodes(self, key):
+        """key所在节点在前, 其后按环上顺序排列其余节点, 用于故障转移"""
+        nodes = []
+        start = bisect.bisect(self.keys, self._hash(key))
+        for i in range(len(self.ring)):
+            node = self.ring[(start + i) % len(self.ring)][1]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
+
+
+class NodePool(object):
+    """按 /health 上报的负载和健康状态排序节点, 上报结果缓存health_interval秒"""
+
+    def __init__(self, urls, health_interval=5, health_timeout=2):
+        self.urls = list(urls)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.healthy = {url: True for url in self.urls}
+        self.load = {url: 0 for url in self.urls}
+        # 本客户端发往各节点、尚未返回的请求数, 两次健康检查之间用于分散请求
+        self.pending = {url: 0 for url in self.urls}
+        self.refresh_time = 0
+        self.lock = Lock()
+
+    def _check(self, url):
+        try:
+            rsp = requests.get(url=f"{url}/health", timeout=self.health_timeout)
+            result = json.loads(rsp._content)
+            return rsp.status_code == 200 and result.get("status") == "healthy", result.get("load", 0)
+        except Exception as e:
+            logger.info(f"health check {url} failed, exception={e}")
+            return False, 0
+
+    def refresh(self, force=False):
+        if not force and time.time() - self.refresh_time < self.health_interval:
+            return
+        self.refresh_time = time.time()
+        with ThreadPoolExecutor(max_workers=len(self.urls)) as executor:
+            results = list(executor.map(self._check, self.urls))
+        with self.lock:
+            for url, (healthy, load) in zip(self.urls, results):
+                self.healthy[url] = healthy
+                self.load[url] = load
+
+    def mark_down(self, url):
+        """请求失败的节点在下次健康检查前不再优先选择"""
+        with self.lock:
+            self.healthy[url] = False
+
+    def least_loaded(self):
+        """健康节点按负载从低到高在前, 不健康节点排在最后作为兜底"""
+        self.refresh()
+        with self.lock:
+            return sorted(self.urls, key=lambda url: (not self.healthy[url], self.load[url] + self.pending[url]))
+
+    def order(self, urls):
+        """保持给定顺序, 仅把不健康节点移到最后"""
+        self.refresh()
+        with self.lock:
+            return sorted(urls, key=lambda url: not self.healthy[url])
+
+    def add_pending(self, url, n):
+        with self.lock:
+            self.pending[url] += n
+
 
 class RemoteServerClient(object):
-    def __init__(self, url=None):
-        if url is not None:
-            self.url = url
+    """
+    多节点客户端: 文件上传/下载/删除和DWG解码按文件ID一致性哈希到固定节点,
+    无状态的agent调用发往 /health 负载最低的健康节点, 失败时转移到其他节点
+    """
+
+    def __init__(self, url=None, urls=None, health_interval=5):
+        if urls:
+            self.urls = [u.rstrip("/") for u in urls]
+        elif url is not None:
+            self.urls = [url]
         else:
-            self.url = "http://10.127.91.94:9001"
-
-        rsp = requests.get(url=f"{self.url}/", timeout=60)
-        print(rsp._content.decode("utf-8"))
-
-    def list_file(self, instance):
-        data = json.dumps(instance, ensure_ascii=False)
-
-        trial = 0
-        retry = 3
-        while trial < retry:
+            self.urls = ["http://10.127.91.94:9001"]
+        self.url = self.urls[0]
+        self.ring = HashRing(self.urls)
+        self.pool = NodePool(self.urls, health_interval=health_interval)
+        # 异步任务只存在于受理它的节点上
+        self.task_nodes = {}
+        # 未完成的分片上传 local_file_path -> (node, upload_id, file_id), 再次上传同一文件时续传
+        self.pending_uploads = {}
+        # 未完成的下载 local_file_path -> (ETag, Content-Encoding), 再次下载时从.part已有的位置续传
+        self.pending_downloads = {}
+
+        for node in self.urls:
             try:
-                rsp = requests.get(url=f"{self.url}/files", data=data.encode("utf-8"), timeout=60)
-                result = json.loads(rsp._content)["data"]
-                return result
+                rsp = requests.get(url=f"{node}/", timeout=60)
+                print(rsp._content.decode("utf-8"))
             except Exception as e:
-                trial += 1
-                logger.info(f"failed to get {self.url}/files")
+                logger.info(f"failed to get {node}/, exception={e}")
+        self.pool.refresh(force=True)
+
+    def _file_nodes(self, file_id):
+        return self.pool.order(self.ring.get_nodes(file_id))
+
+    def _node_of(self, rsp):
+        return next((node for node in self.urls if rsp.url.startswith(node)), self.url)
+
+    def _request(self, method, path, nodes, retry=3, next_on_404=False, idempotent=None, **kwargs):
+        """
+        依次在nodes上请求path, 连接失败、过载(429)或网关错误/排空(502/503/504)时转移到下一个节点
+        读超时说明节点还在处理而不是宕机, 不标记下线; 只有幂等请求(默认为GET, 调用服务接口的GET不算)换节点重试, 否则返回None
+        """
+        rsp = None
+        attempts = max(retry, len(nodes))
+        if idempotent is None:
+            idempotent = method == "GET"
+        for trial in range(attempts):
+            node = nodes[trial % len(nodes)]
+            self.pool.add_pending(node, 1)
+            try:
+                rsp = requests.request(method, url=f"{node}{path}", **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                rsp = None
+                logger.info(f"failed to connect {method} {node}{path}, exception={e}")
+                self.pool.mark_down(node)
                 time.sleep(0.1)
+                continue
+            except requests.exceptions.Timeout as e:
+                rsp = None
+                logger.info(f"{method} {node}{path} read timeout, exception={e}")
+                if not idempotent:
+                    return None
+                continue
+            except requests.exceptions.RequestException as e:
+                logger.info(f"failed to {method} {node}{path}, exception={e}")
                 return None
+            finally:
+                self.pool.add_pending(node, -1)
+            if rsp.status_code in [429, 502, 503, 504] and trial + 1 < attempts:
+                logger.info(f"{method} {node}{path} status {rsp.status_code}, try next node")
+                if rsp.status_code != 429:
+                    self.pool.mark_down(node)
+                # 释放连接, 流式响应不关闭会一直占用连接池
+                rsp.close()
+                time.sleep(0.1)
+                continue
+            if rsp.status_code == 404 and next_on_404 and trial + 1 < len(nodes):
+                # 文件可能因上传时的故障转移存放在哈希环上的下一个节点
+                rsp.close()
+                continue
+            return rsp
+        return rsp
+
+    def list_file(self, instance):
+        """
+        汇总所有节点上的文件列表, 每个文件带上所在节点node
+        instance中可带page/page_size/sort_by/order/extensions/start_time/end_time, 未指定page时取回全部文件:
+        按上传时间升序、以已取到的最晚上传时间为start_time游标翻页, 期间有文件新增或删除也不会漏取, 重复的按文件名去掉
+        """
+        files = []
+        total_count = 0
+        for node in self.urls:
+            if "page" in instance:
+                request = dict(instance)
+            else:
+                request = dict(instance, page=1, sort_by="upload_time", order="asc")
+            cursor = None
+            seen = set()
+            while True:
+                data = json.dumps(request, ensure_ascii=False).encode("utf-8")
+                rsp = self._request("GET", "/files", [node], data=data, timeout=60)
+                if rsp is None:
+                    break
+                try:
+                    result = json.loads(rsp._content)["data"]
+                except Exception as e:
+                    logger.info(f"failed to get {node}/files, exception={e}")
+                    break
+                for file in result["files"]:
+                    file["node"] = node
+                if "page" in instance:
+                    files += result["files"]
+                    total_count += result["total_count"]
+                    break
+
+                files += [file for file in result["files"] if file["filename"] not in seen]
+                seen.update(file["filename"] for file in result["files"])
+                if not result.get("has_more"):
+                    total_count += len(seen)
+                    break
+                last = datetime.fromisoformat(result["files"][-1]["upload_time"])
+                if cursor is None or last > cursor:
+                    # 服务端的时间精确到微秒, 游标往前留1微秒, 同一时刻上传的文件不会被>=过滤掉
+                    cursor = last
+                    request["start_time"] = (last - timedelta(microseconds=1)).isoformat()
+                    request["page"] = 1
+                else:
+                    # 同一时刻的文件超过一页
+                    request["page"] += 1
+        return {"files": files, "total_count": total_count}
 
     def delete_file(self, instance):
         file = instance["file"] if "file" in instance else None
@@ -48,42 +263,133 @@ class RemoteServerClient(object):
         request = {"folder": instance["folder"] if "folder" in instance else None}
         data = json.dumps(request, ensure_ascii=False)
 
-        trial = 0
-        retry = 3
-        while trial < retry:
-            try:
-                rsp = requests.delete(url=f"{self.url}/files/{file}", data=data.encode("utf-8"), timeout=60)
-                result = json.loads(rsp._content)
-                return result
-            except Exception as e:
-                trial += 1
-                logger.info(f"failed to delete {self.url}/files/{file}")
-                time.sleep(0.1)
-                return None
-
-    def upload_file(self, instance):
+        rsp = self._request("DELETE", f"/files/{file}", self._file_nodes(file_id_of(file)), next_on_404=True,
+                            data=data.encode("utf-8"), timeout=60)
+        if rsp is None:
+            logger.info(f"failed to delete /files/{file}")
+            return None
+        return json.loads(rsp._content)
+
+    def upload_file(self, instance, chunk_size=CHUNK_SIZE):
+        """
+        文件ID为内容sha256的前32位, 按它选定哈希节点, 之后的解码/下载/删除都路由到同一节点;
+        上传前先询问该节点是否已有相同内容的文件, 有则直接返回不再传输;
+        大于chunk_size的文件分片上传, 中断后再次调用会从服务端已接收的位置续传
+        """
         local_file_path = instance["local_file_path"] if "local_file_path" in instance else None
         if local_file_path is None:
             logger.info(f"upload_file failed, local_file_path {local_file_path} is None")
             return None
 
-        local_file = open(local_file_path, "rb")
-        files = {'file': (local_file_path.split('/')[-1], local_file)}
+        checksum = file_sha256(local_file_path)
+        nodes = self._file_nodes(checksum[:32])
+        filename = re.split(r"[\\/]", local_file_path)[-1]
+        rsp = self._request("GET", f"/uploads/hash/{checksum}", nodes, next_on_404=True,
+                            params={"filename": filename}, timeout=60)
+        if rsp is not None and rsp.status_code == 200:
+            logger.info(f"{local_file_path} already on {self._node_of(rsp)}, skip upload")
+            return json.loads(rsp._content)
 
-        trial = 0
-        retry = 3
-        while trial < retry:
+        if local_file_path in self.pending_uploads or os.path.getsize(local_file_path) > chunk_size:
+            return self.upload_file_chunked(local_file_path, chunk_size, checksum=checksum)
+
+        for node in nodes:
             try:
-                rsp = requests.post(url=f"{self.url}/upload", files=files, timeout=60)
+                with open(local_file_path, "rb") as local_file:
+                    files = {'file': (filename, local_file)}
+                    rsp = requests.post(url=f"{node}/upload", files=files, timeout=60)
+                if rsp.status_code >= 500:
+                    logger.info(f"upload_file to {node} status {rsp.status_code}, try next node")
+                    continue
                 result = json.loads(rsp._content)
                 return result
             except Exception as e:
-                trial += 1
-                logger.info(f"failed to upload_file local_file_path {local_file_path}")
+                logger.info(f"failed to upload_file local_file_path {local_file_path} to {node}, exception={e}")
+                self.pool.mark_down(node)
                 time.sleep(0.1)
+        return None
+
+    def upload_file_chunked(self, local_file_path, chunk_size=CHUNK_SIZE, retry=5, checksum=None):
+        """分片上传: init -> 按offset逐片PUT -> complete(sha256), 失败时保留会话供下次续传"""
+        total_size = os.path.getsize(local_file_path)
+        checksum = checksum or file_sha256(local_file_path)
+
+        pending = self.pending_uploads.get(local_file_path)
+        if pending is not None and pending[2] != checksum[:32]:
+            # 本地文件在两次上传之间被修改, 之前的会话作废
+            try:
+                requests.delete(url=f"{pending[0]}/uploads/{pending[1]}", timeout=60)
+            except Exception as e:
+                logger.info(f"failed to abort chunked upload {pending[1]}, exception={e}")
+            pending = None
+        if pending is None:
+            file_id = checksum[:32]
+            filename = re.split(r"[\\/]", local_file_path)[-1]
+            request = json.dumps({"filename": filename, "total_size": total_size}, ensure_ascii=False)
+            nodes = self._file_nodes(file_id)
+            rsp = self._request("POST", "/uploads", nodes, data=request.encode("utf-8"), timeout=60)
+            if rsp is None or rsp.status_code != 200:
+                logger.info(f"failed to init chunked upload {local_file_path}")
                 return None
+            pending = (self._node_of(rsp), json.loads(rsp._content)["data"]["upload_id"], file_id)
+            self.pending_uploads[local_file_path] = pending
+        node, upload_id, file_id = pending
+
+        offset = None
+        failures = 0
+        with open(local_file_path, "rb") as f:
+            while failures <= retry:
+                try:
+                    if offset is None:
+                        # 从服务端已接收的位置开始(新会话为0)
+                        rsp = requests.get(url=f"{node}/uploads/{upload_id}", timeout=60)
+                        if rsp.status_code == 404:
+                            logger.info(f"chunked upload {upload_id} expired, restart")
+                            self.pending_uploads.pop(local_file_path, None)
+                            return self.upload_file_chunked(local_file_path, chunk_size, retry, checksum)
+                        offset = json.loads(rsp._content)["data"]["offset"]
+                    if offset >= total_size:
+                        break
+                    f.seek(offset)
+                    rsp = requests.put(url=f"{node}/uploads/{upload_id}", data=f.read(chunk_size), timeout=60,
+                                       headers={"Upload-Offset": str(offset)})
+                    result = json.loads(rsp._content)
+                    if rsp.status_code == 409:
+                        offset = result["offset"]
+                        continue
+                    if rsp.status_code != 200:
+                        raise Exception(result.get("message"))
+                    offset = result["data"]["offset"]
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    offset = None
+                    logger.info(f"chunked upload {upload_id} to {node} failed, exception={e}, retry {failures}")
+                    time.sleep(min(2 ** failures * 0.1, 5))
+
+        if offset is None or offset < total_size:
+            logger.info(f"chunked upload {local_file_path} interrupted, upload_file again to resume")
+            return None
 
-    def download_file(self, instance):
+        try:
+            rsp = requests.post(url=f"{node}/uploads/{upload_id}/complete", timeout=600,
+                                data=json.dumps({"checksum": checksum}).encode("utf-8"))
+            result = json.loads(rsp._content)
+        except Exception as e:
+            logger.info(f"failed to complete chunked upload {upload_id}, exception={e}")
+            return None
+        if rsp.status_code == 422:
+            # 服务端数据与本地文件不一致, 放弃该会话, 下次重新上传
+            requests.delete(url=f"{node}/uploads/{upload_id}", timeout=60)
+        if rsp.status_code in [200, 404, 422]:
+            self.pending_uploads.pop(local_file_path, None)
+        return result
+
+    def download_file(self, instance, chunk_size=CHUNK_SIZE):
+        """
+        不指定local_file_path时返回响应对象;
+        指定时边下载边写入 <local_file_path>.part, 中断后再次调用用Range从已下载的位置续传(If-Range校验ETag, 文件变化时重新下载)
+        """
 
         file = instance["file"] if "file" in instance else None
 
@@ -95,19 +401,58 @@ class RemoteServerClient(object):
         request = {"folder": instance["folder"] if "folder" in instance else None}
         data = json.dumps(request, ensure_ascii=False)
 
-        trial = 0
-        retry = 3
-        while trial < retry:
-            try:
-                rsp = requests.get(url=f"{self.url}/download/{file}", data=data.encode("utf-8"), timeout=60)
-                return rsp
-            except Exception as e:
-                trial += 1
-                logger.info(f"failed to download {self.url}/download/{file}")
-                time.sleep(0.1)
-                return None
+        local_file_path = instance["local_file_path"] if "local_file_path" in instance else None
+        if local_file_path is None:
+            rsp = self._request("GET", f"/download/{file}", self._file_nodes(file_id_of(file)), next_on_404=True,
+                                data=data.encode("utf-8"), timeout=60)
+            if rsp is None:
+                logger.info(f"failed to download /download/{file}")
+            return rsp
+
+        part_path = f"{local_file_path}.part"
+        etag, encoding = self.pending_downloads.get(local_file_path, (None, None))
+        offset = os.path.getsize(part_path) if etag is not None and os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": etag} if offset > 0 else {}
+
+        rsp = self._request("GET", f"/download/{file}", self._file_nodes(file_id_of(file)), next_on_404=True,
+                            data=data.encode("utf-8"), timeout=60, stream=True, headers=headers)
+        if rsp is None or rsp.status_code not in [200, 206, 416]:
+            logger.info(f"failed to download /download/{file}, status {rsp.status_code if rsp is not None else None}")
+            return None
+        if rsp.status_code == 416:
+            # 本地.part与服务端文件对不上, 重新下载
+            rsp.close()
+            self.pending_downloads.pop(local_file_path, None)
+            os.remove(part_path)
+            return self.download_file(instance, chunk_size)
+        if rsp.status_code == 200:
+            offset = 0
+            etag, encoding = rsp.headers.get("ETag"), rsp.headers.get("Content-Encoding")
+            if etag is not None:
+                self.pending_downloads[local_file_path] = (etag, encoding)
+        logger.info(f"download /download/{file} to {local_file_path} from offset {offset}")
+
+        try:
+            with open(part_path, "ab" if offset > 0 else "wb") as f:
+                # 按原始字节保存, gzip传输的内容下载完整后再解压, 续传的Range才能与服务端对齐
+                for chunk in rsp.raw.stream(chunk_size, decode_content=False):
+                    f.write(chunk)
+        except Exception as e:
+            logger.info(f"download /download/{file} interrupted, exception={e}, download_file again to resume")
+            return None
+        finally:
+            rsp.close()
+
+        if encoding == "gzip":
+            with gzip.open(part_path, "rb") as src, open(local_file_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, chunk_size)
+            os.remove(part_path)
+        else:
+            os.replace(part_path, local_file_path)
+        self.pending_downloads.pop(local_file_path, None)
+        return {"local_file_path": local_file_path, "file_size": os.path.getsize(local_file_path)}
 
-    def dwg_decode(self, instance):
+    def dwg_decode(self, instance, timeout=60):
         dwg_file_path = instance["dwg_file_path"] if "dwg_file_path" in instance else None
         svg_file_folder = instance["svg_file_folder"] if "svg_file_folder" in instance else None
 
@@ -127,35 +472,104 @@ class RemoteServerClient(object):
         }
         data = json.dumps(request, ensure_ascii=False)
 
-        trial = 0
-        retry = 3
-        while trial < retry:
-            try:
-                rsp = requests.get(url=f"{self.url}/dwg_decode", data=data.encode("utf-8"), timeout=60)
-                result = json.loads(rsp._content)
-                return result
-            except Exception as e:
-                trial += 1
-                logger.info(f"failed to dwg_decode {self.url}/dwg_decode/{dwg_file_path}")
-                time.sleep(0.1)
-                return None
+        # DWG文件在上传它的节点上, 上传时发生过故障转移则在哈希环上的下一个节点, 节点返回404时继续尝试
+        rsp = self._request("GET", "/dwg_decode", self._file_nodes(file_id_of(dwg_file_path)), next_on_404=True,
+                            idempotent=False, data=data.encode("utf-8"), timeout=timeout,
+                            headers={TIMEOUT_HEADER: str(timeout)})
+        if rsp is None:
+            logger.info(f"failed to dwg_decode /dwg_decode/{dwg_file_path}")
+            return None
+        return json.loads(rsp._content)
 
-    def _interface_call(self, instance, interface):
+    def _interface_call(self, instance, interface, timeout=60):
         data = json.dumps(instance, ensure_ascii=False)
 
-        trial = 0
-        retry = 3
-        while trial < retry:
-            try:
-                rsp = requests.get(url=f"{self.url}/{interface}", data=data.encode("utf-8"), timeout=60)
-                result = json.loads(rsp._content)["task_results"]
-                return result
-            except Exception as e:
-                trial += 1
-                logger.info(f"failed to get {self.url}/{interface}")
-                time.sleep(0.1)
-                # raise Exception(f"failed to get {self.url}/{interface}")
-                return None
+        rsp = self._request("GET", f"/{interface}", self.pool.least_loaded(), idempotent=False,
+                            data=data.encode("utf-8"), timeout=timeout, headers={TIMEOUT_HEADER: str(timeout)})
+        try:
+            result = json.loads(rsp._content)["task_results"]
+            return result
+        except Exception as e:
+            logger.info(f"failed to get /{interface}, exception={e}")
+            return None
+
+    def bulk(self, instances, interface, timeout=600):
+        """一次HTTP调用提交多个实例, 按输入顺序返回各实例的task_results, 失败的实例为None"""
+        data = json.dumps({"instances": instances}, ensure_ascii=False)
+        rsp = self._request("POST", f"/{interface}/bulk", self.pool.least_loaded(), data=data.encode("utf-8"),
+                            timeout=timeout, headers={TIMEOUT_HEADER: str(timeout)})
+        try:
+            results = json.loads(rsp._content)["results"]
+        except Exception as e:
+            logger.info(f"failed to bulk /{interface}/bulk, exception={e}")
+            return None
+        return [r.get("task_results") if r.get("task_status") == "finished" else None for r in results]
+
+    def bulk_stream(self, instances, interface, timeout=600):
+        """批量调用, 按完成先后逐个产出 (输入序号, 任务结果)"""
+        data = json.dumps({"instances": instances, "stream": True}, ensure_ascii=False)
+        rsp = self._request("POST", f"/{interface}/bulk", self.pool.least_loaded(), data=data.encode("utf-8"),
+                            stream=True, timeout=timeout, headers={TIMEOUT_HEADER: str(timeout)})
+        if rsp is None:
+            return
+        for line in rsp.iter_lines(decode_unicode=True):
+            if line:
+                result = json.loads(line)
+                yield result["index"], result
+
+    def stream(self, instance, interface):
+        """流式调用, 逐个产出服务端推送的SSE事件 (event, data)"""
+        data = json.dumps(instance, ensure_ascii=False)
+        rsp = self._request("GET", f"/{interface}/stream", self.pool.least_loaded(), idempotent=False,
+                            data=data.encode("utf-8"), stream=True, timeout=60)
+        if rsp is None:
+            return
+        event = None
+        for line in rsp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):].strip())
+
+    def submit(self, instance, interface, callback_url=None):
+        """异步提交任务, 返回task_id"""
+        request = dict(instance, submit_mode="async")
+        if callback_url is not None:
+            request["callback_url"] = callback_url
+        data = json.dumps(request, ensure_ascii=False)
+
+        rsp = self._request("GET", f"/{interface}", self.pool.least_loaded(), idempotent=False,
+                            data=data.encode("utf-8"), timeout=60)
+        try:
+            result = json.loads(rsp._content)["task_id"]
+        except Exception as e:
+            logger.info(f"failed to submit /{interface}, exception={e}")
+            return None
+        self.task_nodes[result] = self._node_of(rsp)
+        return result
+
+    def get_task(self, task_id):
+        """查询异步任务, 返回任务状态和结果; 不是本客户端提交的任务依次询问所有节点"""
+        node = self.task_nodes.get(task_id)
+        nodes = [node] if node is not None else self.urls
+        rsp = self._request("GET", f"/tasks/{task_id}", nodes, next_on_404=True, timeout=60)
+        if rsp is None or rsp.status_code == 404:
+            return None
+        try:
+            return json.loads(rsp._content)
+        except Exception as e:
+            logger.info(f"failed to get /tasks/{task_id}, exception={e}")
+            return None
+
+    def wait_task(self, task_id, interval=1.0, timeout=3600):
+        """轮询异步任务直到结束, 返回task_results"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            result = self.get_task(task_id)
+            if result is not None and result["task_status"] in ["finished", "failed"]:
+                return result["task_results"]
+            time.sleep(interval)
+        return None
 
 
 if __name__ == '__main__':
@@ -0,0 +1,152 @@
+import time
+import logging
+from collections import deque
+from queue import Empty, Full
+from threading import Condition, Lock
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PRIORITY_WEIGHTS = {
+    "interactive": 16,
+    "normal": 4,
+    "bulk": 1,
+}
+
+
+class StrideScheduler(object):
+    """
+    加权公平调度(stride scheduling): 每个flow维护pass值, 每次出队选pass最小的非空flow, 出队后pass += 1/weight
+    空闲后重新活跃的flow从当前虚拟时间开始计算, 不会积攒额度
+    """
+
+    def __init__(self, weight_func=None):
+        self.weight_func = weight_func if weight_func is not None else (lambda key: 1)
+        self.flows = {}
+        self.passes = {}
+        self.vtime = 0.0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, key, item):
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = deque()
+            self.passes[key] = self.vtime
+        flow.append(item)
+        self.size += 1
+
+    def pop(self):
+        key = min(self.flows, key=lambda k: self.passes[k])
+        flow = self.flows[key]
+        item = flow.popleft()
+        self.size -= 1
+        self.vtime = self.passes[key]
+        self.passes[key] += 1.0 / max(self.weight_func(key), 1e-6)
+        if not flow:
+            del self.flows[key]
+            del self.passes[key]
+        return key, item
+
+    def depths(self):
+        return {key: len(flow) for key, flow in self.flows.items()}
+
+
+class FairQueue(object):
+    """
+    与queue.Queue接口兼容的优先级+租户公平队列
+    第一层按优先级类别(interactive/normal/bulk)加权调度, 第二层在同一类别内按租户加权公平调度,
+    单个租户的大批量任务不会饿死其他租户, bulk任务也始终能按权重获得调度
+    """
+
+    def __init__(self, maxsize=0, priority_weights=None, default_priority="normal", tenant_weights=None):
+        self.maxsize = maxsize
+        self.priority_weights = priority_weights if priority_weights is not None else dict(PRIORITY_WEIGHTS)
+        assert default_priority in self.priority_weights, f"default_priority {default_priority} not in {self.priority_weights}"
+        self.default_priority = default_priority
+        self.tenant_weights = tenant_weights if tenant_weights is not None else {}
+        self.priority_scheduler = StrideScheduler(weight_func=lambda priority: self.priority_weights[priority])
+        self.tenant_schedulers = {
+            priority: StrideScheduler(weight_func=lambda tenant: self.tenant_weights.get(tenant, 1))
+            for priority in self.priority_weights
+        }
+        self.mutex = Lock()
+        self.not_empty = Condition(self.mutex)
+        self.not_full = Condition(self.mutex)
+
+    def _classify(self, item):
+        priority = getattr(item, "priority", None) or self.default_priority
+        if priority not in self.priority_weights:
+            priority = self.default_priority
+        tenant = getattr(item, "tenant", None) or ""
+        return priority, tenant
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.priority_scheduler)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        with self.mutex:
+            return 0 < self.maxsize <= len(self.priority_scheduler)
+
+    def put(self, item, block=True, timeout=None):
+        priority, tenant = self._classify(item)
+        with self.not_full:
+            if self.maxsize > 0:
+                if not block:
+                    if len(self.priority_scheduler) >= self.maxsize:
+                        raise Full
+                elif timeout is None:
+                    while len(self.priority_scheduler) >= self.maxsize:
+                        self.not_full.wait()
+                else:
+                    endtime = time.time() + timeout
+                    while len(self.priority_scheduler) >= self.maxsize:
+                        remaining = endtime - time.time()
+                        if remaining <= 0:
+                            raise Full
+                        self.not_full.wait(remaining)
+            self.priority_scheduler.push(priority, None)
+            self.tenant_schedulers[priority].push(tenant, item)
+            self.not_empty.notify()
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not block:
+                if not len(self.priority_scheduler):
+                    raise Empty
+            elif timeout is None:
+                while not len(self.priority_scheduler):
+                    self.not_empty.wait()
+            else:
+                endtime = time.time() + timeout
+                while not len(self.priority_scheduler):
+                    remaining = endtime - time.time()
+                    if remaining <= 0:
+                        raise Empty
+                    self.not_empty.wait(remaining)
+            priority, _ = self.priority_scheduler.pop()
+            _, item = self.tenant_schedulers[priority].pop()
+            self.not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def to_dict(self):
+        with self.mutex:
+            return {
+                "size": len(self.priority_scheduler),
+                "maxsize": self.maxsize,
+                "priority_weights": dict(self.priority_weights),
+                "depths": {priority: scheduler.depths() for priority, scheduler in self.tenant_schedulers.items() if len(scheduler)},
+            }
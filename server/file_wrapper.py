@@ -0,0 +1,58 @@
+import os
+import socket
+import logging
+from werkzeug.wsgi import FileWrapper
+from werkzeug.serving import WSGIRequestHandler
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class SendfileWrapper(FileWrapper):
+    """
+    send_file返回的文件在werkzeug开发服务器上默认按8KB读出再写入socket,
+    这里改为先发出响应头, 再用socket.sendfile由内核直接把文件写到连接上(Linux下为零拷贝, 其他平台自动退化为普通发送)
+    Range请求由werkzeug的_RangeWrapper调用seek后按块读取, 此时不使用sendfile
+    """
+
+    def __init__(self, file, buffer_size, connection):
+        super().__init__(file, buffer_size)
+        self.connection = connection
+        try:
+            self.size = os.fstat(file.fileno()).st_size
+        except (AttributeError, OSError):
+            # BytesIO等没有文件描述符的对象按块读取
+            self.size = None
+        self.ranged = False
+        self.headers_sent = False
+        self.sent = False
+
+    def seek(self, *args):
+        self.ranged = True
+        super().seek(*args)
+
+    def __next__(self):
+        if self.ranged or self.size is None:
+            return super().__next__()
+        if not self.headers_sent:
+            # werkzeug在第一次写入(即使是空数据)时发出响应头
+            self.headers_sent = True
+            return b""
+        if self.sent:
+            raise StopIteration()
+        self.sent = True
+        offset = self.file.tell()
+        self.connection.sendfile(self.file, offset, self.size - offset)
+        raise StopIteration()
+
+
+class SendfileRequestHandler(WSGIRequestHandler):
+    """为werkzeug开发服务器提供wsgi.file_wrapper, 使send_file走socket.sendfile"""
+
+    def make_environ(self):
+        environ = super().make_environ()
+        if isinstance(self.connection, socket.socket):
+            connection = self.connection
+            environ["wsgi.file_wrapper"] = lambda file, buffer_size=8192: SendfileWrapper(file, buffer_size, connection)
+        return environ
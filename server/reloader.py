@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import base64
+import select
+import socket
+import logging
+import subprocess
+from threading import Thread, Lock, Condition
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# 新进程从父进程继承的监听socket和就绪通知管道
+LISTEN_FD_ENV = "REMOTE_SERVER_LISTEN_FD"
+READY_FD_ENV = "REMOTE_SERVER_READY_FD"
+# 其他监听socket(如asyncio服务端口)按名称传递: REMOTE_SERVER_LISTEN_FD_<NAME>
+# Windows不能继承socket句柄: 父进程用socket.share()生成各socket的数据, 经新进程的stdin传入(一行JSON),
+# 新进程用socket.fromshare()还原; 就绪通知改为连接父进程在本机监听的端口
+LISTEN_SHARE_ENV = "REMOTE_SERVER_LISTEN_SHARE"
+READY_ADDR_ENV = "REMOTE_SERVER_READY_ADDR"
+# 主HTTP服务的socket名称
+HTTP_SOCKET = "http"
+
+
+def handover_mode():
+    """监听socket交给新进程的方式: fd(posix继承描述符)、share(Windows socket.share), 都不支持时为restart"""
+    if os.name == "posix":
+        return "fd"
+    if hasattr(socket.socket, "share"):
+        return "share"
+    return "restart"
+
+
+class RequestTracker(object):
+    """WSGI中间件, 统计未结束的请求; 流式响应(NDJSON、SSE、文件下载)在响应体发送完、被close后才算结束"""
+
+    def __init__(self, app):
+        self.app = app
+        self.active = 0
+        self.cond = Condition()
+
+    def _done(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def __call__(self, environ, start_response):
+        with self.cond:
+            self.active += 1
+        try:
+            iterable = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return ClosingIterator(iterable, self._done)
+
+    def wait_idle(self, timeout):
+        """等待所有请求结束, 超时返回False"""
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.active > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+
+class GracefulReloader(object):
+    """
+    平滑重启:
+    1. 启动新进程并把监听socket交给它, 新进程完成预热(连接池等)后通过管道通知就绪
+    2. 旧进程停止accept, 新连接全部由新进程接收
+    3. 旧进程排空各Service中排队和执行中的任务后退出
+    posix上新进程继承socket描述符, Windows上用socket.share/fromshare复制socket, 两种方式端口都不会中断;
+    两者都不支持的平台退化为: 停止接收 -> 排空 -> 关闭socket -> 启动新进程, 期间端口不可用
+    排空时除各Service的任务外, 还等待所有未结束的HTTP请求(上传、下载、bulk/SSE流)和通过listen_socket注册的其他服务
+    """
+
+    def __init__(self, app, services, drain_timeout=300, ready_timeout=120, warmups=None, request_handler=None):
+        self.tracker = RequestTracker(app)
+        self.app = self.tracker
+        self.request_handler = request_handler
+        # 名称 -> 额外的监听socket, 重启时一并交给新进程
+        self.sockets = {}
+        # 停止接收时调用的(stop, wait)对, wait(timeout)在排空时等待其结束
+        self.stop_hooks = []
+        self.services = services
+        self.drain_timeout = drain_timeout
+        self.ready_timeout = ready_timeout
+        self.warmups = warmups if warmups is not None else []
+        self.httpd = None
+        self.reloading = False
+        self.respawn_after_drain = False
+        self.lock = Lock()
+        # Windows上从父进程收到的socket数据, 名称 -> socket.share()的结果
+        self.shared = None
+        self.shared_lock = Lock()
+
+    def serve(self, host, port):
+        """阻塞服务直到重启或关闭, 返回前完成排空"""
+        sock = self._inherited_socket(HTTP_SOCKET)
+        self.httpd = make_server(host, int(port), self.app, threaded=True, request_handler=self.request_handler,
+                                 fd=sock.fileno() if sock is not None else None)
+        if sock is not None:
+            # make_server复制了一份描述符
+            sock.close()
+
+        for warmup in self.warmups:
+            try:
+                warmup()
+            except Exception as e:
+                logger.info(f"warmup {warmup} failed, exception={e}")
+        self._notify_ready()
+
+        logger.info(f"start serving, PID: {os.getpid()}, inherited socket: {sock is not None}")
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        logger.info(f"stop accepting, PID: {os.getpid()}, begin to drain")
+        for stop, _ in self.stop_hooks:
+            try:
+                stop()
+            except Exception as e:
+                logger.info(f"stop hook {stop} failed, exception={e}")
+        self.drain()
+        self.httpd.server_close()
+        if self.respawn_after_drain:
+            self._spawn()
+
+    def listen_socket(self, name, host, port, bind_timeout=600):
+        """
+        名为name的监听socket: 平滑重启后的新进程从父进程继承, 否则新建;
+        端口仍被退出中的旧进程占用时(Windows上先排空再启动新进程)每秒重试, 直到bind_timeout
+        """
+        sock = self._inherited_socket(name)
+        if sock is None:
+            deadline = time.time() + bind_timeout
+            while True:
+                try:
+                    sock = socket.create_server((host, int(port)))
+                    break
+                except OSError as e:
+                    if time.time() >= deadline:
+                        raise
+                    logger.info(f"bind {name} {host}:{port} failed, exception={e}, retry")
+                    time.sleep(1)
+        self.sockets[name] = sock
+        return sock
+
+    def _shared_sockets(self):
+        """Windows上新进程第一次取socket时从stdin读入父进程share的数据"""
+        with self.shared_lock:
+            if self.shared is None:
+                self.shared = {}
+                if os.environ.pop(LISTEN_SHARE_ENV, None) == "1":
+                    line = sys.stdin.buffer.readline()
+                    self.shared = {name: base64.b64decode(data) for name, data in json.loads(line).items()}
+            return self.shared
+
+    def _inherited_socket(self, name):
+        """从父进程接手的名为name的监听socket, 不是平滑重启启动的进程返回None"""
+        if os.name == "posix":
+            env_name = LISTEN_FD_ENV if name == HTTP_SOCKET else f"{LISTEN_FD_ENV}_{name.upper()}"
+            fd = os.environ.pop(env_name, None)
+            return None if fd is None else socket.socket(fileno=int(fd))
+        data = self._shared_sockets().pop(name, None)
+        return None if data is None else socket.fromshare(data)
+
+    def add_stop_hook(self, stop, wait=None):
+        """旧进程停止接收时调用stop(), 排空时调用wait(timeout)等待其处理完已接收的请求"""
+        self.stop_hooks.append((stop, wait))
+
+    def _notify_ready(self):
+        ready_fd = os.environ.pop(READY_FD_ENV, None)
+        if ready_fd is not None:
+            os.write(int(ready_fd), b"1")
+            os.close(int(ready_fd))
+        ready_addr = os.environ.pop(READY_ADDR_ENV, None)
+        if ready_addr is not None:
+            host, port = ready_addr.rsplit(":", 1)
+            with socket.create_connection((host, int(port)), timeout=10) as conn:
+                conn.sendall(b"1")
+
+    def _spawn(self, pass_fds=(), env=None, stdin=None):
+        return subprocess.Popen([sys.executable] + sys.argv, pass_fds=pass_fds, env=env, stdin=stdin)
+
+    def reload(self):
+        """后台执行重启, 已在重启中返回False"""
+        with self.lock:
+            if self.reloading or self.httpd is None:
+                return False
+            self.reloading = True
+        Thread(target=self._reload, daemon=True).start()
+        return True
+
+    def shutdown(self):
+        """停止接收并排空后退出, 不启动新进程"""
+        if self.httpd is not None:
+            Thread(target=self.httpd.shutdown, daemon=True).start()
+
+    def _reload(self):
+        mode = handover_mode()
+        if mode == "restart":
+            logger.info("platform can not hand over listening sockets, port is closed during drain and restart")
+            self.respawn_after_drain = True
+            self.httpd.shutdown()
+            return
+
+        child, ready = self._handover_fd() if mode == "fd" else self._handover_share()
+        if not ready:
+            logger.info(f"reload failed, new process {child.pid} not ready in {self.ready_timeout} s, keep serving")
+            child.kill()
+            with self.lock:
+                self.reloading = False
+            return
+
+        logger.info(f"new process {child.pid} ready, old process {os.getpid()} stop accepting")
+        self.httpd.shutdown()
+
+    def _listen_sockets(self):
+        return dict(self.sockets, **{HTTP_SOCKET: self.httpd.socket})
+
+    def _handover_fd(self):
+        """posix: 新进程继承socket描述符, 通过管道通知就绪, 返回(新进程, 是否就绪)"""
+        r, w = os.pipe()
+        env = dict(os.environ)
+        env[READY_FD_ENV] = str(w)
+        pass_fds = [w]
+        for name, sock in self._listen_sockets().items():
+            env_name = LISTEN_FD_ENV if name == HTTP_SOCKET else f"{LISTEN_FD_ENV}_{name.upper()}"
+            env[env_name] = str(sock.fileno())
+            pass_fds.append(sock.fileno())
+        try:
+            child = self._spawn(pass_fds=tuple(pass_fds), env=env)
+        finally:
+            os.close(w)
+
+        try:
+            readable, _, _ = select.select([r], [], [], self.ready_timeout)
+            ready = bool(readable) and os.read(r, 1) == b"1"
+        finally:
+            os.close(r)
+        return child, ready
+
+    def _handover_share(self):
+        """Windows: 按新进程的PID share各socket, 经stdin传入; 新进程连接本机端口通知就绪, 返回(新进程, 是否就绪)"""
+        with socket.create_server(("127.0.0.1", 0)) as ready_server:
+            ready_server.settimeout(self.ready_timeout)
+            env = dict(os.environ)
+            env[LISTEN_SHARE_ENV] = "1"
+            env[READY_ADDR_ENV] = f"127.0.0.1:{ready_server.getsockname()[1]}"
+            child = self._spawn(env=env, stdin=subprocess.PIPE)
+            try:
+                shared = {name: base64.b64encode(sock.share(child.pid)).decode("ascii")
+                          for name, sock in self._listen_sockets().items()}
+                child.stdin.write(json.dumps(shared).encode("utf-8") + b"\n")
+                child.stdin.close()
+                conn, _ = ready_server.accept()
+                with conn:
+                    conn.settimeout(self.ready_timeout)
+                    ready = conn.recv(1) == b"1"
+            except OSError as e:
+                logger.info(f"hand over sockets to {child.pid} failed, exception={e}")
+                ready = False
+        return child, ready
+
+    def drain(self):
+        for service in self.services:
+            service.accepting = False
+
+        deadline = time.time() + self.drain_timeout
+        for service in self.services:
+            service.drain(timeout=max(0, deadline - time.time()))
+        # bulk/SSE流依赖Service消费线程, 先等请求结束再停止Service
+        if not self.tracker.wait_idle(max(0, deadline - time.time())):
+            logger.info(f"drain timeout, {self.tracker.active} requests still active")
+        for _, wait in self.stop_hooks:
+            if wait is not None:
+                wait(max(0, deadline - time.time()))
+        for service in self.services:
+            service.stop()
+        # 等待请求线程把最后的响应写回
+        time.sleep(1)
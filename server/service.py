@@ -3,159 +3,737 @@ import os
 import json
 import logging
 import argparse
-from flask import Flask, request
+from flask import Flask, request, Response
 from task import Task
-from queue import Queue, Empty
-from threading import Thread
+from task_registry import notify_webhook
+from batcher import AdaptiveBatcher
+from admission import AdmissionController
+from fair_queue import FairQueue
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock
+from concurrent.futures import ProcessPoolExecutor
 import time
-# from utils.metrics_utils import MetricsHelper, mcli
+import hashlib
+from utils.metrics_utils import MetricsHelper, mcli
+from utils.trace_utils import use_trace
+from utils.deadline_utils import use_deadline
+from utils.json_utils import encode_body
+from service_metrics import QUEUE_DEPTH, QUEUE_WAIT, HANDLER_LATENCY, BATCH_SIZE, TASKS_TOTAL, SHED_TOTAL, INFLIGHT, \
+    COALESCED_TOTAL
 
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# 客户端愿意等待的秒数, 与请求体中的timeout字段等价, 超时的任务出队时直接丢弃
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+# process模式下每个子进程持有一份handler, 只在进程池初始化时传递一次
+_PROCESS_HANDLER = None
+
+
+def _process_init(handler):
+    global _PROCESS_HANDLER
+    _PROCESS_HANDLER = handler
+
+
+def _process_handle(instance, deadline=None):
+    with use_deadline(deadline):
+        return _PROCESS_HANDLER(instance)
+
+
+def format_sse(event, data):
+    """Server-Sent Events 格式的一条事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def encode_response(body, status=200):
+    """按请求的Accept-Encoding压缩响应体, 客户端不接受或响应较小时原样返回"""
+    data, encoding = encode_body(body, request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return body, status
+    return Response(data, status=status, mimetype="application/json",
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+
+
+def process_handler(func):
+    """
+    标记handler默认在进程池中执行(consume_type="process"), 适用于在Python中做大量计算、会长时间占用GIL的handler
+    内置的handler都不需要: 大模型agent在等待网络, DWG解码在CheckCADTool子进程中执行, 线程等待时已释放GIL,
+    放到进程池只会多一次参数和结果的序列化; handler及其持有的对象需要能被pickle
+    """
+    func.consume_type = "process"
+    return func
+
 
 class Service(object):
-    def __init__(self, name, interface, handler, server=None, qps=256, max_batch_size=128, consume_type="single", consume_worker=1):
+    def __init__(self, name, interface, handler, server=None, qps=256, max_batch_size=128, consume_type=None, consume_worker=1, task_timeout=600, registry=None,
+                 max_wait_ms=10, target_latency_ms=1000, max_queue_depth=None, max_queue_wait_ms=None,
+                 priority_weights=None, tenant_weights=None, trace_exporter=None, min_worker=None, max_worker=None,
+                 coalesce=False, stream_handler=None, max_bulk_size=1000):
         self.name = name
         self.interface = interface
         self.handler = handler
         self.qps = qps
         self.latency = 1 / qps
         self.max_batch_size = max_batch_size
+        self.batcher = AdaptiveBatcher(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                       target_latency_ms=target_latency_ms)
         self.consume_worker = consume_worker
-        self.queue = Queue(10 * self.qps)
+        self.min_worker = min_worker if min_worker is not None else consume_worker
+        self.max_worker = max_worker if max_worker is not None else consume_worker
+        assert 1 <= self.min_worker <= consume_worker <= self.max_worker, \
+            f"need 1 <= min_worker {self.min_worker} <= consume_worker {consume_worker} <= max_worker {self.max_worker}"
+        self.task_timeout = task_timeout
+        self.registry = registry
+        self.trace_exporter = trace_exporter
+        self.queue = FairQueue(10 * self.qps, priority_weights=priority_weights, tenant_weights=tenant_weights)
+        self.admission = AdmissionController(max_queue_depth=max_queue_depth, max_queue_wait_ms=max_queue_wait_ms)
+        self.accepting = True
+        self.inflight = 0
+        self.active_requests = 0
+        # 排队和执行中的任务, 供存储清理时跳过任务引用的文件
+        self.live_tasks = {}
+        self.state_lock = Lock()
+        self.stop_event = Event()
+        self.coalesce = coalesce
+        self.coalesce_leaders = {}
+        # 每个合并key上仍在等待结果的请求数(leader自身 + 跟随者, 异步提交的请求一直计入)
+        self.coalesce_waiters = {}
+        self.stream_handler = stream_handler
+        self.max_bulk_size = max_bulk_size
         self.interface_func = self._build_interface_func()
 
-        if consume_type == "single":
+        if consume_type is None:
+            consume_type = getattr(handler, "consume_type", "single")
+        self.consume_type = consume_type
+        self.executor = None
+        if consume_type in ["single", "process"]:
             self.consume_func = self._consume
         elif consume_type == "batch":
             self.consume_func = self._batch_consume
         else:
             raise ValueError(f"not support consume_type {consume_type}")
         self.consume_process = [Thread(target=self.consume_func, args=(i,)) for i in range(self.consume_worker)]
+        self.retire_events = {i: Event() for i in range(self.consume_worker)}
+        self.next_worker_id = self.consume_worker
+        self.listening = False
+
+        self.labels = {"service": self.name, "mode": "thread"}
+        mcli.register_collector(self._collect_metrics)
 
         if server is not None:
             server.add_url_rule(f'{interface}', view_func=self.interface_func)
+            server.add_url_rule(f'{interface}/bulk', view_func=self._build_bulk_func(), methods=['GET', 'POST'])
+            if self.stream_handler is not None and self.consume_type != "batch":
+                server.add_url_rule(f'{interface}/stream', view_func=self._build_stream_func())
 
     def _build_interface_func(self):
         def interface_func():
             time0 = time.time() * 1000
             logger.info(f"{self.name}: func call {time0}")
 
-            tags = {
-                'traffic': "upstream",
-                'interface': self.interface,
-            }
+            self._add_active_requests(1)
+            try:
+                with MetricsHelper(name="service_request_latency_seconds", tags=self.labels):
+                    req_data, bad_request = self._parse_request()
+                    if bad_request is not None:
+                        return bad_request
+                    task = self._create_task(req_data)
+                    if req_data.get("submit_mode") == "async":
+                        return self._submit_async(task)
+
+                    timeout = self._wait_timeout(task)
+                    if not self._coalesce(task):
+                        rejected = self._enqueue(task)
+                        if rejected is not None:
+                            return rejected
+                    logger.info(f"{self.name}: put task")
+                    if not task.wait(timeout=timeout):
+                        body = self._abandon(task, timeout)
+                        if body is not None:
+                            return encode_response(body)
+
+                time1 = time.time() * 1000
+                logger.info(f"{self.name} task: {task} {task.task_status} {time1}.")
+                logger.info(f"{self.name} task: time diff {time1 - time0} ms.")
+                return encode_response(self._serialize(task))
+            finally:
+                self._add_active_requests(-1)
+
+        interface_func.__name__ = f"{self.name}_{self.handler.__class__.__name__}"
+
+        return interface_func
+
+    def _build_stream_func(self):
+        def stream_func():
+            req_data, bad_request = self._parse_request()
+            if bad_request is not None:
+                return bad_request
+            task = self._create_task(req_data)
+            if req_data.get("submit_mode") == "async":
+                return self._submit_async(task)
+
+            # SSE连接打开期间计为活跃请求, 排空和热重载会等它发送完
+            self._add_active_requests(1)
+            try:
+                response = self._stream(task)
+            except Exception:
+                self._add_active_requests(-1)
+                raise
+            if not isinstance(response, Response):
+                self._add_active_requests(-1)
+                return response
+            response.call_on_close(lambda: self._add_active_requests(-1))
+            return response
+
+        stream_func.__name__ = f"{self.name}_{self.handler.__class__.__name__}_stream"
+
+        return stream_func
+
+    def _build_bulk_func(self):
+        def bulk_func():
+            """
+            一次提交多个实例: 请求体为实例列表或 {"instances": [...], "stream": false},
+            各实例作为独立任务分发给所有worker, 结果按输入顺序返回;
+            stream为true时以NDJSON逐行返回先完成的结果, 每行带输入序号index
+            """
+            try:
+                req_data = json.loads(request.data.decode("utf-8"))
+            except ValueError as e:
+                return self._bad_request(f"bulk invalid json, exception={e}")
+            if isinstance(req_data, list):
+                instances, stream = req_data, False
+            elif isinstance(req_data, dict):
+                instances, stream = req_data.get("instances", []), req_data.get("stream", False)
+            else:
+                return self._bad_request("bulk body must be a list or an object with instances")
+            if not isinstance(instances, list):
+                return self._bad_request("bulk instances must be a list")
+            if len(instances) > self.max_bulk_size:
+                return json.dumps({
+                    "task_status": "rejected",
+                    "message": f"{self.name} bulk size {len(instances)} exceeds {self.max_bulk_size}",
+                }, ensure_ascii=False), 413
+            # 先校验全部实例, 避免部分实例已入队后才发现错误
+            for index, instance in enumerate(instances):
+                message = self._check_instance(instance)
+                if message is not None:
+                    return self._bad_request(f"bulk instance {index}: {message}")
+
+            self._add_active_requests(1)
+            try:
+                response = self._bulk(instances, stream)
+            except Exception:
+                self._add_active_requests(-1)
+                raise
+            if stream:
+                # 流式响应发送完或客户端断开时才结束
+                response.call_on_close(lambda: self._add_active_requests(-1))
+            else:
+                self._add_active_requests(-1)
+            return response
+
+        bulk_func.__name__ = f"{self.name}_{self.handler.__class__.__name__}_bulk"
+
+        return bulk_func
 
-            # with MetricsHelper(name=self.name, tags=tags):
+    def _bad_request(self, message):
+        return json.dumps({
+            "task_status": "rejected",
+            "message": f"{self.name} {message}",
+        }, ensure_ascii=False), 400
+
+    def _parse_request(self):
+        """解析请求体, 返回(请求字典, None); 不是JSON对象时返回(None, 400响应)"""
+        try:
             req_data = json.loads(request.data.decode("utf-8"))
-            task = Task(request_data=req_data)
-            self.queue.put(task)
-            logger.info(f"{self.name}: put task")
+        except ValueError as e:
+            return None, self._bad_request(f"invalid json, exception={e}")
+        if not isinstance(req_data, dict):
+            return None, self._bad_request("body must be a json object")
+        return req_data, None
+
+    @staticmethod
+    def _check_instance(instance):
+        """bulk中单个实例的格式问题, 没有问题时返回None"""
+        if not isinstance(instance, dict):
+            return f"must be an object, got {type(instance).__name__}"
+        timeout = instance.get("timeout")
+        if timeout is None:
+            return None
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            return f"invalid timeout {timeout!r}"
+        if not timeout >= 0:
+            return f"invalid timeout {timeout!r}"
+        return None
+
+    def _stream(self, task):
+        """入队流式任务, 返回SSE响应; 整个流按任务的deadline(没有时为task_timeout)限时"""
+        timeout = self._wait_timeout(task)
+        deadline = time.time() + timeout
+        task.stream_queue = Queue()
+        task.add_done_callback(lambda t: t.stream_queue.put(None))
+        rejected = self._enqueue(task)
+        if rejected is not None:
+            return rejected
+        logger.info(f"{self.name}: put stream task {task}")
+
+        def generate():
             while True:
-                time.sleep(self.latency)
-                if task.task_status in ["finished", "failed"]:
+                try:
+                    event = task.stream_queue.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    logger.info(f"{self.name} task: {task} stream timeout after {timeout} s.")
+                    task.set_failed()
                     break
+                if event is None:
+                    break
+                yield format_sse(event["event"], event["data"])
+            yield format_sse("done", task.to_dict())
 
-            time1 = time.time() * 1000
-            logger.info(f"{self.name} task: {task.to_dict()} {time1}.")
-            logger.info(f"{self.name} task: time diff {time1 - time0} ms.")
-            return json.dumps(task.to_dict(), ensure_ascii=False)
+        return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
-        interface_func.__name__ = f"{self.name}_{self.handler.__class__.__name__}"
+    def _bulk(self, instances, stream):
+        """入队bulk的各实例并返回响应, 每个实例按自己的deadline(没有时为task_timeout)等待"""
+        done_queue = Queue()
+        tasks, timeouts, deadlines, rejected, timed_out = [], [], [], {}, {}
+        for index, instance in enumerate(instances):
+            task = self._create_task(instance)
+            tasks.append(task)
+            timeouts.append(self._wait_timeout(task))
+            deadlines.append(time.time() + timeouts[-1])
+            if not self._coalesce(task):
+                response = self._enqueue(task)
+                if response is not None:
+                    rejected[index] = response[0]
+            if self.trace_exporter is not None:
+                task.add_done_callback(lambda t: self.trace_exporter.export(t.trace, service=self.name))
+            task.add_done_callback(lambda t, index=index: done_queue.put(index))
+        logger.info(f"{self.name}: put bulk {len(tasks)} tasks, rejected {len(rejected)}")
 
-        return interface_func
+        def expire(index):
+            # 超时时即固定响应体, 之后worker仍可能完成该任务并覆盖状态
+            timed_out[index] = self._abandon(tasks[index], timeouts[index]) or tasks[index].to_json()
+
+        def item(index):
+            body = rejected.get(index) or timed_out.get(index) or tasks[index].to_json()
+            return '{"index": ' + str(index) + ', ' + body[1:]
+
+        def generate():
+            pending = set(range(len(tasks)))
+            while pending:
+                try:
+                    index = done_queue.get(timeout=max(min(deadlines[i] for i in pending) - time.time(), 0))
+                except Empty:
+                    # 到期未完成的任务同样逐行返回
+                    now = time.time()
+                    for index in sorted(i for i in pending if deadlines[i] <= now):
+                        pending.discard(index)
+                        expire(index)
+                        yield item(index) + "\n"
+                    continue
+                # 超时后才完成的leader会再次放入done_queue, 忽略
+                if index in pending:
+                    pending.discard(index)
+                    yield item(index) + "\n"
+
+        if stream:
+            return Response(generate(), mimetype="application/x-ndjson")
+
+        for index, task in enumerate(tasks):
+            if not task.wait(timeout=max(deadlines[index] - time.time(), 0)):
+                expire(index)
+        body = '{"results": [' + ", ".join(item(index) for index in range(len(tasks))) + ']}'
+        return encode_response(body)
+
+    def _create_task(self, req_data):
+        task = Task(request_data=req_data)
+        timeout = request.headers.get(TIMEOUT_HEADER)
+        if timeout:
+            try:
+                task.set_timeout(timeout)
+            except ValueError:
+                logger.info(f"{self.name}: invalid {TIMEOUT_HEADER} {timeout}")
+        return task
+
+    def _call_stream_handler(self, task):
+        """执行流式handler, 中间事件转发到task.stream_queue, 返回result事件中的结果"""
+        result = None
+        for event in self.stream_handler(task.payload()):
+            if event["event"] == "result":
+                result = event["data"]
+            else:
+                task.stream_queue.put(event)
+        return result
+
+    def _submit_async(self, task):
+        """异步提交: 立即返回task_id, 结果通过 /tasks/<task_id> 查询或回调callback_url"""
+        if self.registry is None:
+            return json.dumps({
+                "task_id": task.task_id,
+                "task_status": "failed",
+                "message": f"{self.name} not support async submit",
+            }, ensure_ascii=False), 400
+
+        response = json.dumps({"task_id": task.task_id, "task_status": task.task_status}, ensure_ascii=False)
+        if not self._coalesce(task):
+            rejected = self._enqueue(task)
+            if rejected is not None:
+                return rejected
+
+        self.registry.register(task)
+        callback_url = task.request_data.get("callback_url")
+        if callback_url:
+            task.add_done_callback(lambda t: notify_webhook(callback_url, t))
+        if self.trace_exporter is not None:
+            task.add_done_callback(lambda t: self.trace_exporter.export(t.trace, service=self.name))
+        logger.info(f"{self.name}: submit task {task}")
+        return response, 202
+
+    @staticmethod
+    def coalesce_key(task):
+        """handler可见字段规范化(字符串去首尾空白, 字典按键排序)后的摘要"""
+        payload = task.payload()
+        for key in ["task_id", "task_status", "task_results"]:
+            payload.pop(key, None)
+        payload = {k: v.strip() if isinstance(v, str) else v for k, v in payload.items()}
+        data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def _coalesce(self, task):
+        """相同请求已在排队或执行时, 合并到该请求上并返回True; 否则登记为leader并返回False"""
+        if not self.coalesce:
+            return False
+
+        key = self.coalesce_key(task)
+        with self.state_lock:
+            leader = self.coalesce_leaders.get(key)
+            if leader is None:
+                self.coalesce_leaders[key] = task
+                self.coalesce_waiters[key] = 1
+            else:
+                self.coalesce_waiters[key] += 1
+                if leader.deadline is not None:
+                    # leader要替所有跟随者执行, deadline取其中最宽松的
+                    leader.deadline = None if task.deadline is None else max(leader.deadline, task.deadline)
+        if leader is None:
+            task.add_done_callback(lambda t: self._release_leader(key, t))
+            return False
+
+        logger.info(f"{self.name}: coalesce task {task} into {leader}")
+        COALESCED_TOTAL.inc(self.labels)
+        task.follow(leader)
+        return True
+
+    def _release_leader(self, key, task):
+        with self.state_lock:
+            if self.coalesce_leaders.get(key) is task:
+                del self.coalesce_leaders[key]
+                self.coalesce_waiters.pop(key, None)
+
+    def _wait_timeout(self, task):
+        """本次请求最多等待的秒数: 任务自己的剩余时间, 没有deadline时为task_timeout; 需在合并前计算, 合并会放宽leader的deadline"""
+        if task.deadline is None:
+            return self.task_timeout
+        return max(min(self.task_timeout, task.remaining()), 0)
+
+    def _abandon(self, task, timeout):
+        """
+        同步等待方超时: 还有合并到该任务上的请求在等待时只结束本次等待, 任务继续执行, 返回本次请求的失败响应体;
+        否则把任务置为失败并返回None
+        """
+        logger.info(f"{self.name} task: {task} timeout after {timeout} s.")
+        if self._leave_coalesced(task):
+            return json.dumps({
+                "task_id": task.task_id,
+                "task_status": "failed",
+                "message": f"{self.name} task timeout after {timeout} s",
+            }, ensure_ascii=False)
+        task.set_failed()
+        return None
+
+    def _leave_coalesced(self, task):
+        """
+        同步等待方超时: 从合并计数中移除该请求, 最后一个等待方离开时才让leader失败(排队中的会被丢弃)
+        返回True表示task是仍有其他等待方的leader, 不能置为失败
+        """
+        if not self.coalesce:
+            return False
+        key = self.coalesce_key(task)
+        with self.state_lock:
+            leader = self.coalesce_leaders.get(key)
+            if leader is None:
+                return False
+            self.coalesce_waiters[key] -= 1
+            remaining = self.coalesce_waiters[key]
+        if leader is task:
+            return remaining > 0
+        if remaining <= 0:
+            logger.info(f"{self.name} task: all waiters of {leader} timed out, abandon it")
+            leader.set_failed()
+        return False
+
+    def _serialize(self, task):
+        """序列化响应, 请求中trace为true时附带各阶段耗时"""
+        with task.trace.span("serialize"):
+            body = task.to_json()
+        if task.request_data.get("trace"):
+            body = body[:-1] + ', "trace": ' + json.dumps(task.trace.to_list(), ensure_ascii=False) + "}"
+        if self.trace_exporter is not None:
+            self.trace_exporter.export(task.trace, service=self.name)
+        return body
+
+    def _enqueue(self, task):
+        """准入检查后非阻塞入队, 被拒绝时返回429响应(排空中返回503), 否则返回None"""
+        queue_depth = self.queue.qsize()
+        if not self.accepting:
+            self.admission.record_shed(task, "draining", queue_depth, self.consume_worker)
+            SHED_TOTAL.inc(dict(self.labels, reason="draining"))
+            TASKS_TOTAL.inc(dict(self.labels, status="rejected"))
+            task.set_failed()
+            return json.dumps({
+                "task_id": task.task_id,
+                "task_status": "rejected",
+                "message": f"{self.name} is draining for reload, retry later",
+            }, ensure_ascii=False), 503, {"Retry-After": "1"}
+
+        remaining_ms = None if task.deadline is None else task.remaining() * 1000
+        admitted, reason, retry_after = self.admission.admit(queue_depth, self.consume_worker, remaining_ms)
+        if admitted:
+            try:
+                # 先登记再入队, 避免消费者先取出任务导致登记残留
+                self._track(task)
+                self.queue.put_nowait(task)
+                return None
+            except Full:
+                self._untrack(task)
+                reason = "queue_full"
+                retry_after = self.admission.retry_after(self.admission.estimate_wait_ms(queue_depth, self.consume_worker))
+
+        self.admission.record_shed(task, reason, queue_depth, self.consume_worker)
+        SHED_TOTAL.inc(dict(self.labels, reason=reason))
+        TASKS_TOTAL.inc(dict(self.labels, status="rejected"))
+        task.set_failed()
+        return json.dumps({
+            "task_id": task.task_id,
+            "task_status": "rejected",
+            "message": f"{self.name} overloaded, reason {reason}, retry after {retry_after} s",
+        }, ensure_ascii=False), 429, {"Retry-After": str(retry_after)}
+
+    def _collect_metrics(self):
+        QUEUE_DEPTH.set(self.queue.qsize(), self.labels)
 
     def to_dict(self):
         return {
             "name": self.name,
             "interface": self.interface,
             "handler": f"{self.handler.__class__.__name__}",
+            "consume_type": self.consume_type,
+            "consume_worker": self.consume_worker,
+            "min_worker": self.min_worker,
+            "max_worker": self.max_worker,
             "interface_func": f"{self.interface_func.__name__}",
+            "admission": self.admission.to_dict(),
+            "queue": self.queue.to_dict(),
         }
 
     def listen(self):
+        if self.consume_type == "process" and self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_worker, initializer=_process_init,
+                                                initargs=(self.handler,))
         for p in self.consume_process:
             p.start()
+        self.listening = True
 
-    def stop(self):
-        for inx, p in enumerate(self.consume_process):
-            logger.info(f"begin to join {self.name}_{self.handler.__class__.__name__} {inx}/{self.consume_worker}")
-            p.join()
-            logger.info(f"finish join {self.name}_{self.handler.__class__.__name__} {inx}/{self.consume_worker}")
+    def add_worker(self):
+        """增加一个消费线程, 返回当前线程数"""
+        with self.state_lock:
+            if not self.listening or self.stop_event.is_set() or self.consume_worker >= self.max_worker:
+                return self.consume_worker
+            worker_id = self.next_worker_id
+            self.next_worker_id += 1
+            self.retire_events[worker_id] = Event()
+            p = Thread(target=self.consume_func, args=(worker_id,))
+            self.consume_process = [t for t in self.consume_process if t.is_alive()] + [p]
+            self.consume_worker += 1
+        p.start()
+        return self.consume_worker
 
-    def _consume(self, worker_id):
-        try:
-            task = self.queue.get(block=True, timeout=self.latency)
-        except Empty:
-            task = None
-            pass
-        time0 = time.time() * 1000
+    def remove_worker(self):
+        """让一个消费线程处理完当前任务后退出, 返回当前线程数"""
+        with self.state_lock:
+            if self.consume_worker <= self.min_worker:
+                return self.consume_worker
+            worker_id = max(i for i, e in self.retire_events.items() if not e.is_set())
+            self.retire_events[worker_id].set()
+            self.consume_worker -= 1
+        return self.consume_worker
+
+    def _running(self, worker_id):
+        return not self.stop_event.is_set() and not self.retire_events[worker_id].is_set()
+
+    def _add_active_requests(self, n):
+        with self.state_lock:
+            self.active_requests += n
+
+    def _track(self, task):
+        with self.state_lock:
+            self.live_tasks[task.task_id] = task
+
+    def _untrack(self, task):
+        """任务出队被丢弃或handler返回后调用; 等待方超时把任务置为failed时handler可能仍在读写文件, 不能在此之前取消登记"""
+        with self.state_lock:
+            self.live_tasks.pop(task.task_id, None)
+
+    def get_live_tasks(self):
+        """排队和执行中的任务"""
+        with self.state_lock:
+            return list(self.live_tasks.values())
+
+    def _add_inflight(self, n):
+        with self.state_lock:
+            self.inflight += n
+        INFLIGHT.inc(self.labels, n)
+
+    def is_idle(self):
+        with self.state_lock:
+            return self.queue.qsize() == 0 and self.inflight == 0 and self.active_requests == 0
+
+    def drain(self, timeout=None):
+        """停止接收新任务, 等待队列中和执行中的任务完成, 超时后排队中的任务置为失败; 返回是否完全排空"""
+        self.accepting = False
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.is_idle():
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(0.05)
+
+        drained = self.is_idle()
         while True:
-            time1 = time.time() * 1000
-            time_diff = time1 - time0
-            # print(f"worker {worker_id} time_diff {time_diff} ms")
             try:
-                # print(f"worker {worker_id} consume_data instance {task}")
-                if task is not None:
-                    result = self.handler(task.to_dict())
-                    task.set_result(result)
-                    task.set_finish()
-                # print(f"worker {worker_id} consume_data instance {task} end")
-            except Exception as e:
-                print(f"consume failed, instance={task.to_dict()}, exception={e}, process will stop early")
-                task.set_failed()
+                task = self.queue.get_nowait()
+            except Empty:
+                break
+            logger.info(f"{self.name}: drain timeout, fail queued task {task}")
+            task.set_failed()
+            self._untrack(task)
+        logger.info(f"{self.name}: drain finished, drained={drained}")
+        return drained
+
+    def stop(self):
+        self.stop_event.set()
+        with self.state_lock:
+            consume_process = list(self.consume_process)
+        for inx, p in enumerate(consume_process):
+            if not p.is_alive():
+                continue
+            logger.info(f"begin to join {self.name}_{self.handler.__class__.__name__} {inx}/{len(consume_process)}")
+            p.join()
+            logger.info(f"finish join {self.name}_{self.handler.__class__.__name__} {inx}/{len(consume_process)}")
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def _call_handler(self, instance, deadline=None):
+        if self.executor is None:
+            return self.handler(instance)
+        return self.executor.submit(_process_handle, instance, deadline).result()
 
+    def _drop_expired(self, task):
+        """出队时检查任务, 已结束(等待方超时)或已过deadline的任务不再执行, 返回True"""
+        if task.is_done() and not task.is_expired():
+            logger.info(f"{self.name} task: {task} abandoned by waiter before dequeue, dropped")
+            self._untrack(task)
+            return True
+        if not task.is_expired():
+            return False
+        logger.info(f"{self.name} task: {task} expired {-task.remaining():.3f} s before dequeue, dropped")
+        self.admission.record_shed(task, "deadline", self.queue.qsize(), self.consume_worker)
+        SHED_TOTAL.inc(dict(self.labels, reason="deadline"))
+        TASKS_TOTAL.inc(dict(self.labels, status="expired"))
+        task.set_failed()
+        self._untrack(task)
+        return True
+
+    def _consume(self, worker_id):
+        while self._running(worker_id):
             try:
                 task = self.queue.get(block=True, timeout=self.latency)
             except Empty:
-                task = None
-                pass
+                continue
+            if self._drop_expired(task):
+                continue
 
-    def _batch_consume(self, worker_id):
-        batch_instances = []
-        batch_tasks = []
-        try:
-            task = self.queue.get(block=True, timeout=self.latency)
-        except Empty:
-            task = None
-            pass
-        time0 = time.time() * 1000
-        while True:
+            time0 = time.time() * 1000
+            task.trace.add_span("queue_wait", task.create_time, time0 / 1000)
+            QUEUE_WAIT.observe(time0 / 1000 - task.create_time, self.labels)
+            BATCH_SIZE.observe(1, self.labels)
+            self._add_inflight(1)
+            task.set_running()
+            try:
+                with use_trace(task.trace), use_deadline(task.deadline), \
+                        task.trace.span("handler", worker=worker_id):
+                    if task.stream_queue is not None:
+                        result = self._call_stream_handler(task)
+                    else:
+                        result = self._call_handler(task.payload(), task.deadline)
+                task.set_result(result)
+                task.set_finish()
+            except Exception as e:
+                print(f"consume failed, task={task}, exception={e}, process will stop early")
+                task.set_failed()
+            self._untrack(task)
             time1 = time.time() * 1000
-            time_diff = time1 - time0
-            # print(f"worker {worker_id} time_diff {time_diff} ms")
-            # print(f"worker {worker_id} consume_data instance {task}")
-            if len(batch_instances) >= self.max_batch_size or time_diff >= self.max_batch_size:
-                # print(f"worker {worker_id} predict begin")
-                try:
-                    results = self.handler(batch_instances)
-                    # print(f"local_llm_consume results {results}")
-                    # print(f"worker {worker_id} predict end")
-                    assert len(results) == len(batch_instances), f'result:{len(results)} data:{len(batch_instances)}'
-                    for i, result in enumerate(results):
-                        batch_tasks[i].set_result(result)
-                        batch_tasks[i].set_finish()
-                except Exception as e:
-                    print(
-                        f"batch_consume consume failed, instance={task.to_dict()}, exception={e}, process will stop early")
-                    for i, result in enumerate(batch_instances):
-                        batch_tasks[i].set_failed()
-
-                batch_instances = []
-                batch_tasks = []
-                time0 = time.time() * 1000
-            if task is not None:
-                batch_instances.append(task.to_dict())
-                batch_tasks.append(task)
-                # print(f"worker {worker_id} consume_data instance {task} end")
+            self._add_inflight(-1)
+            HANDLER_LATENCY.observe((time1 - time0) / 1000, self.labels)
+            TASKS_TOTAL.inc(dict(self.labels, status=task.task_status))
+            self.admission.record_latency(time1 - time0)
+
+    def _batch_consume(self, worker_id):
+        while self._running(worker_id):
+            batch_tasks = self.batcher.collect(self.queue, timeout=self.latency)
+            batch_tasks = [task for task in batch_tasks if not self._drop_expired(task)]
+            if not batch_tasks:
+                continue
+
+            now = time.time()
+            for task in batch_tasks:
+                task.trace.add_span("queue_wait", task.create_time, now)
+                QUEUE_WAIT.observe(now - task.create_time, self.labels)
+                task.set_running()
+            BATCH_SIZE.observe(len(batch_tasks), self.labels)
+            self._add_inflight(len(batch_tasks))
 
+            batch_instances = [task.payload() for task in batch_tasks]
+            time0 = time.time() * 1000
             try:
-                task = self.queue.get(block=True, timeout=self.latency)
-            except Empty:
-                task = None
-                pass
+                # 一次调用服务整批任务, 按其中最晚的deadline限时
+                deadlines = [task.deadline for task in batch_tasks]
+                deadline = None if None in deadlines else max(deadlines)
+                with use_deadline(deadline):
+                    results = self.handler(batch_instances)
+                assert len(results) == len(batch_instances), f'result:{len(results)} data:{len(batch_instances)}'
+                for i, result in enumerate(results):
+                    batch_tasks[i].set_result(result)
+                    batch_tasks[i].set_finish()
+            except Exception as e:
+                print(f"batch_consume consume failed, tasks={batch_tasks}, exception={e}, process will stop early")
+                for task in batch_tasks:
+                    task.set_failed()
+            for task in batch_tasks:
+                self._untrack(task)
+            time1 = time.time() * 1000
+            for task in batch_tasks:
+                task.trace.add_span("handler", time0 / 1000, time1 / 1000, worker=worker_id, batch_size=len(batch_tasks))
+            self._add_inflight(-len(batch_tasks))
+            HANDLER_LATENCY.observe((time1 - time0) / 1000, self.labels)
+            for task in batch_tasks:
+                TASKS_TOTAL.inc(dict(self.labels, status=task.task_status))
+            self.batcher.record(len(batch_tasks), time1 - time0, self.queue.qsize())
+            self.admission.record_latency((time1 - time0) / len(batch_tasks))
 
 
 if __name__ == '__main__':
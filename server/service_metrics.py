@@ -0,0 +1,12 @@
+from utils.metrics_utils import mcli, SIZE_BUCKETS
+
+# 线程模式Service和asyncio模式AsyncService共用的指标, 均以service和mode(thread/async)为标签
+QUEUE_DEPTH = mcli.gauge("service_queue_depth", "Tasks waiting in the service queue", ("service", "mode"))
+QUEUE_WAIT = mcli.histogram("service_queue_wait_seconds", "Time a task waited before a worker picked it up", ("service", "mode"))
+HANDLER_LATENCY = mcli.histogram("service_handler_latency_seconds", "Handler execution time per call", ("service", "mode"))
+REQUEST_LATENCY = mcli.histogram("service_request_latency_seconds", "End to end request time in the interface", ("service", "mode"))
+BATCH_SIZE = mcli.histogram("service_batch_size", "Number of tasks per handler call", ("service", "mode"), buckets=SIZE_BUCKETS)
+TASKS_TOTAL = mcli.counter("service_tasks_total", "Tasks by final status", ("service", "mode", "status"))
+SHED_TOTAL = mcli.counter("service_shed_total", "Requests rejected by admission control", ("service", "mode", "reason"))
+INFLIGHT = mcli.gauge("service_inflight_tasks", "Tasks currently executing in a handler", ("service", "mode"))
+COALESCED_TOTAL = mcli.counter("service_coalesced_total", "Requests attached to an identical in-flight task", ("service", "mode"))
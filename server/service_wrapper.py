@@ -3,17 +3,29 @@ import json
 import os
 import logging
 import argparse
-from service import Service
+from service import Service, encode_response
+from task_registry import TaskRegistry
+from async_service import AsyncService, AsgiApp
+from utils.metrics_utils import mcli
+from utils.trace_utils import TraceExporter
+from reloader import GracefulReloader, handover_mode
+from file_wrapper import SendfileRequestHandler
+from autoscaler import ConsumerAutoscaler
 from queue import Queue, Empty
-from threading import Thread
+from threading import Thread, current_thread
 import time
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from pathlib import Path
 import zipfile
 import uuid
 from file_handler.dwg_file_handler import SimpleDwgClient
+from file_handler.upload_handler import ChunkedUploadManager, ContentStore, UploadError, content_file_id
+from file_handler.zip_handler import ZipCache, iter_zip, iter_gzip
+from file_handler.file_index import FileIndex, parse_time
+from file_handler.storage_janitor import StorageJanitor
+from utils.json_utils import accepts_gzip
 from agent_headler.text_rebuild_agent import TextRebuildAgent
 from agent_headler.partial_match_agent import PartialMatchAgent
 from agent_headler.sequence_match_agent import SequenceMatchAgent
@@ -21,6 +33,7 @@ from agent_headler.list_make_agent import ListMakeAgent
 # from agent_headler.image_table_agent import ImageTableAgent
 from utils.llm_util import CustomLLM, generate_token, AIMessageParser
 import shutil
+import shlex
 import signal
 
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -33,6 +46,8 @@ print(root_path)
 sys.path.insert(0, root_path)
 
 SERVICE_REGISTER = {}
+TASK_REGISTRY = TaskRegistry(ttl=3600, max_tasks=10000, max_bytes=256 * 1024 * 1024)
+TRACE_EXPORTER = TraceExporter()
 
 qps = 256
 latency = 1 / qps
@@ -41,26 +56,37 @@ latency = 1 / qps
 server = Flask(__name__)
 
 
-# 全局变量标记是否需要重启
-should_restart = False
 reload_time = 0
+RELOADER = None
+
 
 def signal_handler(signum, frame):
-    global should_restart
-    if signum == signal.SIGHUP:
-        print("收到重启信号，准备热重启...")
-        should_restart = True
+    print("收到重启信号，准备热重启...")
+    if RELOADER is not None:
+        RELOADER.reload()
 
-signal.signal(signal.SIGHUP, signal_handler)
+if hasattr(signal, "SIGHUP"):
+    signal.signal(signal.SIGHUP, signal_handler)
 
 
-UPLOAD_DIR = "E:\dwgData"
+# 以下配置可由环境变量覆盖, 便于在本地用替身服务做压测(见benchmark/run_benchmark.py)
+UPLOAD_DIR = os.environ.get("REMOTE_SERVER_UPLOAD_DIR", "E:\dwgData")
 ALLOWED_EXTENSIONS = {
     'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'zip', 'rar', 'mp4', 'mp3', 'xls', 'xlsx', 'ppt', 'pptx', 'dwg',
 }
 
-DOWNLOAD_DIR = "E:\svgData"
+DOWNLOAD_DIR = os.environ.get("REMOTE_SERVER_DOWNLOAD_DIR", "E:\svgData")
 MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 16MB
+# 分片上传时单个分片受MAX_CONTENT_LENGTH限制, 整个文件受MAX_UPLOAD_SIZE限制
+MAX_UPLOAD_SIZE = int(os.environ.get("REMOTE_SERVER_MAX_UPLOAD_SIZE", 2 * 1024 * 1024 * 1024))
+# 下载目录时的zip压缩级别(0为不压缩), 客户端接受gzip时zip内不压缩, 整体以gzip传输
+ZIP_LEVEL = int(os.environ.get("REMOTE_SERVER_ZIP_LEVEL", 6))
+ZIP_CACHE_SIZE = int(os.environ.get("REMOTE_SERVER_ZIP_CACHE_SIZE", 2 * 1024 * 1024 * 1024))
+# 存储清理: 上传/输出目录的TTL(秒)和两个目录(含zip缓存、分片上传会话、哈希索引)的总配额(字节), 0表示不启用
+UPLOAD_TTL = int(os.environ.get("REMOTE_SERVER_UPLOAD_TTL", 0))
+DOWNLOAD_TTL = int(os.environ.get("REMOTE_SERVER_DOWNLOAD_TTL", 0))
+STORAGE_QUOTA = int(os.environ.get("REMOTE_SERVER_STORAGE_QUOTA", 0))
+JANITOR_INTERVAL = int(os.environ.get("REMOTE_SERVER_JANITOR_INTERVAL", 300))
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
@@ -68,14 +94,49 @@ os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 server.config['UPLOAD_FOLDER'] = UPLOAD_DIR
 server.config['DOWNLOAD_FOLDER'] = DOWNLOAD_DIR
 server.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+# 部署在nginx/Apache之后时可开启X-Sendfile, 由前端服务器直接发送文件
+server.config['USE_X_SENDFILE'] = os.environ.get("REMOTE_SERVER_X_SENDFILE", "0") == "1"
+
+CONTENT_STORE = ContentStore(UPLOAD_DIR)
+UPLOAD_MANAGER = ChunkedUploadManager(UPLOAD_DIR, CONTENT_STORE, max_size=MAX_UPLOAD_SIZE)
+ZIP_CACHE = ZipCache(os.path.join(DOWNLOAD_DIR, ".zipcache"), max_bytes=ZIP_CACHE_SIZE)
+FILE_INDEX = FileIndex()
+
+
+def referenced_paths():
+    """排队和执行中任务请求参数里的所有字符串(如dwg_file_path、svg_file_folder), 存储清理时跳过这些路径"""
+    paths = []
+    for service in list(SERVICE_REGISTER.values()):
+        for task in service.get_live_tasks():
+            stack = [task.request_data]
+            while stack:
+                value = stack.pop()
+                if isinstance(value, dict):
+                    stack.extend(value.values())
+                elif isinstance(value, list):
+                    stack.extend(value)
+                elif isinstance(value, str) and value:
+                    paths.append(value)
+    return paths
+
+
+JANITOR = StorageJanitor(FILE_INDEX, {UPLOAD_DIR: UPLOAD_TTL or None, DOWNLOAD_DIR: DOWNLOAD_TTL or None},
+                         quota_bytes=STORAGE_QUOTA or None, interval=JANITOR_INTERVAL, in_use=referenced_paths,
+                         internal_dirs=[ZIP_CACHE.cache_dir, UPLOAD_MANAGER.session_dir, CONTENT_STORE.hash_dir])
+# 文件列表每页默认和最多返回的条数
+LIST_PAGE_SIZE = 1000
+LIST_MAX_PAGE_SIZE = 10000
 
 @server.route('/reload')
 def reload():
     global reload_time
-    # 通过API触发重启
+    # 通过API触发平滑重启: 新进程就绪后接管监听socket, 当前进程排空任务后退出
+    if RELOADER is None or not RELOADER.reload():
+        return '重启进行中或服务未就绪', 409
     reload_time += 1
-    logger.info(f"will kill pid {os.getpid()}")
-    os.kill(os.getpid(), signal.SIGHUP)
+    logger.info(f"pid {os.getpid()} begin graceful reload")
+    if handover_mode() == "restart":
+        return '重启信号已发送; 当前平台不能把监听socket交给新进程, 排空和新进程启动期间端口不可用'
     return '重启信号已发送'
 
 @server.route("/")
@@ -88,6 +149,28 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def uploaded_response(original_filename, save_filename, sha256, deduplicated):
+    """上传成功的响应, 文件ID为内容sha256的前32位, 相同内容总是得到相同的文件ID"""
+    FILE_INDEX.add(server.config['UPLOAD_FOLDER'], save_filename)
+    JANITOR.touch(os.path.join(server.config['UPLOAD_FOLDER'], save_filename))
+    file_path = os.path.join(server.config['UPLOAD_FOLDER'], save_filename)
+    file_info = get_file_info(server.config['UPLOAD_FOLDER'], save_filename)
+    return jsonify({
+        'success': True,
+        'message': '文件已存在' if deduplicated else '文件上传成功',
+        'data': {
+            'original_filename': original_filename,
+            'saved_filename': save_filename,
+            'file_size': file_info['size'] if file_info else 0,
+            'upload_time': file_info['upload_time'] if file_info else datetime.now().isoformat(),
+            'download_url': file_path,
+            'file_id': content_file_id(sha256),
+            'sha256': sha256,
+            'deduplicated': deduplicated,
+        }
+    }), 200
+
+
 def get_file_info(folder, filename):
     """获取文件信息"""
     file_path = os.path.join(folder, filename)
@@ -138,30 +221,11 @@ def upload_file():
 
             file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
 
-            # 生成唯一文件名避免冲突
-            unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else uuid.uuid4().hex
-            save_filename = unique_filename
+            # 按内容sha256保存, 相同内容不重复存储
+            save_filename, sha256, deduplicated = CONTENT_STORE.save(file.stream, file_extension)
             print(f"save_filename: {save_filename}\n")
 
-            # 保存文件
-            file_path = os.path.join(server.config['UPLOAD_FOLDER'], save_filename)
-            file.save(file_path)
-
-            # 获取文件信息
-            file_info = get_file_info(server.config['UPLOAD_FOLDER'], save_filename)
-
-            return jsonify({
-                'success': True,
-                'message': '文件上传成功',
-                'data': {
-                    'original_filename': file.filename,
-                    'saved_filename': save_filename,
-                    'file_size': file_info['size'] if file_info else 0,
-                    'upload_time': file_info['upload_time'] if file_info else datetime.now().isoformat(),
-                    'download_url': file_path,
-                    'file_id': save_filename.rsplit('.', 1)[0]  # 返回文件ID（不含扩展名）
-                }
-            }), 200
+            return uploaded_response(file.filename, save_filename, sha256, deduplicated)
         else:
             return jsonify({
                 'success': False,
@@ -198,41 +262,146 @@ def upload_from_stream(request):
                 'error_code': 'INVALID_FILE_TYPE'
             }), 400
 
-        # 生成唯一文件名
+        # 分块写盘并计算sha256, 不把整个请求体读入内存; 相同内容直接返回已有文件
         file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else uuid.uuid4().hex
+        save_filename, sha256, deduplicated = CONTENT_STORE.save(request.stream, file_extension,
+                                                                 max_size=MAX_CONTENT_LENGTH)
+        return uploaded_response(filename, save_filename, sha256, deduplicated)
 
-        # 保存文件
-        file_path = os.path.join(server.config['UPLOAD_FOLDER'], unique_filename)
-        with open(file_path, 'wb') as f:
-            f.write(request.data)
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'流式上传失败: {str(e)}',
+            'error_code': 'STREAM_UPLOAD_ERROR'
+        }), 500
+
+
+def upload_error_response(e):
+    return jsonify(dict({
+        'success': False,
+        'message': e.message,
+        'error_code': e.error_code,
+    }, **e.data)), e.status
+
+
+@server.route('/uploads', methods=['POST'])
+def init_chunked_upload():
+    """
+    创建分片上传会话
+    请求: {"filename": "a.dwg", "total_size": 123456}
+    之后用 PUT /uploads/<upload_id> (请求头 Upload-Offset) 依次上传分片, 最后 POST /uploads/<upload_id>/complete
+    """
+    try:
+        req_data = json.loads(request.data.decode("utf-8"))
+        filename = secure_filename(req_data.get('filename', ''))
+        if not allowed_file(filename):
+            return jsonify({
+                'success': False,
+                'message': f'文件类型不允许，允许的类型: {", ".join(ALLOWED_EXTENSIONS)}',
+                'error_code': 'INVALID_FILE_TYPE'
+            }), 400
 
-        file_info = get_file_info(server.config['UPLOAD_FOLDER'], unique_filename)
+        status = UPLOAD_MANAGER.init(filename, req_data.get('total_size'))
+        return jsonify({'success': True, 'data': status}), 200
 
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
         return jsonify({
-            'success': True,
-            'message': '文件上传成功',
-            'data': {
-                'original_filename': filename,
-                'saved_filename': unique_filename,
-                'file_size': file_info['size'] if file_info else len(request.data),
-                'upload_time': file_info['upload_time'] if file_info else datetime.now().isoformat(),
-                'download_url': file_path,
-                'file_id': unique_filename.rsplit('.', 1)[0]
-            }
-        }), 200
+            'success': False,
+            'message': f'创建上传失败: {str(e)}',
+            'error_code': 'UPLOAD_INIT_ERROR'
+        }), 500
+
+
+@server.route('/uploads/hash/<sha256>', methods=['GET', 'HEAD'])
+def lookup_upload(sha256):
+    """
+    上传前检查服务端是否已有相同内容、相同扩展名的文件, 有则返回与 /upload 相同的结构, 客户端可跳过上传
+    请求: GET /uploads/hash/<sha256>?filename=a.dwg, 没有时返回404
+    """
+    try:
+        filename = request.args.get('filename', '')
+        file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        save_filename = CONTENT_STORE.lookup(sha256.lower(), file_extension)
+        if save_filename is None:
+            return jsonify({
+                'success': False,
+                'message': '文件不存在',
+                'error_code': 'FILE_NOT_FOUND'
+            }), 404
+        return uploaded_response(request.args.get('filename', save_filename), save_filename, sha256.lower(), True)
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+@server.route('/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """查询已接收的字节数, 客户端据此续传"""
+    try:
+        return jsonify({'success': True, 'data': UPLOAD_MANAGER.status(upload_id)}), 200
+    except UploadError as e:
+        return upload_error_response(e)
 
+
+@server.route('/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def append_chunk(upload_id):
+    """在Upload-Offset处追加一个分片, 分片流式写盘"""
+    try:
+        offset = request.headers.get('Upload-Offset', request.args.get('offset', -1))
+        try:
+            offset = int(offset)
+        except ValueError:
+            raise UploadError(f"Upload-Offset必须是整数, 当前为 {offset!r}", "INVALID_OFFSET", 400)
+        status = UPLOAD_MANAGER.append(upload_id, offset, request.stream)
+        return jsonify({'success': True, 'data': status}), 200
+    except UploadError as e:
+        return upload_error_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'流式上传失败: {str(e)}',
-            'error_code': 'STREAM_UPLOAD_ERROR'
+            'message': f'分片上传失败: {str(e)}',
+            'error_code': 'UPLOAD_CHUNK_ERROR'
+        }), 500
+
+
+@server.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """校验sha256并完成上传, 返回与 /upload 相同的结构"""
+    try:
+        req_data = json.loads(request.data.decode("utf-8")) if request.data else {}
+        save_filename, status = UPLOAD_MANAGER.complete(upload_id, req_data.get('checksum'))
+        return uploaded_response(status['filename'], save_filename, status['sha256'], status['deduplicated'])
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'完成上传失败: {str(e)}',
+            'error_code': 'UPLOAD_COMPLETE_ERROR'
         }), 500
 
 
+@server.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """放弃分片上传, 删除已接收的数据"""
+    try:
+        UPLOAD_MANAGER.abort(upload_id)
+        return jsonify({'success': True, 'message': '上传已取消'}), 200
+    except UploadError as e:
+        return upload_error_response(e)
+
+
 @server.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
-    """文件下载接口"""
+    """
+    文件下载接口
+    支持Range断点续传(206)、ETag/If-None-Match和Last-Modified/If-Modified-Since条件请求(304)
+    下载目录时打包为zip: 默认使用按目录内容缓存的zip, 目录未变化时不重新打包;
+    stream为真时边打包边发送; compress_level指定zip压缩级别, 未指定且客户端接受gzip时zip内不压缩, 整体以gzip传输
+    """
     try:
         req_data = json.loads(request.data.decode("utf-8"))
 
@@ -250,25 +419,11 @@ def download_file(filename):
                 'error_code': 'FILE_NOT_FOUND'
             }), 404
 
+        JANITOR.touch(file_path)
         if os.path.isdir(file_path):
-            output_zip_path = os.path.join(folder, f"{filename}.zip")
-            with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-
-                # 遍历文件夹中的所有文件和子文件夹
-                for root, dirs, files in os.walk(file_path):
-                    for sub_file in files:
-                        sub_file_path = os.path.join(root, sub_file)
-                        # 计算在 ZIP 文件中的相对路径
-                        arcname = os.path.relpath(sub_file_path, file_path)
-
-                        # 添加到 ZIP 文件
-                        zipf.write(sub_file_path, arcname)
-                        print(f"添加文件: {arcname}")
+            return download_folder(file_path, filename, req_data)
 
-            print(f"压缩完成! 文件大小: {os.path.getsize(output_zip_path)} 字节")
-            file_path = output_zip_path
-
-        return send_file(file_path, as_attachment=True)
+        return send_file(file_path, as_attachment=True, conditional=True, etag=True)
 
     except Exception as e:
         return jsonify({
@@ -278,31 +433,74 @@ def download_file(filename):
         }), 500
 
 
+def download_folder(folder_path, filename, req_data):
+    """把目录打包为zip发送"""
+    compress_level = req_data.get('compress_level', request.args.get('compress_level'))
+    level = int(compress_level) if compress_level is not None else ZIP_LEVEL
+    use_gzip = compress_level is None and accepts_gzip(request.headers.get('Accept-Encoding'))
+    stream = req_data.get('stream', request.args.get('stream') in ['1', 'true'])
+
+    if stream:
+        chunks = iter_zip(folder_path, 0 if use_gzip else level)
+        if use_gzip:
+            chunks = iter_gzip(chunks, level)
+        response = Response(stream_with_context(chunks), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.zip'
+    else:
+        zip_path = ZIP_CACHE.get(folder_path, level, gzip_level=level if use_gzip else None)
+        response = send_file(zip_path, mimetype='application/zip', as_attachment=True, download_name=f"{filename}.zip",
+                             conditional=True, etag=True)
+
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
 @server.route('/files', methods=['GET'])
 def list_files():
-    """获取文件列表"""
+    """
+    获取文件列表, 参数可放在请求体JSON或查询参数中:
+        folder                  目录, 默认上传目录
+        page, page_size         页码(从1开始)和每页条数, 默认第1页、每页1000条
+        sort_by, order          排序字段(filename/size/upload_time/modified_time)和asc/desc, 默认按上传时间倒序
+        extensions              扩展名, 列表或逗号分隔
+        start_time, end_time    上传时间范围, 时间戳或ISO格式
+    """
     try:
-        req_data = json.loads(request.data.decode("utf-8"))
-        folder = req_data["folder"] if "folder" in req_data and req_data["folder"] is not None else server.config['UPLOAD_FOLDER']
+        req_data = json.loads(request.data.decode("utf-8")) if request.data else {}
+        params = dict(request.args.to_dict(), **req_data)
+        folder = params["folder"] if params.get("folder") is not None else server.config['UPLOAD_FOLDER']
         print(f"folder {folder}\n")
 
-        files = []
-        for filename in os.listdir(folder):
-            file_path = os.path.join(folder, filename)
-            if os.path.isfile(file_path):
-                file_info = get_file_info(folder, filename)
-                files.append({
-                    'filename': filename,
-                    'size': file_info['size'] if file_info else 0,
-                    'upload_time': file_info['upload_time'] if file_info else '',
-                    'download_url': file_path,
-                })
+        page = max(int(params.get('page', 1)), 1)
+        page_size = min(max(int(params.get('page_size', LIST_PAGE_SIZE)), 1), LIST_MAX_PAGE_SIZE)
+        extensions = params.get('extensions')
+        if isinstance(extensions, str):
+            extensions = [ext for ext in extensions.split(",") if ext]
+
+        total_count, entries = FILE_INDEX.list(
+            folder, offset=(page - 1) * page_size, limit=page_size,
+            sort_by=params.get('sort_by', 'upload_time'), reverse=params.get('order', 'desc') == 'desc',
+            extensions=extensions, start_time=parse_time(params.get('start_time')),
+            end_time=parse_time(params.get('end_time')))
+
+        files = [{
+            'filename': entry['filename'],
+            'size': entry['size'],
+            'upload_time': datetime.fromtimestamp(entry['upload_time']).isoformat(),
+            'modified_time': datetime.fromtimestamp(entry['modified_time']).isoformat(),
+            'download_url': os.path.join(folder, entry['filename']),
+        } for entry in entries]
 
         return jsonify({
             'success': True,
             'data': {
                 'files': files,
-                'total_count': len(files)
+                'total_count': total_count,
+                'page': page,
+                'page_size': page_size,
+                'has_more': page * page_size < total_count,
             }
         }), 200
 
@@ -340,6 +538,7 @@ def delete_file(filename):
             shutil.rmtree(file_path)
         else:
             os.remove(file_path)
+        FILE_INDEX.remove(folder, filename)
 
         return jsonify({
             'success': True,
@@ -356,75 +555,183 @@ def delete_file(filename):
 
 @server.route('/health', methods=['GET'])
 def health_check():
-    """健康检查接口"""
+    """健康检查接口, 附带负载信息供客户端选择最空闲的节点"""
+    services = list(SERVICE_REGISTER.values())
+    draining = any(not s.accepting for s in services)
+    load = {s.name: s.queue.qsize() + s.inflight for s in services}
     return jsonify({
-        'status': 'healthy',
+        'status': 'draining' if draining else 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'service': 'File Upload Service'
-    }), 200
+        'service': 'File Upload Service',
+        'load': sum(load.values()),
+        'services': load,
+    }), 503 if draining else 200
 
 
+@server.route('/storage', methods=['GET'])
+def storage_stats():
+    """上传/输出目录的用量、TTL、配额和清理统计"""
+    return jsonify({'success': True, 'data': JANITOR.stats()}), 200
 
-dsv3 = CustomLLM(api_url="https://copilot.glodon.com/api/cvforce/aishop/v1/chat/completions", access_token=generate_token(api_key="TBDDAGJzAXaX5Zzl", api_secret="LEucuSDPRYCUaLj0UX1vvhoA"), model_name = "Awd7m0gtxfphu", temperature=0.3, max_tokens=12000)
 
-dwg_client = SimpleDwgClient(dwg_params_key="dwg_params")
+@server.route('/storage/cleanup', methods=['POST'])
+def storage_cleanup():
+    """立即执行一次存储清理"""
+    try:
+        deleted_count, deleted_bytes = JANITOR.run_once()
+        return jsonify({
+            'success': True,
+            'message': '清理完成',
+            'data': {'deleted_count': deleted_count, 'deleted_bytes': deleted_bytes}
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'清理失败: {str(e)}',
+            'error_code': 'CLEANUP_ERROR'
+        }), 500
+
+
+@server.route('/tasks/<task_id>', methods=['GET'])
+def get_task(task_id):
+    """查询异步任务状态和结果"""
+    task = TASK_REGISTRY.get(task_id)
+    if task is None:
+        return jsonify({
+            'success': False,
+            'message': '任务不存在或已过期',
+            'error_code': 'TASK_NOT_FOUND'
+        }), 404
+
+    return encode_response(task.to_json())
+
+@server.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus文本格式的服务指标"""
+    return mcli.render(), 200, {'Content-Type': mcli.CONTENT_TYPE}
+
+
+LLM_URL = os.environ.get("REMOTE_SERVER_LLM_URL", "https://copilot.glodon.com/api/cvforce/aishop/v1/chat/completions")
+LLM_TOKEN = os.environ.get("REMOTE_SERVER_LLM_TOKEN") or generate_token(api_key="TBDDAGJzAXaX5Zzl", api_secret="LEucuSDPRYCUaLj0UX1vvhoA")
+LLM_MODEL = os.environ.get("REMOTE_SERVER_LLM_MODEL", "Awd7m0gtxfphu")
+
+# CheckCADTool命令, 可以是JSON列表(如 ["python", "fake_check_cad_tool.py"])或命令行字符串
+DWG_CMD = os.environ.get("REMOTE_SERVER_DWG_CMD")
+if DWG_CMD:
+    DWG_CMD = json.loads(DWG_CMD) if DWG_CMD.startswith("[") else shlex.split(DWG_CMD, posix=os.name != "nt")
+
+dsv3 = CustomLLM(api_url=LLM_URL, access_token=LLM_TOKEN, model_name=LLM_MODEL, temperature=0.3, max_tokens=12000)
+
+dwg_client = SimpleDwgClient(dwg_params_key="dwg_params", cmd=DWG_CMD)
 text_rebuild_client = TextRebuildAgent(text_key="input_text", model=dsv3)
 partial_match_client = PartialMatchAgent(text_key="input_text", model=dsv3)
 list_make_client = ListMakeAgent(text_key="text", context_key="context", model=dsv3)
 sequence_match_client = SequenceMatchAgent(text_key="input_text", model=dsv3)
 # image_table_client = ImageTableAgent(model=dsv3)
 
+# 以上handler都不是CPU密集型, 使用默认的线程consume; 新增CPU密集型handler时用process_handler标记或配置consume_type="process"
 service_list = [
     {"name": "DWG解码", "interface": "/dwg_decode", "handler": dwg_client.run},
-    {"name": "文本顺序重构", "interface": "/text_rebuild", "handler": text_rebuild_client.run},
-    {"name": "项目匹配", "interface": "/partial_match", "handler": partial_match_client.run},
-    {"name": "清单编制", "interface": "/list_make", "handler": list_make_client.run},
+    {"name": "文本顺序重构", "interface": "/text_rebuild", "handler": text_rebuild_client.run,
+     "stream_handler": text_rebuild_client.stream, "max_queue_wait_ms": 60000, "max_worker": 16},
+    {"name": "项目匹配", "interface": "/partial_match", "handler": partial_match_client.run,
+     "stream_handler": partial_match_client.stream, "max_queue_wait_ms": 60000, "max_worker": 16, "coalesce": True},
+    {"name": "清单编制", "interface": "/list_make", "handler": list_make_client.run,
+     "stream_handler": list_make_client.stream, "max_queue_wait_ms": 60000, "max_worker": 16},
     # {"name": "图纸识别", "interface": "/image_table", "handler": image_table_client.run},
-    {"name": "工序匹配", "interface": "/sequence_match", "handler": sequence_match_client.run},
+    {"name": "工序匹配", "interface": "/sequence_match", "handler": sequence_match_client.run,
+     "stream_handler": sequence_match_client.stream, "max_queue_wait_ms": 60000, "max_worker": 16, "coalesce": True},
+
+]
 
+SERVICE_REGISTER = {s["name"]: Service(server=server, registry=TASK_REGISTRY, trace_exporter=TRACE_EXPORTER, **s) for s in service_list}
+
+
+@server.before_request
+def dwg_file_exists():
+    """DWG文件不在本节点时/dwg_decode返回404, 客户端据此转到哈希环上的下一个节点(上传时可能发生过故障转移)"""
+    if request.path != "/dwg_decode":
+        return None
+    try:
+        dwg_file_path = json.loads(request.data.decode("utf-8"))["dwg_params"]["dwg_file_path"]
+    except Exception:
+        # 请求格式错误交给服务处理
+        return None
+    if os.path.exists(dwg_file_path):
+        return None
+    return jsonify({
+        'success': False,
+        'message': f'文件不存在: {dwg_file_path}',
+        'error_code': 'FILE_NOT_FOUND'
+    }), 404
+
+# asyncio模式: LLM接口在同一个事件循环上并发等待, DWG解码仍走线程模式
+async_service_list = [
+    {"name": "文本顺序重构", "interface": "/text_rebuild", "handler": text_rebuild_client.arun},
+    {"name": "项目匹配", "interface": "/partial_match", "handler": partial_match_client.arun},
+    {"name": "清单编制", "interface": "/list_make", "handler": list_make_client.arun},
+    {"name": "工序匹配", "interface": "/sequence_match", "handler": sequence_match_client.arun},
 ]
 
-SERVICE_REGISTER = {s["name"]: Service(server=server, **s) for s in service_list}
+asgi_app = AsgiApp(registry=TASK_REGISTRY)
+ASYNC_SERVICE_REGISTER = {}
+for s in async_service_list:
+    ASYNC_SERVICE_REGISTER[s["name"]] = AsyncService(registry=TASK_REGISTRY, trace_exporter=TRACE_EXPORTER, **s)
+    asgi_app.add_service(ASYNC_SERVICE_REGISTER[s["name"]])
+
+
+def serve_async(port, reloader):
+    """
+    在后台线程中用uvicorn运行asgi_app
+    监听socket由reloader创建, 平滑重启时交给新进程; 旧进程停止接收后uvicorn优雅退出, 排空时等待其结束
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        logger.info("uvicorn not installed, async serving disabled")
+        return
+
+    sock = reloader.listen_socket("async", "0.0.0.0", port)
+    config = uvicorn.Config(asgi_app, log_level="info")
+    async_server = uvicorn.Server(config)
+    thread = current_thread()
+    reloader.add_stop_hook(lambda: setattr(async_server, "should_exit", True), thread.join)
+    async_server.run(sockets=[sock])
+
 
 def main():
     logger.info(f"服务启动，PID: {os.getpid()}")
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=str, required=True, help="端口号, 服务启动的端口号")
+    parser.add_argument("--async_port", type=str, default=None, help="asyncio模式LLM接口的端口号, 不设置则不启动")
+    parser.add_argument("--trace_file", type=str, default=None, help="请求阶段耗时以JSON lines导出到该文件, 不设置则不导出")
     args = parser.parse_args()
     port = args.port
+    TRACE_EXPORTER.path = args.trace_file
 
     for name in SERVICE_REGISTER:
         SERVICE_REGISTER[name].listen()
 
-    # message = "\n".join(["service"] + [f"{k}:{v.to_dict()}" for k, v in SERVICE_REGISTER.items()])
-    # logger.info(message)
-    #
-    # server.run(host="0.0.0.0", port=f"{port}", processes=True)
-    # logger.info(f"start serving")
+    global RELOADER
+    RELOADER = GracefulReloader(server, list(SERVICE_REGISTER.values()), warmups=[dsv3.warmup],
+                                request_handler=SendfileRequestHandler)
 
-    global should_restart
-    while True:
-        try:
-            message = "\n".join(["service"] + [f"{k}:{v.to_dict()}" for k, v in SERVICE_REGISTER.items()])
-            logger.info(message)
-
-            server.run(host="0.0.0.0", port=f"{port}", processes=True)
-            logger.info(f"start serving")
-
-        except Exception as e:
-            print(f"服务异常: {e}")
-            if should_restart:
-                print("执行热重启...")
-                should_restart = False
-                time.sleep(1)  # 等待连接清理
-                continue
-            else:
-                break
+    if args.async_port is not None:
+        Thread(target=serve_async, args=(args.async_port, RELOADER), daemon=True).start()
+        logger.info(f"async serving on port {args.async_port}")
 
-    for name in SERVICE_REGISTER:
-        SERVICE_REGISTER[name].stop()
+    autoscaler = ConsumerAutoscaler(list(SERVICE_REGISTER.values()))
+    autoscaler.start()
+    JANITOR.start()
+
+    message = "\n".join(["service"] + [f"{k}:{v.to_dict()}" for k, v in SERVICE_REGISTER.items()])
+    logger.info(message)
 
+    RELOADER.serve(host="0.0.0.0", port=port)
+    autoscaler.stop()
+    JANITOR.stop()
+    logger.info(f"服务退出，PID: {os.getpid()}")
 
 
 
@@ -5,6 +5,8 @@ import json
 import os
 import logging
 import uuid
+import time
+import threading
 import logging.config
 
 
@@ -17,23 +19,71 @@ root_path = os.path.abspath(os.path.join(file_path, '../'))
 print(root_path)
 sys.path.insert(0, root_path)
 
+from utils.trace_utils import Trace
+from utils.json_utils import dumps
+
+
+_MISSING = object()
+
+
+def _request_field(key, factory=str):
+    """request_data中字段的只读视图, 不再复制一份到Task上"""
+    def getter(self):
+        value = self.request_data.get(key, _MISSING)
+        return factory() if value is _MISSING else value
+
+    return property(getter)
+
 
 class Task(object):
+    """任务对象, 使用__slots__压缩内存; 请求字段按需从request_data读取, 结束后的视图和序列化结果缓存复用"""
+
+    __slots__ = ("task_id", "request_data", "task_status", "task_results", "create_time", "finish_time",
+                 "deadline", "trace", "stream_queue", "_done_event", "_done_callbacks", "_lock",
+                 "_view", "_json", "_results_json")
+
+    task_type = _request_field("task_type")
+    model_name = _request_field("model_name")
+    message = _request_field("message")
+    text = _request_field("text")
+    context = _request_field("context")
+    keyword = _request_field("keyword")
+    input_text = _request_field("input_text")
+    cde_params = _request_field("cde_params", dict)
+    dwg_params = _request_field("dwg_params", dict)
+    priority = _request_field("priority")
+    response_mode = _request_field("response_mode")
+
+    # compact模式下响应中省略的回显输入字段
+    ECHO_FIELDS = ("message", "text", "context", "keyword", "input_text", "cde_params", "dwg_params",
+                   "task_id", "task_status", "task_results")
 
     def __init__(self, request_data):
         self.task_id = self.generate_task_id()
         self.request_data = request_data
-        self.task_type = self.request_data.get("task_type", "")
-        self.model_name = self.request_data.get("model_name", "")
-        self.message = self.request_data.get("message", "")
-        self.text = self.request_data.get("text", "")
-        self.context = self.request_data.get("context", "")
-        self.keyword = self.request_data.get("keyword", "")
-        self.input_text = self.request_data.get("input_text", "")
-        self.cde_params = self.request_data.get("cde_params", {})
-        self.dwg_params = self.request_data.get("dwg_params", {})
         self.task_status = "waiting"
         self.task_results = None
+        self.create_time = time.time()
+        self.deadline = None
+        if request_data.get("timeout") is not None:
+            try:
+                self.set_timeout(request_data["timeout"])
+            except ValueError:
+                # 与X-Request-Timeout头一致, 非法的timeout记录后忽略
+                logger.info(f"task {self.task_id} invalid timeout {request_data['timeout']!r}, ignored")
+        self.trace = Trace(self.task_id)
+        self.stream_queue = None
+        self.finish_time = None
+        self._done_event = threading.Event()
+        self._done_callbacks = []
+        self._lock = threading.Lock()
+        self._view = None
+        self._json = None
+        self._results_json = None
+
+    @property
+    def tenant(self):
+        return self.request_data.get("tenant", self.request_data.get("project_id", ""))
 
     def __repr__(self):
         return f"{self.task_id}:{self.task_type}:{self.model_name}"
@@ -42,19 +92,91 @@ class Task(object):
     def generate_task_id():
         return uuid.uuid1().hex
 
+    def set_timeout(self, timeout):
+        """从创建时刻起最多等待timeout秒, 已有更早的deadline时保留更早的; timeout不是非负数时抛出ValueError"""
+        try:
+            timeout = float(timeout)
+        except TypeError:
+            raise ValueError(f"invalid timeout {timeout!r}")
+        if not timeout >= 0:
+            raise ValueError(f"invalid timeout {timeout!r}")
+        deadline = self.create_time + timeout
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def remaining(self):
+        """距deadline剩余的秒数, 没有deadline时返回None"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def is_expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
     def set_result(self, res):
         self.task_results = res
+        self._view = None
+        self._json = None
+        self._results_json = None
 
     def set_finish(self):
         self.task_status = "finished"
+        self._mark_done()
 
     def set_running(self):
         self.task_status = "running"
 
     def set_failed(self):
         self.task_status = "failed"
+        self._mark_done()
 
-    def to_dict(self):
+    def _mark_done(self):
+        with self._lock:
+            if self._done_event.is_set():
+                return
+            self.finish_time = time.time()
+            self._done_event.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.info(f"task {self} done callback failed, exception={e}")
+
+    def add_done_callback(self, callback):
+        """任务结束后回调callback(task), 已结束则立即回调"""
+        with self._lock:
+            if not self._done_event.is_set():
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def is_done(self):
+        return self._done_event.is_set()
+
+    def wait(self, timeout=None):
+        """阻塞等待任务结束(finished/failed), 超时返回False"""
+        return self._done_event.wait(timeout=timeout)
+
+    def follow(self, leader):
+        """合并到相同请求的leader任务上, leader结束时共享其结果和状态"""
+        def _on_leader_done(t):
+            if self.is_done():
+                # 本请求已等待超时
+                return
+            self.trace.add_span("coalesced", self.create_time, time.time(), leader_task_id=t.task_id)
+            self.set_result(t.task_results)
+            if t.response_mode == self.response_mode:
+                self._results_json = t.results_json()
+            if t.task_status == "finished":
+                self.set_finish()
+            else:
+                self.set_failed()
+
+        leader.add_done_callback(_on_leader_done)
+
+    def payload(self):
+        """交给handler的请求字典, 每次新建, handler可以自由修改"""
         return {
             "task_id": self.task_id,
             "task_type": self.task_type,
@@ -70,5 +192,48 @@ class Task(object):
             "dwg_params": self.dwg_params,
         }
 
+    def to_dict(self):
+        """任务视图, 结束后缓存复用, 调用方不要修改"""
+        if self._view is not None:
+            return self._view
+        view = self.payload()
+        if self.response_mode == "compact":
+            view = self._compact(view)
+        if self.is_done():
+            self._view = view
+        return view
+
+    def _compact(self, view):
+        """省略回显的输入字段, 只保留任务标识、状态和handler的输出"""
+        results = view["task_results"]
+        if isinstance(results, dict):
+            results = {k: v for k, v in results.items() if k not in self.ECHO_FIELDS}
+        return {
+            "task_id": view["task_id"],
+            "task_type": view["task_type"],
+            "model_name": view["model_name"],
+            "task_status": view["task_status"],
+            "task_results": results,
+        }
+
+    def results_json(self):
+        """task_results的JSON, 结束后只序列化一次"""
+        if self._results_json is not None:
+            return self._results_json
+        data = dumps(self.to_dict()["task_results"])
+        if self.is_done():
+            self._results_json = data
+        return data
+
+    def to_json(self):
+        """任务视图的JSON, 大字段task_results复用results_json()的结果, 结束后缓存"""
+        if self._json is not None:
+            return self._json
+        head = {k: v for k, v in self.to_dict().items() if k != "task_results"}
+        data = dumps(head)[:-1] + ', "task_results": ' + self.results_json() + "}"
+        if self.is_done():
+            self._json = data
+        return data
+
     def run(self):
         pass
\ No newline at end of file
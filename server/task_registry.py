@@ -0,0 +1,87 @@
+import json
+import time
+import logging
+import requests
+from collections import OrderedDict
+from threading import Thread, Lock
+
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class TaskRegistry(object):
+    """异步任务登记表, 按TTL、任务数和结果内存占用淘汰已结束的任务"""
+
+    def __init__(self, ttl=3600, max_tasks=10000, max_bytes=256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_tasks = max_tasks
+        self.max_bytes = max_bytes
+        self.tasks = OrderedDict()
+        self.task_bytes = {}
+        self.total_bytes = 0
+        self.lock = Lock()
+
+    def register(self, task):
+        with self.lock:
+            self.tasks[task.task_id] = task
+        task.add_done_callback(self._on_task_done)
+
+    def get(self, task_id):
+        with self.lock:
+            self._evict()
+            return self.tasks.get(task_id)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "task_count": len(self.tasks),
+                "finished_count": len(self.task_bytes),
+                "total_bytes": self.total_bytes,
+                "ttl": self.ttl,
+                "max_tasks": self.max_tasks,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _on_task_done(self, task):
+        try:
+            size = len(task.results_json())
+        except Exception:
+            size = 0
+        with self.lock:
+            if task.task_id not in self.tasks:
+                return
+            # 已结束的任务移到末尾, 淘汰时按结束先后顺序
+            self.tasks.move_to_end(task.task_id)
+            self.task_bytes[task.task_id] = size
+            self.total_bytes += size
+            self._evict()
+
+    def _remove(self, task_id):
+        self.tasks.pop(task_id, None)
+        self.total_bytes -= self.task_bytes.pop(task_id, 0)
+
+    def _evict(self):
+        now = time.time()
+        for task_id in list(self.task_bytes):
+            task = self.tasks[task_id]
+            over_ttl = now - task.finish_time > self.ttl
+            over_limit = len(self.tasks) > self.max_tasks or self.total_bytes > self.max_bytes
+            if not over_ttl and not over_limit:
+                break
+            logger.info(f"registry evict task {task_id}, over_ttl={over_ttl}, over_limit={over_limit}")
+            self._remove(task_id)
+
+
+def notify_webhook(callback_url, task, timeout=10):
+    """后台线程把任务结果POST到callback_url"""
+    def _post():
+        data = task.to_json()
+        try:
+            rsp = requests.post(url=callback_url, data=data.encode("utf-8"),
+                                headers={"Content-Type": "application/json"}, timeout=timeout)
+            logger.info(f"webhook {callback_url} task {task} status {rsp.status_code}")
+        except Exception as e:
+            logger.info(f"webhook {callback_url} task {task} failed, exception={e}")
+
+    Thread(target=_post, daemon=True).start()
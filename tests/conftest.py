@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# server下的模块使用扁平导入(from task import Task)
+for path in [ROOT, os.path.join(ROOT, "server")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from flask import Flask  # noqa: E402
+from service import Service  # noqa: E402
+
+
+class EchoHandler(object):
+    """测试用handler: 等待delay秒后返回输入, 记录调用次数"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, instance):
+        self.calls += 1
+        if self.delay:
+            import time
+            time.sleep(self.delay)
+        instance["raw_output"] = "ok"
+        return instance
+
+
+@pytest.fixture
+def make_service():
+    """创建挂在独立Flask应用上的Service并启动消费线程, 返回(service, test_client), 用例结束后停止"""
+    services = []
+
+    def make(handler=None, interface="/echo", **kwargs):
+        app = Flask(f"test_{len(services)}")
+        service = Service(name=f"test{len(services)}", interface=interface,
+                          handler=handler if handler is not None else EchoHandler(), server=app, **kwargs)
+        service.listen()
+        services.append(service)
+        return service, app.test_client()
+
+    yield make
+    for service in services:
+        service.stop()
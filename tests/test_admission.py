@@ -0,0 +1,71 @@
+import json
+import threading
+
+import pytest
+
+from admission import AdmissionController
+from conftest import EchoHandler
+from task import Task
+
+
+def test_admit_rules():
+    admission = AdmissionController(max_queue_depth=10, max_queue_wait_ms=500)
+    # 还没有耗时样本时预估等待为0
+    assert admission.admit(5, 1) == (True, None, 0)
+    assert admission.admit(10, 1)[:2] == (False, "queue_depth")
+
+    admission.record_latency(100)
+    assert admission.estimate_wait_ms(4, 2) == pytest.approx(200)
+    assert admission.admit(4, 2) == (True, None, 0)
+    admitted, reason, retry_after = admission.admit(6, 1)
+    assert (admitted, reason, retry_after) == (False, "queue_wait", 1)
+    assert admission.admit(2, 1, remaining_ms=150)[:2] == (False, "deadline")
+    assert admission.admit(2, 1, remaining_ms=250)[0]
+
+
+def test_latency_ewma_and_retry_after():
+    admission = AdmissionController(alpha=0.5)
+    admission.record_latency(100)
+    admission.record_latency(300)
+    assert admission.latency_ewma == pytest.approx(200)
+    assert AdmissionController.retry_after(0) == 1
+    assert AdmissionController.retry_after(2500) == 3
+
+
+def test_record_shed_keeps_bounded_records():
+    admission = AdmissionController(max_records=2)
+    for reason in ["queue_depth", "queue_wait", "queue_depth"]:
+        admission.record_shed(Task(request_data={}), reason, 3, 1)
+    data = admission.to_dict()
+    assert data["shed_count"] == 3
+    assert data["shed_reasons"] == {"queue_depth": 2, "queue_wait": 1}
+    assert len(data["shed_records"]) == 2
+
+
+def test_service_sheds_over_queue_depth(make_service):
+    handler = EchoHandler(delay=0.3)
+    service, client = make_service(handler=handler, max_queue_depth=1)
+    responses = []
+
+    def call(i):
+        responses.append(client.get("/echo", data=json.dumps({"input_text": str(i)})))
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    rejected = [rsp for rsp in responses if rsp.status_code == 429]
+    assert rejected and len(rejected) < 4
+    assert all(int(rsp.headers["Retry-After"]) >= 1 for rsp in rejected)
+    assert all(json.loads(rsp.data)["task_status"] == "rejected" for rsp in rejected)
+    assert handler.calls == 4 - len(rejected)
+    assert service.admission.shed_count == len(rejected)
+
+
+def test_service_rejects_while_draining(make_service):
+    service, client = make_service()
+    assert service.drain(timeout=1)
+    rsp = client.get("/echo", data=json.dumps({"input_text": "late"}))
+    assert rsp.status_code == 503
+    assert rsp.headers["Retry-After"] == "1"
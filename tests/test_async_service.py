@@ -0,0 +1,110 @@
+import json
+import asyncio
+import itertools
+
+import pytest
+
+from async_service import AsyncService, AsgiApp
+from service_metrics import TASKS_TOTAL, SHED_TOTAL
+from task_registry import TaskRegistry
+
+_names = itertools.count()
+
+
+def make_async_service(handler, **kwargs):
+    return AsyncService(name=f"async_test{next(_names)}", interface="/echo", handler=handler, **kwargs)
+
+
+def task_count(service, status):
+    return TASKS_TOTAL.values.get((service.name, "async", status), 0)
+
+
+async def echo(instance):
+    return {"echo": instance.get("input_text")}
+
+
+def sleeper(delay):
+    async def handler(instance):
+        await asyncio.sleep(delay)
+        return {"echo": instance.get("input_text")}
+    return handler
+
+
+def test_handle_coroutine_and_sync_handler():
+    service = make_async_service(echo)
+    status, headers, body = asyncio.run(service.handle({"input_text": "hi"}))
+    assert status == 200
+    data = json.loads(body)
+    assert data["task_status"] == "finished"
+    assert data["task_results"] == {"echo": "hi"}
+
+    service = make_async_service(lambda instance: instance["input_text"].upper())
+    status, headers, body = asyncio.run(service.handle({"input_text": "hi"}))
+    assert json.loads(body)["task_results"] == "HI"
+    assert task_count(service, "finished") == 1
+
+
+def test_timeout_counts_task_as_failed():
+    service = make_async_service(sleeper(1))
+    status, headers, body = asyncio.run(service.handle({"input_text": "slow"}, timeout="0.1"))
+    assert json.loads(body)["task_status"] == "failed"
+    # wait_for取消_run后任务按failed计数, 不会出现status="running"
+    assert task_count(service, "failed") == 1
+    assert task_count(service, "running") == 0
+    assert service.inflight == 0 and service.pending == 0
+
+
+def test_handler_exception_fails_task():
+    def broken(instance):
+        raise RuntimeError("boom")
+
+    service = make_async_service(broken)
+    status, headers, body = asyncio.run(service.handle({}))
+    assert json.loads(body)["task_status"] == "failed"
+    assert task_count(service, "failed") == 1
+
+
+def test_metrics_labels_separate_modes():
+    service = make_async_service(echo)
+    asyncio.run(service.handle({"input_text": "hi"}))
+    # 与同名的线程模式Service分开计数
+    assert (service.name, "thread", "finished") not in TASKS_TOTAL.values
+    assert task_count(service, "finished") == 1
+
+
+def test_rejects_when_pending_exceeds_limit():
+    service = make_async_service(sleeper(0.2), max_concurrency=1, max_pending=1)
+
+    async def run():
+        requests = []
+        for i in range(4):
+            requests.append(asyncio.ensure_future(service.handle({"input_text": str(i)})))
+            await asyncio.sleep(0.01)
+        return await asyncio.gather(*requests)
+
+    statuses = sorted(status for status, headers, body in asyncio.run(run()))
+    # 第一个在执行, 第二个在信号量上等待, 之后的请求被拒绝
+    assert statuses == [200, 200, 429, 429]
+    assert task_count(service, "rejected") == statuses.count(429)
+    assert SHED_TOTAL.values.get((service.name, "async", "queue_depth"), 0) + \
+        SHED_TOTAL.values.get((service.name, "async", "queue_wait"), 0) == statuses.count(429)
+
+
+def test_async_submit_and_poll():
+    registry = TaskRegistry()
+    service = make_async_service(echo, registry=registry)
+    app = AsgiApp(registry=registry)
+    app.add_service(service)
+
+    async def run():
+        status, headers, body = await app._dispatch("/echo", json.dumps({"input_text": "x", "submit_mode": "async"}).encode())
+        assert status == 202
+        task_id = json.loads(body)["task_id"]
+        await asyncio.sleep(0.05)
+        return await app._dispatch(f"/tasks/{task_id}", b"")
+
+    status, headers, body = asyncio.run(run())
+    assert status == 200
+    assert json.loads(body)["task_results"] == {"echo": "x"}
+    assert asyncio.run(app._dispatch("/tasks/unknown", b""))[0] == 404
+    assert asyncio.run(app._dispatch("/missing", b""))[0] == 404
@@ -0,0 +1,71 @@
+import json
+import time
+import threading
+
+from autoscaler import ConsumerAutoscaler
+from conftest import EchoHandler
+from task import Task
+
+
+def alive_workers(service):
+    return sum(1 for thread in service.consume_process if thread.is_alive())
+
+
+def test_scales_up_to_clear_backlog_and_down_gradually(make_service):
+    release = threading.Event()
+    service, client = make_service(handler=lambda instance: release.wait(5) and instance,
+                                   min_worker=1, max_worker=4)
+    autoscaler = ConsumerAutoscaler([service], target_wait_ms=100, scale_down_delay=2)
+    service.admission.latency_ewma = 50
+    for _ in range(6):
+        assert service._enqueue(Task(request_data={})) is None
+
+    # 积压6个 * 50ms / 100ms -> 3个线程, 扩容一次到位
+    assert autoscaler.desired_workers(service) == 3
+    autoscaler.scale(service)
+    assert service.consume_worker == 3 and alive_workers(service) == 3
+
+    release.set()
+    deadline = time.time() + 5
+    while not service.is_idle() and time.time() < deadline:
+        time.sleep(0.01)
+    assert autoscaler.desired_workers(service) == 1
+    # 连续scale_down_delay个周期偏多才缩容, 每次只减一个
+    autoscaler.scale(service)
+    assert service.consume_worker == 3
+    autoscaler.scale(service)
+    assert service.consume_worker == 2
+    autoscaler.scale(service)
+    autoscaler.scale(service)
+    autoscaler.scale(service)
+    assert service.consume_worker == 1
+    time.sleep(0.1)
+    assert alive_workers(service) == 1
+
+
+def test_without_latency_adds_one_worker_per_round(make_service):
+    service, client = make_service(handler=EchoHandler(delay=0.5), min_worker=1, max_worker=2)
+    autoscaler = ConsumerAutoscaler([service])
+    assert autoscaler.desired_workers(service) == 1
+    for _ in range(3):
+        service._enqueue(Task(request_data={}))
+    assert autoscaler.desired_workers(service) == 2
+    service.admission.latency_ewma = 10 ** 6
+    # 不超过max_worker
+    assert autoscaler.desired_workers(service) == 2
+
+
+def test_background_loop_scales(make_service):
+    service, client = make_service(handler=EchoHandler(delay=0.2), min_worker=1, max_worker=3)
+    autoscaler = ConsumerAutoscaler([service], interval=0.05, target_wait_ms=100)
+    autoscaler.start()
+    try:
+        threads = [threading.Thread(target=client.get, kwargs={"data": json.dumps({"input_text": str(i)})},
+                                    args=("/echo",)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert service.consume_worker > 1
+    finally:
+        autoscaler.stop()
@@ -0,0 +1,94 @@
+import json
+import time
+import threading
+from queue import Queue
+
+import pytest
+
+from batcher import AdaptiveBatcher
+
+
+def filled_queue(n):
+    queue = Queue()
+    for i in range(n):
+        queue.put(i)
+    return queue
+
+
+def test_collect_flushes_on_batch_size():
+    batcher = AdaptiveBatcher(max_batch_size=4, max_wait_ms=1000)
+    time0 = time.time()
+    assert batcher.collect(filled_queue(10), timeout=0.1) == [0, 1, 2, 3]
+    assert time.time() - time0 < 0.5
+
+
+def test_collect_flushes_on_max_wait():
+    batcher = AdaptiveBatcher(max_batch_size=100, max_wait_ms=50)
+    time0 = time.time()
+    assert batcher.collect(filled_queue(3), timeout=0.1) == [0, 1, 2]
+    assert time.time() - time0 < 0.5
+    assert batcher.collect(Queue(), timeout=0.01) == []
+
+
+def test_record_shrinks_when_slow_and_grows_with_backlog():
+    batcher = AdaptiveBatcher(max_batch_size=64, min_batch_size=2, target_latency_ms=100, alpha=1)
+    batcher.record(64, 500, queue_depth=0)
+    assert batcher.batch_size == 48
+    for _ in range(20):
+        batcher.record(batcher.batch_size, 500, queue_depth=0)
+    assert batcher.batch_size == 2
+
+    batcher.record(2, 10, queue_depth=1000)
+    assert batcher.batch_size == 3
+    for _ in range(30):
+        batcher.record(batcher.batch_size, 10, queue_depth=1000)
+    assert batcher.batch_size == 64
+    # 耗时达标但没有积压时保持不变
+    batcher.record(64, 10, queue_depth=0)
+    assert batcher.batch_size == 64
+
+
+def test_latency_ewma():
+    batcher = AdaptiveBatcher(alpha=0.5)
+    batcher.record(1, 100, 0)
+    batcher.record(1, 200, 0)
+    assert batcher.to_dict()["latency_ewma"] == pytest.approx(150)
+
+
+def test_invalid_bounds():
+    with pytest.raises(AssertionError):
+        AdaptiveBatcher(max_batch_size=4, min_batch_size=8)
+
+
+def test_concurrent_record_keeps_bounds():
+    batcher = AdaptiveBatcher(max_batch_size=32, min_batch_size=1, target_latency_ms=100)
+
+    def worker(latency_ms, queue_depth):
+        for _ in range(2000):
+            batcher.record(batcher.batch_size, latency_ms, queue_depth)
+
+    threads = [threading.Thread(target=worker, args=(5, 1000)) for _ in range(4)] + \
+              [threading.Thread(target=worker, args=(1000, 0)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 1 <= batcher.batch_size <= 32
+    assert 5 <= batcher.latency_ewma <= 1000
+
+
+def test_batch_service_with_concurrent_workers(make_service):
+    sizes = []
+
+    def batch_handler(instances):
+        sizes.append(len(instances))
+        time.sleep(0.02)
+        return [{"echo": instance["input_text"]} for instance in instances]
+
+    service, client = make_service(handler=batch_handler, consume_type="batch", consume_worker=4,
+                                   max_batch_size=8, max_wait_ms=20)
+    rsp = client.post("/echo/bulk", json={"instances": [{"input_text": str(i)} for i in range(40)]})
+    results = json.loads(rsp.data)["results"]
+    assert [r["task_results"]["echo"] for r in results] == [str(i) for i in range(40)]
+    assert sum(sizes) == 40 and max(sizes) <= 8
+    assert 1 <= service.batcher.batch_size <= 8
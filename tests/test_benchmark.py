@@ -0,0 +1,73 @@
+import json
+import random
+import threading
+
+import pytest
+from flask import Flask
+from werkzeug.serving import make_server
+
+from benchmark.load_test import LoadTest, percentile, compare, format_report
+from benchmark.fake_llm_server import LatencyModel, FakeLLM, build_app
+from conftest import EchoHandler
+from service import Service
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+    assert percentile([7], 50) == 7
+
+
+def test_compare_flags_regressions():
+    baseline = {"endpoints": {"a": {"p95_ms": 100, "rps": 10}, "b": {"p95_ms": 100, "rps": 10}}}
+    result = {"endpoints": {"a": {"p95_ms": 130, "rps": 7}, "b": {"p95_ms": 110, "rps": 9},
+                            "c": {"p95_ms": 1, "rps": 1}}}
+    assert compare(result, baseline, max_regression=0.2) == ["a p95 100.0 -> 130.0 ms", "a rps 10.00 -> 7.00"]
+
+
+@pytest.mark.parametrize("dist", ["fixed", "uniform", "exponential", "lognormal"])
+def test_latency_model_is_non_negative(dist):
+    random.seed(0)
+    model = LatencyModel(latency_ms=100, dist=dist, jitter_ms=200)
+    assert all(model.sample() >= 0 for _ in range(200))
+    assert LatencyModel(latency_ms=100).sample() == pytest.approx(0.1)
+
+
+def test_fake_llm_responses():
+    fake = FakeLLM(LatencyModel(latency_ms=0), output_items=2, stream_chunks=4)
+    client = build_app(fake).test_client()
+    rsp = client.post("/v1/chat/completions", json={"model": "m"})
+    content = json.loads(rsp.get_json()["choices"][0]["message"]["content"])
+    assert len(content) == 2
+
+    rsp = client.post("/v1/chat/completions", json={"stream": True})
+    events = [line for line in rsp.get_data(as_text=True).split("\n\n") if line]
+    assert events[-1] == "data: [DONE]"
+    text = "".join(json.loads(e[len("data: "):])["choices"][0]["delta"]["content"] for e in events[:-1])
+    assert json.loads(text) == json.loads(fake.content())
+
+    fake.failure_rate = 1
+    assert client.post("/v1/chat/completions", json={}).status_code == 500
+    assert json.loads(client.get("/stats").data) == {"requests": 3, "failures": 1, "hangs": 0, "streams": 1}
+
+
+def test_load_test_against_local_service():
+    app = Flask("bench")
+    service = Service(name="bench", interface="/text_rebuild", handler=EchoHandler(delay=0.01), server=app,
+                      consume_worker=2)
+    service.listen()
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        load_test = LoadTest(f"http://127.0.0.1:{server.server_port}", ["text_rebuild"], concurrency=4,
+                             requests_per_endpoint=20, text_size=100)
+        result = load_test.run()
+    finally:
+        server.shutdown()
+        service.stop()
+    stats = result["endpoints"]["text_rebuild"]
+    assert stats["requests"] == 20 and stats["errors"] == 0
+    assert 0 < stats["p50_ms"] <= stats["p95_ms"] <= stats["max_ms"]
+    assert "text_rebuild" in format_report(result)
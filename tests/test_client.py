@@ -0,0 +1,127 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from client import HashRing, NodePool, RemoteServerClient, file_id_of
+
+
+class Node(object):
+    """本地HTTP节点, /health返回load, 其余路径按status_codes依次返回状态码"""
+
+    def __init__(self, load=0, healthy=True):
+        self.load = load
+        self.healthy = healthy
+        self.status_codes = []
+        self.requests = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    body = {"status": "healthy" if node.healthy else "draining", "load": node.load}
+                    return self._send(200, body)
+                node.requests.append(self.path)
+                status = node.status_codes.pop(0) if node.status_codes else 200
+                self._send(status, {"node": node.url, "path": self.path})
+
+            do_POST = do_GET
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def nodes():
+    created = []
+
+    def make(count, **kwargs):
+        created.extend(Node(**kwargs) for _ in range(count))
+        return created[-count:]
+
+    yield make
+    for node in created:
+        node.close()
+
+
+def test_file_id_of():
+    assert file_id_of("E:\\dwgData\\abc.dwg") == "abc"
+    assert file_id_of("/data/abc.tar.gz") == "abc"
+
+
+def test_hash_ring_is_stable_and_moves_few_keys():
+    urls = [f"http://node{i}" for i in range(4)]
+    ring = HashRing(urls)
+    keys = [f"file{i}" for i in range(2000)]
+    owners = {key: ring.get_nodes(key)[0] for key in keys}
+    assert owners == {key: HashRing(urls).get_nodes(key)[0] for key in keys}
+    assert min(Counter(owners.values()).values()) > 250
+    # 故障转移顺序包含所有节点且不重复
+    assert sorted(ring.get_nodes("file0")) == sorted(urls)
+
+    grown = HashRing(urls + ["http://node4"])
+    moved = [key for key in keys if grown.get_nodes(key)[0] != owners[key]]
+    assert all(grown.get_nodes(key)[0] == "http://node4" for key in moved)
+    assert len(moved) < len(keys) / 3
+
+
+def test_node_pool_orders_by_health_and_load(nodes):
+    busy, idle, down = nodes(3)
+    busy.load, down.healthy = 5, False
+    pool = NodePool([busy.url, idle.url, down.url])
+    pool.refresh(force=True)
+    assert pool.least_loaded() == [idle.url, busy.url, down.url]
+    assert pool.order([down.url, busy.url]) == [busy.url, down.url]
+
+    pool.add_pending(idle.url, 10)
+    assert pool.least_loaded()[0] == busy.url
+    pool.mark_down(busy.url)
+    assert pool.least_loaded() == [idle.url, down.url, busy.url]
+
+
+def test_request_fails_over_on_overload_and_connection_error(nodes):
+    first, second = nodes(2)
+    client = RemoteServerClient(urls=[first.url, second.url])
+    first.status_codes = [503]
+    rsp = client._request("GET", "/x", [first.url, second.url])
+    assert rsp.status_code == 200 and json.loads(rsp.content)["node"] == second.url
+    # 503的节点在下次健康检查前排到最后
+    assert client.pool.order([first.url, second.url]) == [second.url, first.url]
+
+    first.close()
+    rsp = client._request("GET", "/y", [first.url, second.url])
+    assert json.loads(rsp.content)["node"] == second.url
+
+
+def test_request_404_tries_next_node_only_when_asked(nodes):
+    first, second = nodes(2)
+    client = RemoteServerClient(urls=[first.url, second.url])
+    first.status_codes = [404, 404]
+    assert client._request("GET", "/f", [first.url, second.url]).status_code == 404
+    rsp = client._request("GET", "/f", [first.url, second.url], next_on_404=True)
+    assert json.loads(rsp.content)["node"] == second.url
+
+
+def test_request_returns_last_response_when_all_overloaded(nodes):
+    (node,) = nodes(1)
+    client = RemoteServerClient(urls=[node.url])
+    node.status_codes = [429, 429, 429]
+    assert client._request("GET", "/x", [node.url], retry=3).status_code == 429
+    assert node.requests.count("/x") == 3
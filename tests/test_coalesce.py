@@ -0,0 +1,65 @@
+import json
+import time
+import threading
+
+from conftest import EchoHandler
+from service import Service
+from task import Task
+
+
+def concurrent_calls(client, bodies, headers=None):
+    results = [None] * len(bodies)
+
+    def call(index):
+        rsp = client.get("/echo", data=json.dumps(bodies[index]), headers=headers or {})
+        results[index] = json.loads(rsp.data)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(bodies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_coalesce_key_normalizes_payload():
+    key = Service.coalesce_key
+    assert key(Task({"input_text": " hi ", "cde_params": {"a": 1, "b": 2}})) == \
+        key(Task({"input_text": "hi", "cde_params": {"b": 2, "a": 1}}))
+    assert key(Task({"input_text": "hi"})) != key(Task({"input_text": "ho"}))
+
+
+def test_identical_requests_run_once(make_service):
+    handler = EchoHandler(delay=0.3)
+    service, client = make_service(handler=handler, coalesce=True, consume_worker=2)
+    results = concurrent_calls(client, [{"input_text": "same"}] * 4 + [{"input_text": "other"}])
+    assert handler.calls == 2
+    assert all(r["task_status"] == "finished" for r in results)
+    # 每个请求保留自己的task_id
+    assert len({r["task_id"] for r in results}) == 5
+    assert service.coalesce_leaders == {} and service.coalesce_waiters == {}
+
+
+def test_follower_timeout_keeps_leader_running(make_service):
+    handler = EchoHandler(delay=0.5)
+    service, client = make_service(handler=handler, coalesce=True)
+    results = {}
+
+    def leader():
+        results["leader"] = concurrent_calls(client, [{"input_text": "same"}])[0]
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    time.sleep(0.1)
+    results["follower"] = concurrent_calls(client, [{"input_text": "same"}], {"X-Request-Timeout": "0.1"})[0]
+    thread.join()
+    assert results["follower"]["task_status"] == "failed"
+    assert results["leader"]["task_status"] == "finished"
+    assert handler.calls == 1
+
+
+def test_coalesce_disabled_runs_each_request(make_service):
+    handler = EchoHandler(delay=0.1)
+    service, client = make_service(handler=handler, consume_worker=2)
+    concurrent_calls(client, [{"input_text": "same"}] * 3)
+    assert handler.calls == 3
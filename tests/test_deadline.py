@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import EchoHandler
+from task import Task
+from task_registry import TaskRegistry
+from utils.deadline_utils import DeadlineExceeded, current_deadline, deadline_timeout, remaining_timeout, use_deadline
+
+
+def test_remaining_timeout():
+    assert remaining_timeout(default=5) == 5
+    with use_deadline(time.time() + 10):
+        assert 9 < remaining_timeout() <= 10
+    with use_deadline(time.time() - 1):
+        with pytest.raises(DeadlineExceeded):
+            remaining_timeout()
+    assert current_deadline() is None
+
+
+def test_deadline_timeout_converts_only_with_deadline():
+    with pytest.raises(DeadlineExceeded):
+        with deadline_timeout(1.0, TimeoutError):
+            raise TimeoutError()
+    with pytest.raises(TimeoutError):
+        with deadline_timeout(None, TimeoutError):
+            raise TimeoutError()
+    with pytest.raises(ValueError):
+        with deadline_timeout(1.0, TimeoutError):
+            raise ValueError()
+
+
+@pytest.mark.parametrize("value, expected", [(5, 5.0), ("2.5", 2.5), ("abc", None), ([1], None), (-1, None),
+                                             ("nan", None)])
+def test_task_timeout_field(value, expected):
+    task = Task({"input_text": "a", "timeout": value})
+    if expected is None:
+        assert task.deadline is None
+    else:
+        assert task.deadline == pytest.approx(task.create_time + expected)
+
+
+def test_task_set_timeout_keeps_earlier_deadline():
+    task = Task({"timeout": 10})
+    task.set_timeout(1)
+    task.set_timeout(20)
+    assert task.remaining() <= 1
+    with pytest.raises(ValueError):
+        task.set_timeout("abc")
+
+
+class DeadlineHandler(object):
+    """像CustomLLM一样在调用上游前检查剩余时间"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __call__(self, instance):
+        time.sleep(self.delay)
+        remaining_timeout()
+        instance["raw_output"] = "ok"
+        return instance
+
+
+def test_deadline_exceeded_in_handler_fails_task(make_service):
+    # 异步提交没有等待方超时, 任务状态只取决于handler是否抛出DeadlineExceeded
+    service, client = make_service(handler=DeadlineHandler(0.3), registry=TaskRegistry())
+    rsp = client.get("/echo", data=json.dumps({"input_text": "a", "timeout": 0.2, "submit_mode": "async"}))
+    task = service.registry.get(json.loads(rsp.data)["task_id"])
+    assert task.wait(timeout=5)
+    assert task.task_status == "failed"
+
+
+def test_expired_task_dropped_before_handler(make_service):
+    handler = EchoHandler(delay=0.5)
+    service, client = make_service(handler=handler)
+    first = threading.Thread(target=lambda: client.get("/echo", data=json.dumps({"input_text": "a"})))
+    first.start()
+    time.sleep(0.05)
+    rsp = client.get("/echo", data=json.dumps({"input_text": "b", "timeout": 0.1}))
+    first.join()
+    time.sleep(0.1)
+    assert json.loads(rsp.data)["task_status"] == "failed"
+    assert handler.calls == 1
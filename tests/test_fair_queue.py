@@ -0,0 +1,107 @@
+import threading
+from collections import Counter
+from queue import Empty, Full
+
+import pytest
+
+from fair_queue import FairQueue, StrideScheduler
+from task import Task
+
+
+class Item(object):
+    def __init__(self, name, priority=None, tenant=None):
+        self.name = name
+        self.priority = priority
+        self.tenant = tenant
+
+    def __repr__(self):
+        return self.name
+
+
+def drain(queue):
+    items = []
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Empty:
+            return items
+
+
+def test_stride_scheduler_follows_weights():
+    scheduler = StrideScheduler(weight_func=lambda key: {"a": 3, "b": 1}[key])
+    for i in range(40):
+        scheduler.push("a", i)
+        scheduler.push("b", i)
+    first = Counter(scheduler.pop()[0] for _ in range(40))
+    assert first == {"a": 30, "b": 10}
+    assert len(scheduler) == 40
+
+
+def test_idle_flow_does_not_bank_credit():
+    scheduler = StrideScheduler()
+    for i in range(10):
+        scheduler.push("a", i)
+    for _ in range(8):
+        scheduler.pop()
+    # 新flow从当前虚拟时间开始, 不会连续抢占
+    for i in range(4):
+        scheduler.push("b", i)
+    assert [scheduler.pop()[0] for _ in range(4)] in (["a", "b", "a", "b"], ["b", "a", "b", "a"])
+
+
+def test_tenants_share_fairly_within_priority():
+    queue = FairQueue()
+    for i in range(6):
+        queue.put(Item(f"big{i}", tenant="big"))
+    queue.put(Item("small0", tenant="small"))
+    order = [item.name for item in drain(queue)]
+    # 先到的大租户不会饿死后到的小租户
+    assert order.index("small0") <= 1
+    assert [name for name in order if name.startswith("big")] == [f"big{i}" for i in range(6)]
+
+
+def test_priority_weights_and_unknown_priority():
+    queue = FairQueue(priority_weights={"interactive": 4, "normal": 1})
+    for i in range(8):
+        queue.put(Item(f"n{i}", priority="normal"))
+        queue.put(Item(f"i{i}", priority="interactive"))
+    queue.put(Item("x", priority="unknown"))
+    first = Counter(item.priority for item in [queue.get_nowait() for _ in range(10)])
+    assert first == {"interactive": 8, "normal": 2}
+    assert queue.to_dict()["depths"] == {"normal": {"": 7}}
+
+    with pytest.raises(AssertionError):
+        FairQueue(priority_weights={"high": 1})
+
+
+def test_task_priority_and_tenant_from_request():
+    queue = FairQueue()
+    task = Task(request_data={"priority": "bulk", "project_id": "p1"})
+    queue.put(task)
+    assert queue.to_dict()["depths"] == {"bulk": {"p1": 1}}
+    assert queue.get_nowait() is task
+
+
+def test_queue_interface():
+    queue = FairQueue(maxsize=2)
+    assert queue.empty()
+    queue.put_nowait(Item("a"))
+    queue.put(Item("b"))
+    assert queue.full() and queue.qsize() == 2
+    with pytest.raises(Full):
+        queue.put_nowait(Item("c"))
+    with pytest.raises(Full):
+        queue.put(Item("c"), timeout=0.01)
+    assert [item.name for item in drain(queue)] == ["a", "b"]
+    with pytest.raises(Empty):
+        queue.get(timeout=0.01)
+
+
+def test_blocking_get_wakes_on_put():
+    queue = FairQueue()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(queue.get(timeout=5)))
+    thread.start()
+    queue.put(Item("a"))
+    thread.join()
+    assert [item.name for item in result] == ["a"]
@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+from file_handler import file_index
+from file_handler.file_index import FileIndex, parse_time
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """统计目录全量扫描次数"""
+    counter = {"n": 0}
+    scan = file_index._FolderIndex.scan
+
+    def counting_scan(self):
+        counter["n"] += 1
+        scan(self)
+
+    monkeypatch.setattr(file_index._FolderIndex, "scan", counting_scan)
+    return counter
+
+
+def _write(folder, name, data=b"x"):
+    with open(os.path.join(folder, name), "wb") as f:
+        f.write(data)
+
+
+def test_list_sort_filter_and_paging(tmp_path):
+    folder = str(tmp_path)
+    for i, name in enumerate(["b.dwg", "a.dxf", "c.dwg"]):
+        _write(folder, name, b"x" * (i + 1))
+    os.mkdir(os.path.join(folder, "subdir"))
+    _write(folder, ".hidden")
+    index = FileIndex()
+
+    total, files = index.list(folder)
+    assert total == 3
+    assert [f["filename"] for f in files] == ["a.dxf", "b.dwg", "c.dwg"]
+
+    total, files = index.list(folder, sort_by="size", reverse=True)
+    assert [f["filename"] for f in files] == ["c.dwg", "a.dxf", "b.dwg"]
+
+    total, files = index.list(folder, extensions=["DWG"])
+    assert total == 2 and {f["filename"] for f in files} == {"b.dwg", "c.dwg"}
+
+    total, files = index.list(folder, offset=1, limit=1)
+    assert total == 3 and [f["filename"] for f in files] == ["b.dwg"]
+
+    with pytest.raises(AssertionError):
+        index.list(folder, sort_by="owner")
+
+
+def test_time_filter(tmp_path):
+    folder = str(tmp_path)
+    _write(folder, "a.dwg")
+    index = FileIndex()
+    upload_time = index.entries(folder)[0]["upload_time"]
+    assert index.list(folder, start_time=upload_time)[0] == 1
+    assert index.list(folder, end_time=upload_time)[0] == 0
+
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time("") is None
+    assert parse_time("12.5") == 12.5
+    assert parse_time("2024-01-02T03:04:05") == pytest.approx(
+        time.mktime((2024, 1, 2, 3, 4, 5, 0, 0, -1)))
+
+
+def test_add_and_remove_do_not_rescan(tmp_path, scans):
+    folder = str(tmp_path)
+    _write(folder, "first.dwg")
+    index = FileIndex()
+    assert index.list(folder)[0] == 1
+    assert scans["n"] == 1
+
+    for i in range(10):
+        _write(folder, f"{i}.dwg")
+        index.add(folder, f"{i}.dwg")
+    os.remove(os.path.join(folder, "first.dwg"))
+    index.remove(folder, "first.dwg")
+
+    total, files = index.list(folder)
+    assert total == 10
+    assert "first.dwg" not in {f["filename"] for f in files}
+    assert scans["n"] == 1
+
+
+def test_external_change_triggers_rescan_on_read(tmp_path, scans):
+    folder = str(tmp_path)
+    index = FileIndex()
+    assert index.list(folder)[0] == 0
+    # 其他进程写入的文件, 目录mtime变化后读时重新扫描
+    time.sleep(0.01)
+    _write(folder, "other.dwg")
+    os.utime(folder, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert index.list(folder)[0] == 1
+    assert scans["n"] == 2
+
+
+def test_add_before_first_read_scans_once(tmp_path, scans):
+    folder = str(tmp_path)
+    _write(folder, "a.dwg")
+    _write(folder, "b.dwg")
+    index = FileIndex()
+    index.add(folder, "b.dwg")
+    assert index.list(folder)[0] == 2
+    assert scans["n"] == 1
@@ -0,0 +1,60 @@
+import io
+import os
+import threading
+
+import pytest
+import requests
+from flask import Flask, send_file
+from werkzeug.serving import make_server
+
+from file_wrapper import SendfileWrapper, SendfileRequestHandler
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    data = os.urandom(300 * 1024)
+    path = tmp_path / "a.dwg"
+    path.write_bytes(data)
+    app = Flask("files")
+    app.add_url_rule("/download", view_func=lambda: send_file(str(path), as_attachment=True,
+                                                               conditional=True, etag=True))
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=SendfileRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/download", data
+    server.shutdown()
+    server.server_close()
+
+
+def test_full_download_uses_sendfile(file_server, monkeypatch):
+    url, data = file_server
+    calls = []
+    next_ = SendfileWrapper.__next__
+
+    def spy(self):
+        calls.append(self.ranged)
+        return next_(self)
+
+    monkeypatch.setattr(SendfileWrapper, "__next__", spy)
+    rsp = requests.get(url)
+    assert rsp.status_code == 200 and rsp.content == data
+    assert rsp.headers["Accept-Ranges"] == "bytes" and rsp.headers["ETag"]
+    assert calls and not any(calls)
+
+
+def test_range_and_conditional_requests(file_server):
+    url, data = file_server
+    rsp = requests.get(url, headers={"Range": "bytes=100-199"})
+    assert rsp.status_code == 206 and rsp.content == data[100:200]
+    assert rsp.headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+
+    rsp = requests.get(url, headers={"Range": f"bytes={len(data) - 10}-"})
+    assert rsp.content == data[-10:]
+
+    etag = requests.head(url).headers["ETag"]
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert requests.get(url, headers={"Range": f"bytes={len(data)}-"}).status_code == 416
+
+
+def test_wrapper_without_fileno_reads_chunks():
+    wrapper = SendfileWrapper(io.BytesIO(b"abc" * 10), 8, connection=None)
+    assert b"".join(wrapper) == b"abc" * 10
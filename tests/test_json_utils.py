@@ -0,0 +1,54 @@
+import gzip
+import json
+
+import pytest
+
+from utils.json_utils import dumps, accepts_gzip, encode_body, GZIP_MIN_SIZE
+
+
+def test_dumps_keeps_non_ascii_and_falls_back():
+    assert json.loads(dumps({"名称": "图纸"})) == {"名称": "图纸"}
+    assert "图纸" in dumps("图纸")
+    # 超过64位的整数和非字符串键由标准库处理
+    assert json.loads(dumps({"n": 2 ** 70})) == {"n": 2 ** 70}
+    assert json.loads(dumps({1: "a"})) == {"1": "a"}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("deflate, gzip;q=0.5", True),
+    ("br, *", True),
+    ("gzip;q=0", False),
+    ("gzip;q=abc", False),
+    ("identity", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_encode_body_compresses_large_bodies_only():
+    assert encode_body("small", "gzip") == (b"small", None)
+    body = "x" * GZIP_MIN_SIZE
+    assert encode_body(body, None) == (body.encode("utf-8"), None)
+    data, encoding = encode_body(body, "gzip")
+    assert encoding == "gzip" and gzip.decompress(data) == body.encode("utf-8")
+
+
+def test_service_gzip_response(make_service):
+    def handler(instance):
+        instance["raw_output"] = "图" * 2000
+        return instance
+
+    service, client = make_service(handler=handler)
+    body = json.dumps({"input_text": "hi"})
+    rsp = client.get("/echo", data=body, headers={"Accept-Encoding": "gzip"})
+    assert rsp.headers["Content-Encoding"] == "gzip"
+    assert rsp.headers["Vary"] == "Accept-Encoding"
+    data = json.loads(gzip.decompress(rsp.data))
+    assert data["task_results"]["raw_output"] == "图" * 2000
+
+    rsp = client.get("/echo", data=body)
+    assert "Content-Encoding" not in rsp.headers
+    assert json.loads(rsp.data)["task_status"] == "finished"
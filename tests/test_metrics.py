@@ -0,0 +1,51 @@
+import json
+
+from utils.metrics_utils import MetricsRegistry, MetricsHelper, mcli
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs", ("service", "status"))
+    counter.inc({"service": "a", "status": "ok"})
+    counter.inc({"service": "a", "status": "ok"}, 2)
+    gauge = registry.gauge("depth", "Depth", ("service",))
+    registry.register_collector(lambda: gauge.set(7, {"service": 'q"1'}))
+    registry.register_collector(lambda: 1 / 0)
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in [0.05, 0.5, 5]:
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE jobs_total counter" in lines
+    assert 'jobs_total{service="a",status="ok"} 3' in lines
+    # 标签值中的引号被转义, 失败的collector不影响输出
+    assert 'depth{service="q\\"1"} 7' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "latency_seconds_count 3" in lines
+    assert "latency_seconds_sum 5.55" in lines
+
+
+def test_register_returns_existing_metric():
+    registry = MetricsRegistry()
+    assert registry.counter("c", "doc") is registry.counter("c", "doc")
+
+
+def test_metrics_helper_observes_duration():
+    registry = MetricsRegistry()
+    with MetricsHelper("block_seconds", tags={"service": "s"}, registry=registry):
+        pass
+    assert 'block_seconds_count{service="s"} 1' in registry.render().splitlines()
+
+
+def test_service_records_queue_and_latency(make_service):
+    service, client = make_service()
+    client.get("/echo", data=json.dumps({"input_text": "hi"}))
+    text = mcli.render()
+    labels = f'service="{service.name}",mode="thread"'
+    assert f"service_queue_depth{{{labels}}} 0" in text
+    assert f"service_handler_latency_seconds_count{{{labels}}}" in text
+    assert f"service_queue_wait_seconds_count{{{labels}}}" in text
+    assert f'service_tasks_total{{{labels},status="finished"}}' in text
+    assert f"service_request_latency_seconds_count{{{labels}}}" in text
@@ -0,0 +1,43 @@
+import os
+import json
+
+import pytest
+
+from service import Service, process_handler
+from utils.deadline_utils import current_deadline
+
+
+@process_handler
+def pid_handler(instance):
+    instance["raw_output"] = {"pid": os.getpid(), "deadline": current_deadline()}
+    return instance
+
+
+class CountingHandler(object):
+    def __call__(self, instance):
+        return {"square": int(instance["input_text"]) ** 2}
+
+
+def test_process_handler_marks_consume_type(make_service):
+    assert pid_handler.consume_type == "process"
+    service, client = make_service(handler=pid_handler)
+    assert service.consume_type == "process"
+    data = json.loads(client.get("/echo", data=json.dumps({"input_text": "x"}),
+                                 headers={"X-Request-Timeout": "30"}).data)
+    assert data["task_status"] == "finished"
+    # handler在子进程执行, deadline随参数传入
+    assert data["task_results"]["raw_output"]["pid"] != os.getpid()
+    assert data["task_results"]["raw_output"]["deadline"] is not None
+
+
+def test_process_pool_shared_by_workers(make_service):
+    service, client = make_service(handler=CountingHandler(), consume_type="process", consume_worker=2)
+    rsp = client.post("/echo/bulk", data=json.dumps([{"input_text": str(i)} for i in range(6)]))
+    assert [r["task_results"]["square"] for r in json.loads(rsp.data)["results"]] == [i * i for i in range(6)]
+    service.stop()
+    assert service.executor is None
+
+
+def test_unknown_consume_type():
+    with pytest.raises(ValueError, match="gpu"):
+        Service(name="bad", interface="/bad", handler=CountingHandler(), consume_type="gpu")
@@ -0,0 +1,155 @@
+import base64
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+import requests
+from flask import Flask, Response
+from werkzeug.test import Client
+
+import reloader
+from reloader import GracefulReloader, RequestTracker
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _slow_app():
+    app = Flask("slow")
+
+    @app.route("/stream")
+    def stream():
+        def generate():
+            for i in range(4):
+                time.sleep(0.25)
+                yield f"{i}\n"
+        return Response(generate())
+
+    return app
+
+
+def test_request_tracker_counts_until_closed():
+    tracker = RequestTracker(_slow_app())
+    client = Client(tracker)
+    rsp = client.get("/stream", buffered=False)
+    assert tracker.active == 1
+    assert not tracker.wait_idle(0.05)
+    rsp.close()
+    assert tracker.active == 0
+    assert tracker.wait_idle(0.05)
+
+
+def test_drain_waits_for_streaming_response():
+    port = _free_port()
+    graceful = GracefulReloader(_slow_app(), [], drain_timeout=10)
+    served = threading.Thread(target=graceful.serve, args=("127.0.0.1", port))
+    served.start()
+    time.sleep(0.3)
+    body = {}
+    client = threading.Thread(target=lambda: body.update(text=requests.get(f"http://127.0.0.1:{port}/stream").text))
+    client.start()
+    time.sleep(0.2)
+    graceful.shutdown()
+    served.join(timeout=10)
+    client.join(timeout=10)
+    assert body["text"] == "0\n1\n2\n3\n"
+    assert graceful.tracker.active == 0
+
+
+def test_listen_socket_retries_until_port_is_free():
+    port = _free_port()
+    busy = socket.create_server(("127.0.0.1", port))
+    threading.Timer(1.2, busy.close).start()
+    graceful = GracefulReloader(Flask("x"), [])
+    time0 = time.time()
+    sock = graceful.listen_socket("extra", "127.0.0.1", port, bind_timeout=10)
+    assert time.time() - time0 >= 1
+    assert graceful.sockets["extra"] is sock
+    sock.close()
+
+
+def test_shared_sockets_read_once_from_stdin(monkeypatch):
+    payload = {"http": base64.b64encode(b"h").decode(), "async": base64.b64encode(b"a").decode()}
+    stdin = io.TextIOWrapper(io.BytesIO(json.dumps(payload).encode() + b"\n"))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    monkeypatch.setenv(reloader.LISTEN_SHARE_ENV, "1")
+    graceful = GracefulReloader(Flask("x"), [])
+    assert graceful._shared_sockets() == {"http": b"h", "async": b"a"}
+    assert graceful._shared_sockets() is graceful.shared
+    assert reloader.LISTEN_SHARE_ENV not in os.environ
+
+
+def test_notify_ready_over_local_port(monkeypatch):
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        monkeypatch.setenv(reloader.READY_ADDR_ENV, f"127.0.0.1:{server.getsockname()[1]}")
+        GracefulReloader(Flask("x"), [])._notify_ready()
+        conn, _ = server.accept()
+        with conn:
+            assert conn.recv(1) == b"1"
+
+
+APP = """
+import os, sys
+sys.path.insert(0, {server_dir!r})
+from flask import Flask
+from reloader import GracefulReloader
+app = Flask("app")
+holder = {{}}
+
+@app.route("/pid")
+def pid():
+    return str(os.getpid())
+
+@app.route("/reload")
+def reload():
+    return str(holder["reloader"].reload())
+
+holder["reloader"] = GracefulReloader(app, [], drain_timeout=5)
+holder["reloader"].serve("127.0.0.1", {port})
+"""
+
+
+@pytest.mark.skipif(os.name != "posix", reason="需要继承socket描述符")
+def test_reload_hands_over_socket_without_refusing_connections(tmp_path):
+    port = _free_port()
+    script = tmp_path / "app.py"
+    script.write_text(textwrap.dedent(APP.format(server_dir=SERVER_DIR, port=port)))
+    process = subprocess.Popen([sys.executable, str(script)])
+    url = f"http://127.0.0.1:{port}"
+    pids = set()
+    try:
+        for _ in range(100):
+            try:
+                first = requests.get(f"{url}/pid", timeout=1).text
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        assert requests.get(f"{url}/reload", timeout=5).text == "True"
+        deadline = time.time() + 20
+        while time.time() < deadline:
+            # 重启期间每个请求都要成功
+            pids.add(requests.get(f"{url}/pid", timeout=5).text)
+            if len(pids - {first}) > 0 and process.poll() is not None:
+                break
+            time.sleep(0.05)
+        assert pids - {first}
+        assert process.wait(timeout=10) == 0
+    finally:
+        for pid in pids:
+            try:
+                os.kill(int(pid), 15)
+            except OSError:
+                pass
+        process.kill()
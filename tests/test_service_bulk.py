@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import EchoHandler
+
+
+def _bulk(client, body, **kwargs):
+    rsp = client.post("/echo/bulk", data=json.dumps(body), **kwargs)
+    data = rsp.get_data(as_text=True)
+    rsp.close()
+    return rsp.status_code, data
+
+
+@pytest.mark.parametrize("body", [
+    "not json",
+    '"x"',
+    '{"instances": 3}',
+    '[1, 2]',
+    '[{"input_text": "a", "timeout": "abc"}]',
+    '[{"input_text": "a", "timeout": -1}]',
+])
+def test_bulk_rejects_bad_request(make_service, body):
+    service, client = make_service()
+    rsp = client.post("/echo/bulk", data=body)
+    assert rsp.status_code == 400
+    assert json.loads(rsp.data)["task_status"] == "rejected"
+    assert service.active_requests == 0
+    assert service.queue.qsize() == 0
+
+
+def test_bulk_too_large(make_service):
+    service, client = make_service(max_bulk_size=2)
+    status, _ = _bulk(client, [{"input_text": str(i)} for i in range(3)])
+    assert status == 413
+
+
+def test_bulk_results_in_input_order(make_service):
+    service, client = make_service(consume_worker=2)
+    status, data = _bulk(client, {"instances": [{"input_text": str(i)} for i in range(5)]})
+    assert status == 200
+    results = json.loads(data)["results"]
+    assert [r["index"] for r in results] == list(range(5))
+    assert [r["input_text"] for r in results] == [str(i) for i in range(5)]
+    assert all(r["task_status"] == "finished" for r in results)
+    assert service.active_requests == 0
+
+
+def test_bulk_stream_ndjson(make_service):
+    service, client = make_service(consume_worker=2)
+    status, data = _bulk(client, {"instances": [{"input_text": str(i)} for i in range(3)], "stream": True})
+    lines = [json.loads(line) for line in data.splitlines()]
+    assert status == 200
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert service.active_requests == 0
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_bulk_each_instance_has_own_deadline(make_service, stream):
+    service, client = make_service(handler=EchoHandler(delay=0.6), consume_worker=2, task_timeout=5)
+    time0 = time.time()
+    status, data = _bulk(client, {"instances": [{"input_text": "short", "timeout": 0.2}, {"input_text": "long"}],
+                                  "stream": stream})
+    results = data.splitlines() if stream else json.loads(data)["results"]
+    results = {r["index"]: r for r in (json.loads(r) for r in results)} if stream else \
+        {r["index"]: r for r in results}
+    assert results[0]["task_status"] == "failed"
+    # 没有timeout的实例按task_timeout等待, 不会被其他实例的deadline截断
+    assert results[1]["task_status"] == "finished"
+    assert time.time() - time0 < 3
+
+
+def test_bulk_timeout_keeps_coalesced_sync_request(make_service):
+    handler = EchoHandler(delay=1.0)
+    service, client = make_service(handler=handler, coalesce=True, consume_worker=2)
+    result = {}
+
+    def sync_call():
+        rsp = client.get("/echo", data=json.dumps({"input_text": "same"}), headers={"X-Request-Timeout": "10"})
+        result["sync"] = json.loads(rsp.data)
+
+    # bulk实例先提交成为leader, 之后同步请求合并到它上面
+    bulk_result = {}
+    thread = threading.Thread(target=lambda: bulk_result.update(
+        zip(["status", "data"], _bulk(client, [{"input_text": "same", "timeout": 0.3}]))))
+    thread.start()
+    time.sleep(0.1)
+    sync_call()
+    thread.join()
+
+    assert json.loads(bulk_result["data"])["results"][0]["task_status"] == "failed"
+    assert result["sync"]["task_status"] == "finished"
+    assert handler.calls == 1
+    assert service.coalesce_leaders == {} and service.coalesce_waiters == {}
+
+
+def test_bulk_follower_timeout_leaves_coalesce(make_service):
+    handler = EchoHandler(delay=1.0)
+    service, client = make_service(handler=handler, coalesce=True, consume_worker=2)
+    result = {}
+
+    def sync_call():
+        rsp = client.get("/echo", data=json.dumps({"input_text": "same"}), headers={"X-Request-Timeout": "10"})
+        result["sync"] = json.loads(rsp.data)
+
+    # 同步请求是leader, bulk实例合并到它上面后超时
+    thread = threading.Thread(target=sync_call)
+    thread.start()
+    time.sleep(0.1)
+    status, data = _bulk(client, [{"input_text": "same", "timeout": 0.3}])
+    key = next(iter(service.coalesce_waiters))
+    assert service.coalesce_waiters[key] == 1
+    thread.join()
+
+    assert json.loads(data)["results"][0]["task_status"] == "failed"
+    assert result["sync"]["task_status"] == "finished"
+    assert handler.calls == 1
+    assert service.coalesce_waiters == {}
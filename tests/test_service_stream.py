@@ -0,0 +1,74 @@
+import json
+import time
+
+from conftest import EchoHandler
+from task_registry import TaskRegistry
+
+
+def trickle(delay, count):
+    def stream_handler(instance):
+        for i in range(count):
+            time.sleep(delay)
+            yield {"event": "token", "data": str(i)}
+        instance["raw_output"] = "ok"
+        yield {"event": "result", "data": instance}
+    return stream_handler
+
+
+def _events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_events_and_active_requests(make_service):
+    service, client = make_service(stream_handler=trickle(0.05, 3))
+    rsp = client.get("/echo/stream", data=json.dumps({"input_text": "a"}))
+    assert rsp.status_code == 200
+    # 连接关闭前仍计为活跃请求
+    assert service.active_requests == 1
+    events = _events(rsp.get_data(as_text=True))
+    rsp.close()
+    assert service.active_requests == 0
+    assert [e for e, _ in events] == ["token", "token", "token", "done"]
+    assert events[-1][1]["task_status"] == "finished"
+
+
+def test_stream_total_budget_from_request_timeout(make_service):
+    # 每个事件都在单次等待时间内到达, 但总时长超过X-Request-Timeout
+    service, client = make_service(stream_handler=trickle(0.2, 20), task_timeout=30)
+    time0 = time.time()
+    rsp = client.get("/echo/stream", data=json.dumps({"input_text": "a"}), headers={"X-Request-Timeout": "0.7"})
+    events = _events(rsp.get_data(as_text=True))
+    rsp.close()
+    assert time.time() - time0 < 2
+    assert events[-1][0] == "done"
+    assert events[-1][1]["task_status"] == "failed"
+
+
+def test_stream_rejects_malformed_json(make_service):
+    service, client = make_service(stream_handler=trickle(0, 1))
+    for body in ["not json", "[1]"]:
+        rsp = client.get("/echo/stream", data=body)
+        assert rsp.status_code == 400
+    assert service.active_requests == 0
+
+
+def test_stream_async_submit(make_service):
+    service, client = make_service(handler=EchoHandler(), stream_handler=trickle(0, 1), registry=TaskRegistry())
+    rsp = client.get("/echo/stream", data=json.dumps({"input_text": "a", "submit_mode": "async"}))
+    assert rsp.status_code == 202
+    task_id = json.loads(rsp.data)["task_id"]
+    task = service.registry.get(task_id)
+    assert task.wait(timeout=5)
+    assert task.task_status == "finished"
+    assert service.active_requests == 0
+
+
+def test_interface_rejects_malformed_json(make_service):
+    service, client = make_service()
+    rsp = client.get("/echo", data="not json")
+    assert rsp.status_code == 400
+    assert service.active_requests == 0
@@ -0,0 +1,120 @@
+import os
+import time
+
+import pytest
+
+from file_handler import file_index
+from file_handler.file_index import FileIndex
+from file_handler.storage_janitor import StorageJanitor, dir_size
+
+OLD = time.time() - 10000
+
+
+def _write(path, size, age=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if age is not None:
+        os.utime(path, (age, age))
+    return path
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    upload, download = tmp_path / "upload", tmp_path / "download"
+    upload.mkdir()
+    download.mkdir()
+    return str(upload), str(download)
+
+
+def test_ttl_expires_idle_files_only(dirs):
+    upload, download = dirs
+    _write(os.path.join(upload, "old.dwg"), 10, age=OLD)
+    _write(os.path.join(upload, "new.dwg"), 10)
+    janitor = StorageJanitor(FileIndex(), {upload: 3600, download: None})
+    assert janitor.run_once() == (1, 10)
+    assert os.listdir(upload) == ["new.dwg"]
+
+
+def test_quota_evicts_least_recently_used(dirs):
+    upload, download = dirs
+    for i in range(5):
+        _write(os.path.join(upload, f"{i}.dwg"), 100, age=OLD + i)
+    janitor = StorageJanitor(FileIndex(), {upload: None}, quota_bytes=350, low_watermark=0.9)
+    deleted_count, deleted_bytes = janitor.run_once()
+    # 降到 350 * 0.9 以下需要删掉最旧的两个
+    assert (deleted_count, deleted_bytes) == (2, 200)
+    assert sorted(os.listdir(upload)) == ["2.dwg", "3.dwg", "4.dwg"]
+
+
+def test_in_use_paths_and_parents_are_kept(dirs):
+    upload, download = dirs
+    _write(os.path.join(upload, "busy.dwg"), 10, age=OLD)
+    svg = _write(os.path.join(download, "out", "a.svg"), 10)
+    os.utime(os.path.join(download, "out"), (OLD, OLD))
+    janitor = StorageJanitor(FileIndex(), {upload: 60, download: 60},
+                             in_use=lambda: [os.path.join(upload, "busy.dwg"), svg])
+    assert janitor.run_once() == (0, 0)
+    assert janitor.skipped_in_use == 2
+
+
+def test_touch_persists_across_restart(dirs):
+    upload, download = dirs
+    _write(os.path.join(upload, "a.dwg"), 10, age=OLD)
+    svg = _write(os.path.join(download, "out", "a.svg"), 10)
+    os.utime(os.path.join(download, "out"), (OLD, OLD))
+
+    janitor = StorageJanitor(FileIndex(), {upload: 3600, download: 3600})
+    janitor.touch(os.path.join(upload, "a.dwg"))
+    # 输出目录内的文件记到其所在的第一级目录上
+    janitor.touch(svg)
+    assert os.stat(os.path.join(upload, "a.dwg")).st_mtime == pytest.approx(OLD)
+
+    restarted = StorageJanitor(FileIndex(), {upload: 3600, download: 3600})
+    assert restarted.run_once() == (0, 0)
+
+
+def test_touch_outside_managed_folders_is_ignored(dirs, tmp_path):
+    upload, download = dirs
+    janitor = StorageJanitor(FileIndex(), {upload: 60})
+    janitor.touch(str(tmp_path / "elsewhere.txt"))
+    assert janitor.last_access == {}
+
+
+def test_internal_dirs_count_toward_quota(dirs):
+    upload, download = dirs
+    cache = os.path.join(download, ".zipcache")
+    _write(os.path.join(cache, "z.zip"), 500)
+    _write(os.path.join(upload, "a.dwg"), 100, age=OLD)
+    janitor = StorageJanitor(FileIndex(), {upload: None, download: None}, quota_bytes=550,
+                             internal_dirs=[cache])
+    stats = janitor.stats()
+    assert stats["internal"] == {cache: 500}
+    assert stats["total_bytes"] == 600
+    assert janitor.run_once() == (1, 100)
+    # 内部目录不由janitor删除
+    assert os.path.exists(os.path.join(cache, "z.zip"))
+
+
+def test_cleanup_pass_scans_each_folder_once(dirs, monkeypatch):
+    upload, download = dirs
+    for i in range(50):
+        _write(os.path.join(upload, f"{i}.dwg"), 10, age=OLD)
+    scans = {"n": 0}
+    scan = file_index._FolderIndex.scan
+
+    def counting_scan(self):
+        scans["n"] += 1
+        scan(self)
+
+    monkeypatch.setattr(file_index._FolderIndex, "scan", counting_scan)
+    janitor = StorageJanitor(FileIndex(), {upload: 60})
+    assert janitor.run_once() == (50, 500)
+    assert scans["n"] == 1
+
+
+def test_dir_size(tmp_path):
+    _write(str(tmp_path / "a" / "b" / "c.bin"), 7)
+    _write(str(tmp_path / "d.bin"), 3)
+    assert dir_size(str(tmp_path)) == 10
+    assert dir_size(str(tmp_path / "missing")) == 0
@@ -0,0 +1,106 @@
+import json
+import time
+import threading
+
+from conftest import EchoHandler
+from task import Task
+
+
+def test_wait_returns_when_task_finishes():
+    task = Task(request_data={})
+    assert not task.wait(timeout=0.01)
+    threading.Timer(0.05, task.set_finish).start()
+    time0 = time.time()
+    assert task.wait(timeout=5)
+    assert time.time() - time0 < 1
+    assert task.is_done() and task.finish_time is not None
+
+
+def test_done_callbacks_run_once():
+    task = Task(request_data={})
+    calls = []
+    task.add_done_callback(lambda t: calls.append(("first", t.task_status)))
+    task.add_done_callback(lambda t: 1 / 0)
+    task.set_failed()
+    # 已结束的任务不会再次触发回调, 新注册的回调立即执行
+    task.set_finish()
+    task.add_done_callback(lambda t: calls.append(("late", t.task_status)))
+    assert calls == [("first", "failed"), ("late", "finished")]
+
+
+def test_follow_shares_leader_result():
+    leader, follower = Task(request_data={}), Task(request_data={})
+    follower.follow(leader)
+    leader.set_result({"answer": 42})
+    leader.set_finish()
+    assert follower.task_status == "finished"
+    assert follower.task_results == {"answer": 42}
+
+    leader, follower = Task(request_data={}), Task(request_data={})
+    follower.follow(leader)
+    follower.set_failed()
+    leader.set_finish()
+    # 已超时离开的跟随者保持failed
+    assert follower.task_status == "failed"
+
+
+def test_interface_returns_as_soon_as_handler_finishes(make_service):
+    service, client = make_service(handler=EchoHandler(delay=0.05))
+    time0 = time.time()
+    rsp = client.get("/echo", data=json.dumps({"input_text": "hi"}))
+    data = json.loads(rsp.data)
+    assert data["task_status"] == "finished"
+    assert data["task_results"]["raw_output"] == "ok"
+    assert time.time() - time0 < 0.5
+
+
+def test_interface_timeout_fails_task(make_service):
+    service, client = make_service(handler=EchoHandler(delay=1), task_timeout=0.1)
+    data = json.loads(client.get("/echo", data=json.dumps({"input_text": "slow"})).data)
+    assert data["task_status"] == "failed"
+
+
+def test_task_is_slotted_and_reads_request_fields():
+    request_data = {"input_text": "hi", "cde_params": {"a": 1}}
+    task = Task(request_data=request_data)
+    assert not hasattr(task, "__dict__")
+    assert task.input_text == "hi" and task.text == "" and task.dwg_params == {}
+    # 请求字段直接读取request_data, 不复制
+    assert task.cde_params is request_data["cde_params"]
+    payload = task.payload()
+    payload["input_text"] = "changed"
+    assert task.input_text == "hi"
+
+
+def test_views_cached_after_done_and_reset_by_result():
+    task = Task(request_data={"input_text": "hi"})
+    task.set_result({"a": 1})
+    assert task.to_dict() is not task.to_dict()
+    task.set_finish()
+    assert task.to_dict() is task.to_dict()
+    body = task.to_json()
+    assert task.to_json() is body
+    assert json.loads(body)["task_results"] == {"a": 1}
+    task.set_result({"a": 2})
+    assert json.loads(task.to_json())["task_results"] == {"a": 2}
+
+
+def test_compact_response_mode():
+    task = Task(request_data={"input_text": "long input", "response_mode": "compact"})
+    task.set_result({"input_text": "long input", "answer": 42})
+    task.set_finish()
+    data = json.loads(task.to_json())
+    assert set(data) == {"task_id", "task_type", "model_name", "task_status", "task_results"}
+    assert data["task_results"] == {"answer": 42}
+
+
+def test_follower_reuses_leader_results_json():
+    leader = Task(request_data={"input_text": "x"})
+    follower = Task(request_data={"input_text": "x"})
+    compact = Task(request_data={"input_text": "x", "response_mode": "compact"})
+    follower.follow(leader)
+    compact.follow(leader)
+    leader.set_result({"input_text": "x", "answer": 1})
+    leader.set_finish()
+    assert follower.results_json() is leader.results_json()
+    assert json.loads(compact.results_json()) == {"answer": 1}
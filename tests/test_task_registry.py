@@ -0,0 +1,91 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from task import Task
+from task_registry import TaskRegistry
+
+
+def test_register_and_get():
+    registry = TaskRegistry()
+    task = Task(request_data={})
+    registry.register(task)
+    assert registry.get(task.task_id) is task
+    assert registry.to_dict()["finished_count"] == 0
+    task.set_finish()
+    assert registry.to_dict()["finished_count"] == 1
+    assert registry.get("unknown") is None
+
+
+def test_evicts_finished_tasks_by_count_and_bytes():
+    registry = TaskRegistry(max_tasks=2)
+    running = Task(request_data={})
+    registry.register(running)
+    tasks = []
+    for i in range(3):
+        task = Task(request_data={})
+        registry.register(task)
+        task.set_finish()
+        tasks.append(task)
+    # 只淘汰已结束的任务, 按结束先后顺序
+    assert registry.get(running.task_id) is running
+    assert [registry.get(t.task_id) for t in tasks] == [None, None, tasks[2]]
+
+    registry = TaskRegistry(max_bytes=100)
+    big = Task(request_data={})
+    registry.register(big)
+    big.set_result("x" * 200)
+    big.set_finish()
+    assert registry.get(big.task_id) is None
+    assert registry.to_dict()["total_bytes"] == 0
+
+
+def test_evicts_by_ttl():
+    registry = TaskRegistry(ttl=0.05)
+    task = Task(request_data={})
+    registry.register(task)
+    task.set_finish()
+    assert registry.get(task.task_id) is task
+    time.sleep(0.1)
+    assert registry.get(task.task_id) is None
+
+
+def test_async_submit_and_webhook(make_service):
+    received = []
+    done = threading.Event()
+
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200)
+            self.end_headers()
+            done.set()
+
+        def log_message(self, *args):
+            pass
+
+    hook = HTTPServer(("127.0.0.1", 0), Hook)
+    threading.Thread(target=hook.serve_forever, daemon=True).start()
+    try:
+        registry = TaskRegistry()
+        service, client = make_service(registry=registry)
+        callback_url = f"http://127.0.0.1:{hook.server_port}/hook"
+        rsp = client.get("/echo", data=json.dumps({"input_text": "hi", "submit_mode": "async",
+                                                   "callback_url": callback_url}))
+        assert rsp.status_code == 202
+        task_id = json.loads(rsp.data)["task_id"]
+        assert done.wait(5)
+        assert received[0]["task_id"] == task_id
+        assert received[0]["task_status"] == "finished"
+        assert registry.get(task_id).task_status == "finished"
+    finally:
+        hook.shutdown()
+        hook.server_close()
+
+
+def test_async_submit_without_registry(make_service):
+    service, client = make_service()
+    rsp = client.get("/echo", data=json.dumps({"input_text": "hi", "submit_mode": "async"}))
+    assert rsp.status_code == 400
+    assert json.loads(rsp.data)["task_status"] == "failed"
@@ -0,0 +1,47 @@
+import json
+
+from utils.trace_utils import Trace, TraceExporter, use_trace, current_trace, trace_span
+
+
+def test_trace_span_records_only_with_active_trace():
+    with trace_span("ignored"):
+        pass
+    trace = Trace("t1")
+    with use_trace(trace):
+        assert current_trace() is trace
+        with trace_span("llm", model="m"):
+            pass
+    assert current_trace() is None
+    spans = trace.to_list()
+    assert [span["name"] for span in spans] == ["llm"]
+    assert spans[0]["model"] == "m" and spans[0]["duration_ms"] >= 0
+
+
+def test_exporter_writes_json_lines(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    trace = Trace("t1")
+    trace.add_span("handler", 1.0, 1.5)
+    TraceExporter(str(path)).export(trace, service="s")
+    TraceExporter(None).export(trace)
+    record = json.loads(path.read_text(encoding="utf-8"))
+    assert record == {"trace_id": "t1", "spans": [{"name": "handler", "start": 1.0, "duration_ms": 500.0}],
+                      "service": "s"}
+
+
+def test_service_returns_and_exports_trace(make_service, tmp_path):
+    def handler(instance):
+        with trace_span("inner"):
+            pass
+        return instance
+
+    path = tmp_path / "trace.jsonl"
+    service, client = make_service(handler=handler, trace_exporter=TraceExporter(str(path)))
+    data = json.loads(client.get("/echo", data=json.dumps({"input_text": "hi", "trace": True})).data)
+    names = [span["name"] for span in data["trace"]]
+    assert names[:3] == ["queue_wait", "inner", "handler"]
+    assert "serialize" in names
+    record = json.loads(path.read_text(encoding="utf-8").splitlines()[-1])
+    assert record["trace_id"] == data["task_id"] and record["service"] == service.name
+
+    data = json.loads(client.get("/echo", data=json.dumps({"input_text": "hi"})).data)
+    assert "trace" not in data
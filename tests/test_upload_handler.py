@@ -0,0 +1,128 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from file_handler.upload_handler import ChunkedUploadManager, ContentStore, UploadError, content_file_id
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return ChunkedUploadManager(str(tmp_path), max_size=1000)
+
+
+def _error(excinfo):
+    return excinfo.value.error_code, excinfo.value.status
+
+
+def test_chunked_upload_resume_and_complete(manager, tmp_path):
+    data = b"0123456789" * 10
+    status = manager.init("a.dwg", total_size=len(data))
+    upload_id = status["upload_id"]
+    assert status["offset"] == 0
+
+    manager.append(upload_id, 0, io.BytesIO(data[:40]))
+    # 客户端用过期的offset重发时返回409和当前offset
+    with pytest.raises(UploadError) as excinfo:
+        manager.append(upload_id, 10, io.BytesIO(data[10:40]))
+    assert _error(excinfo) == ("OFFSET_MISMATCH", 409)
+    assert excinfo.value.data["offset"] == 40
+
+    with pytest.raises(UploadError) as excinfo:
+        manager.complete(upload_id)
+    assert _error(excinfo) == ("UPLOAD_INCOMPLETE", 409)
+
+    assert manager.append(upload_id, 40, io.BytesIO(data[40:]))["offset"] == len(data)
+    sha256 = hashlib.sha256(data).hexdigest()
+    save_filename, meta = manager.complete(upload_id, checksum=f"sha256:{sha256}")
+    assert save_filename == f"{content_file_id(sha256)}.dwg"
+    assert meta["deduplicated"] is False
+    with open(tmp_path / save_filename, "rb") as f:
+        assert f.read() == data
+    assert os.listdir(manager.session_dir) == []
+
+
+def test_chunk_beyond_total_size_is_truncated_back(manager):
+    upload_id = manager.init("a.dwg", total_size=10)["upload_id"]
+    with pytest.raises(UploadError):
+        manager.append(upload_id, 0, io.BytesIO(b"x" * 11))
+    assert manager.status(upload_id)["offset"] == 0
+
+
+def test_checksum_mismatch(manager):
+    upload_id = manager.init("a.dwg")["upload_id"]
+    manager.append(upload_id, 0, io.BytesIO(b"abc"))
+    with pytest.raises(UploadError) as excinfo:
+        manager.complete(upload_id, checksum="0" * 64)
+    assert _error(excinfo) == ("CHECKSUM_MISMATCH", 422)
+
+
+@pytest.mark.parametrize("total_size", ["100", -1, 1.5, True, [1]])
+def test_init_rejects_invalid_total_size(manager, total_size):
+    with pytest.raises(UploadError) as excinfo:
+        manager.init("a.dwg", total_size=total_size)
+    assert _error(excinfo) == ("INVALID_TOTAL_SIZE", 400)
+    assert os.listdir(manager.session_dir) == []
+
+
+def test_init_rejects_too_large(manager):
+    with pytest.raises(UploadError) as excinfo:
+        manager.init("a.dwg", total_size=1001)
+    assert _error(excinfo) == ("FILE_TOO_LARGE", 413)
+
+
+def test_unknown_and_aborted_sessions(manager):
+    with pytest.raises(UploadError) as excinfo:
+        manager.status("../etc")
+    assert _error(excinfo) == ("UPLOAD_NOT_FOUND", 404)
+    upload_id = manager.init("a.dwg")["upload_id"]
+    manager.abort(upload_id)
+    with pytest.raises(UploadError):
+        manager.status(upload_id)
+
+
+def test_expired_sessions_cleaned(manager):
+    upload_id = manager.init("a.dwg")["upload_id"]
+    old = os.path.getmtime(manager._part_path(upload_id)) - manager.session_ttl - 1
+    os.utime(manager._part_path(upload_id), (old, old))
+    manager.cleanup()
+    assert os.listdir(manager.session_dir) == []
+
+
+def test_content_store_deduplicates(tmp_path):
+    store = ContentStore(str(tmp_path))
+    first = store.save(io.BytesIO(b"same"), "dwg")
+    second = store.save(io.BytesIO(b"same"), "dwg")
+    assert first[2] is False and second[2] is True
+    assert first[0] == second[0]
+    assert store.lookup(first[1], "dwg") == first[0]
+    assert [name for name in os.listdir(tmp_path) if not name.startswith(".")] == [first[0]]
+
+    os.remove(tmp_path / first[0])
+    assert store.lookup(first[1], "dwg") is None
+
+
+def test_content_store_rejects_bad_hash(tmp_path):
+    with pytest.raises(UploadError) as excinfo:
+        ContentStore(str(tmp_path)).lookup("../../x")
+    assert _error(excinfo) == ("INVALID_HASH", 400)
+
+
+def test_content_store_keys_on_extension(tmp_path):
+    store = ContentStore(str(tmp_path))
+    dwg = store.save(io.BytesIO(b"same"), "dwg")
+    dxf = store.save(io.BytesIO(b"same"), "dxf")
+    # 同样的字节以其他扩展名上传时返回该扩展名的文件, 处理程序按扩展名识别格式
+    assert dxf[0].endswith(".dxf") and dxf[2] is False
+    assert store.lookup(dwg[1], "dwg") == dwg[0]
+    assert store.lookup(dwg[1], "dxf") == dxf[0]
+    assert store.lookup(dwg[1], "pdf") is None
+    assert store.save(io.BytesIO(b"same"), "dxf") == dxf[:2] + (True,)
+
+
+def test_content_store_rejects_bad_extension(tmp_path):
+    with pytest.raises(UploadError) as excinfo:
+        ContentStore(str(tmp_path)).save(io.BytesIO(b"x"), "../x")
+    assert _error(excinfo) == ("INVALID_FILE_TYPE", 400)
+    assert [name for name in os.listdir(tmp_path) if not name.startswith(".")] == []
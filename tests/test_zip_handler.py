@@ -0,0 +1,84 @@
+import gzip
+import io
+import os
+import zipfile
+
+import pytest
+
+from file_handler.zip_handler import iter_files, dir_signature, write_zip, iter_zip, iter_gzip, ZipCache
+
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / "svg"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.svg").write_text("<svg>a</svg>" * 100)
+    (root / "sub" / "b.svg").write_text("<svg>b</svg>")
+    (root / ".hidden").write_text("x")
+    return str(root)
+
+
+def names(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        assert zipf.testzip() is None
+        return sorted(zipf.namelist())
+
+
+def test_iter_files_skips_hidden(folder):
+    assert sorted(arcname for arcname, _, _ in iter_files(folder)) == ["a.svg", "sub/b.svg"]
+
+
+def test_dir_signature_changes_with_content(folder):
+    signature = dir_signature(folder)
+    assert dir_signature(folder) == signature
+    with open(os.path.join(folder, "sub", "b.svg"), "a") as f:
+        f.write("more")
+    assert dir_signature(folder) != signature
+
+
+@pytest.mark.parametrize("level", [0, 6])
+def test_write_and_stream_zip(folder, level):
+    buffer = io.BytesIO()
+    write_zip(folder, buffer, level)
+    assert names(buffer.getvalue()) == ["a.svg", "sub/b.svg"]
+    chunks = list(iter_zip(folder, level))
+    assert len(chunks) >= 2
+    assert names(b"".join(chunks)) == ["a.svg", "sub/b.svg"]
+
+
+def test_iter_gzip_roundtrip(folder):
+    data = b"".join(iter_gzip(iter_zip(folder, 0)))
+    assert names(gzip.decompress(data)) == ["a.svg", "sub/b.svg"]
+
+
+def test_cache_reuses_until_folder_changes(folder, tmp_path):
+    cache = ZipCache(str(tmp_path / "cache"))
+    path = cache.get(folder)
+    mtime = os.path.getmtime(path)
+    assert cache.get(folder) == path
+    # 命中不改mtime, ETag和Last-Modified保持不变
+    assert os.path.getmtime(path) == mtime
+
+    gz_path = cache.get(folder, gzip_level=6)
+    assert gz_path != path
+    with open(gz_path, "rb") as f:
+        assert names(gzip.decompress(f.read())) == ["a.svg", "sub/b.svg"]
+
+    with open(os.path.join(folder, "c.svg"), "w") as f:
+        f.write("<svg>c</svg>")
+    new_path = cache.get(folder)
+    assert new_path != path
+    with open(new_path, "rb") as f:
+        assert "c.svg" in names(f.read())
+
+
+def test_cache_evicts_least_recently_used(folder, tmp_path):
+    cache = ZipCache(str(tmp_path / "cache"))
+    first = cache.get(folder, level=0)
+    os.utime(first, (1, os.path.getmtime(first)))
+    second = cache.get(folder, level=1)
+    cache.max_bytes = os.path.getsize(second)
+    third = cache.get(folder, level=9)
+    remaining = sorted(os.listdir(cache.cache_dir))
+    assert os.path.basename(first) not in remaining
+    assert os.path.basename(third) in remaining
@@ -0,0 +1,46 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+# 当前线程/协程正在处理的请求的截止时间(time.time()时间戳), handler内部(如CustomLLM)据此设置上游超时
+_current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间, 不再发起后续调用"""
+
+
+@contextmanager
+def use_deadline(deadline):
+    """在当前上下文中激活deadline, None表示不限时"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+def remaining_timeout(default=None):
+    """当前deadline剩余的秒数, 没有deadline时返回default, 已过期抛出DeadlineExceeded"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"deadline exceeded by {-remaining:.3f}s")
+    return remaining
+
+
+@contextmanager
+def deadline_timeout(timeout, exceptions):
+    """timeout取自remaining_timeout()时, 把上游调用的超时异常转换为DeadlineExceeded; timeout为None时原样抛出"""
+    try:
+        yield
+    except exceptions as e:
+        if timeout is None:
+            raise
+        raise DeadlineExceeded(f"deadline exceeded while waiting {timeout:.3f}s, exception={e}") from e
@@ -0,0 +1,47 @@
+import json
+import gzip
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 小于该大小的响应不压缩, 压缩收益抵不上CPU开销
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+
+
+def dumps(obj):
+    """序列化为JSON字符串(不转义非ASCII字符), 安装了orjson时优先使用"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            # orjson不支持的类型(如超过64位的整数、非字符串键)回退到标准库
+            pass
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def accepts_gzip(accept_encoding):
+    """解析Accept-Encoding, 客户端接受gzip(且q不为0)时返回True"""
+    for item in (accept_encoding or "").split(","):
+        parts = [p.strip() for p in item.split(";")]
+        if parts[0].lower() not in ["gzip", "*"]:
+            continue
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    if float(param[2:]) == 0:
+                        return False
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def encode_body(body, accept_encoding, min_size=GZIP_MIN_SIZE, level=GZIP_LEVEL):
+    """按Accept-Encoding编码响应体, 返回(bytes, content_encoding), 未压缩时content_encoding为None"""
+    data = body.encode("utf-8") if isinstance(body, str) else body
+    if len(data) < min_size or not accepts_gzip(accept_encoding):
+        return data, None
+    return gzip.compress(data, compresslevel=level), "gzip"
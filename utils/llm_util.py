@@ -7,8 +7,16 @@ from hashlib import md5
 from string import digits,ascii_letters
 from typing import List, Optional, Any
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import BaseMessage, AIMessage, ToolCall
-from langchain_core.outputs import ChatResult, ChatGeneration
+from langchain_core.messages import BaseMessage, AIMessage, AIMessageChunk, ToolCall
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
+from pydantic import PrivateAttr
+from utils.trace_utils import trace_span
+from utils.deadline_utils import remaining_timeout, deadline_timeout
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 import logging
 
@@ -119,6 +127,54 @@ class AIMessageParser:
 
 
 
+class StreamingJsonListParser:
+    """增量解析流式输出中的JSON列表, 每当列表中一个顶层对象完整时返回该对象"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_list = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """追加一段文本, 返回本次新完成的对象列表"""
+        self.buffer += text
+        items = []
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif not self.in_list:
+                if ch == "[":
+                    self.in_list = True
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        items.append(json.loads(self.buffer[self.item_start:self.pos + 1]))
+                    except ValueError:
+                        pass
+                    self.item_start = None
+            elif ch == "]" and self.depth == 0:
+                self.in_list = False
+            self.pos += 1
+        return items
+
+
 def generate_md5(src):
     m = md5(src.encode(encoding='utf-8'))
     return m.hexdigest()
@@ -178,6 +234,22 @@ class CustomLLM(BaseChatModel):
     tools: Optional[List[Any]] = None
     temperature: float
     max_tokens: int
+    # 同步模式复用的requests连接池
+    _session: Any = PrivateAttr(default=None)
+    # 异步模式下复用的httpx连接池, 绑定在首次使用的事件循环上
+    _async_client: Any = PrivateAttr(default=None)
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def warmup(self, timeout=10):
+        """预先建立到api_url的连接(TLS握手), 服务开始接收请求前调用"""
+        try:
+            self._get_session().head(self.api_url, timeout=timeout)
+        except Exception as e:
+            logger.info(f"warmup {self.api_url} failed, exception={e}")
 
     def bind_tools(self, tools: List[Any], **kwargs):
         return self.model_copy(update={"tools": tools})
@@ -209,13 +281,7 @@ class CustomLLM(BaseChatModel):
             })
         return openai_tools
 
-    def _generate(
-            self,
-            messages: List[BaseMessage],
-            stop=None,
-            run_manager=None,
-            **kwargs
-    ) -> ChatResult:
+    def _build_request(self, messages: List[BaseMessage], **kwargs):
         formatted_messages = []
         for m in messages:
             if m.type == "system":
@@ -242,11 +308,10 @@ class CustomLLM(BaseChatModel):
         tools_payload = self._convert_tools_to_openai_format()
         if tools_payload:
             payload["tools"] = tools_payload
+        return headers, payload
 
-        resp = requests.post(self.api_url, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-
+    @staticmethod
+    def _parse_response(data) -> ChatResult:
         message_data = data["choices"][0]["message"]
         output_text = message_data.get("content", "")
 
@@ -272,6 +337,78 @@ class CustomLLM(BaseChatModel):
             )
         return ChatResult(generations=[generation])
 
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop=None,
+            run_manager=None,
+            **kwargs
+    ) -> ChatResult:
+        headers, payload = self._build_request(messages, **kwargs)
+        # 请求剩余的时间预算作为上游超时, 客户端已放弃的请求不再等待模型返回
+        timeout = remaining_timeout()
+        with trace_span("llm_http", model=self.model_name), deadline_timeout(timeout, requests.exceptions.Timeout):
+            resp = self._get_session().post(self.api_url, headers=headers, json=payload, timeout=timeout)
+        resp.raise_for_status()
+        return self._parse_response(resp.json())
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop=None,
+            run_manager=None,
+            **kwargs
+    ) -> ChatResult:
+        """异步调用, 安装了httpx时在事件循环上直接发请求, 否则退回线程池执行_generate"""
+        if httpx is None:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None))
+
+        headers, payload = self._build_request(messages, **kwargs)
+        timeout = remaining_timeout()
+        with trace_span("llm_http", model=self.model_name), deadline_timeout(timeout, httpx.TimeoutException):
+            resp = await self._async_client.post(self.api_url, headers=headers, json=payload, timeout=timeout)
+        resp.raise_for_status()
+        return self._parse_response(resp.json())
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop=None,
+            run_manager=None,
+            **kwargs
+    ):
+        """OpenAI兼容的SSE流式输出, 逐段产出增量文本"""
+        headers, payload = self._build_request(messages, **kwargs)
+        payload["stream"] = True
+        timeout = remaining_timeout()
+        with trace_span("llm_http", model=self.model_name, stream=True):
+            with deadline_timeout(timeout, requests.exceptions.Timeout):
+                resp = self._get_session().post(self.api_url, headers=headers, json=payload, stream=True,
+                                                timeout=timeout)
+            resp.raise_for_status()
+            try:
+                for line in resp.iter_lines(decode_unicode=False):
+                    if not line or not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    choices = json.loads(data.decode("utf-8")).get("choices") or []
+                    if not choices:
+                        continue
+                    delta = (choices[0].get("delta") or {}).get("content") or ""
+                    if not delta:
+                        continue
+                    chunk = ChatGenerationChunk(message=AIMessageChunk(content=delta))
+                    if run_manager is not None:
+                        run_manager.on_llm_new_token(delta, chunk=chunk)
+                    yield chunk
+            finally:
+                resp.close()
+
     @property
     def _llm_type(self) -> str:
         return "glodon-chat-model"
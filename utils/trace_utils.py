@@ -0,0 +1,88 @@
+import json
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from threading import Lock
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# 当前线程/协程正在处理的trace, handler内部(如CustomLLM)通过trace_span记录到这里
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace(object):
+    """一次请求的阶段耗时记录"""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.lock = Lock()
+
+    def add_span(self, name, start, end, **attrs):
+        span = {"name": name, "start": start, "duration_ms": (end - start) * 1000}
+        if attrs:
+            span.update(attrs)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.time(), **attrs)
+
+    def to_list(self):
+        with self.lock:
+            return list(self.spans)
+
+
+@contextmanager
+def use_trace(trace):
+    """在当前上下文中激活trace"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_span(name, **attrs):
+    """记录到当前trace, 没有激活的trace时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **attrs):
+        yield
+
+
+class TraceExporter(object):
+    """把trace按JSON lines追加写到文件, path为None时不导出"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = Lock()
+
+    def export(self, trace, **attrs):
+        if self.path is None:
+            return
+        record = {"trace_id": trace.trace_id, "spans": trace.to_list()}
+        record.update(attrs)
+        line = json.dumps(record, ensure_ascii=False)
+        try:
+            with self.lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            logger.info(f"trace export to {self.path} failed, exception={e}")